@@ -0,0 +1,138 @@
+import bisect
+from pathlib import Path
+from typing import Iterable, Mapping, Sequence
+
+import numpy as np
+
+from synspec import units
+
+# Thomson cross-section in cm^2.
+SIGMA_THOMSON = 6.6524587e-25
+SCALES = ("tau", "mass")
+
+GridPoint = tuple[float, float]  # (Teff, log g)
+
+
+def depthscale(atmosphere: units.Atmosphere, scale: str = "tau") -> np.ndarray:
+    """Returns the log10 of the depth scale of the atmosphere.
+
+    scale: "mass" for the mass column, or "tau" for the electron scattering
+           optical depth, integrated from the electron and mass densities.
+    """
+    if scale == "mass":
+        return np.log10(atmosphere.dm)
+    if scale == "tau":
+        kappa = SIGMA_THOMSON * atmosphere.electron_density / atmosphere.density
+        dtau = np.empty_like(kappa)
+        dtau[0] = kappa[0] * atmosphere.dm[0]
+        dtau[1:] = 0.5 * (kappa[1:] + kappa[:-1]) * np.diff(atmosphere.dm)
+        return np.log10(np.cumsum(dtau))
+    raise ValueError(f"Unknown depth scale: {scale}, expected one of {SCALES}")
+
+
+def weights(
+    points: Iterable[GridPoint], teff: float, grav: float
+) -> dict[GridPoint, float]:
+    """Returns the weights of the grid points for bilinear interpolation in
+    Teff and log g. The grid points surrounding (teff, grav) must exist.
+    """
+    points = set(points)
+    (t0, t1), ft = _bracket(sorted({t for t, _ in points}), teff, "Teff")
+    (g0, g1), fg = _bracket(sorted({g for _, g in points}), grav, "log g")
+    result: dict[GridPoint, float] = {}
+    for t, wt in ((t0, 1 - ft), (t1, ft)):
+        for g, wg in ((g0, 1 - fg), (g1, fg)):
+            if wt * wg == 0:
+                continue
+            if (t, g) not in points:
+                raise ValueError(f"No model at Teff={t}, log g={g}")
+            result[(t, g)] = result.get((t, g), 0.0) + wt * wg
+    return result
+
+
+def _bracket(
+    values: Sequence[float], value: float, name: str
+) -> tuple[tuple[float, float], float]:
+    """Returns the grid values around value and the fraction of the way
+    between them.
+    """
+    if not values or not values[0] <= value <= values[-1]:
+        raise ValueError(f"{name}={value} outside of the grid")
+    i = bisect.bisect_left(values, value)
+    if values[i] == value:
+        return (value, value), 0.0
+    lo, hi = values[i - 1], values[i]
+    return (lo, hi), (value - lo) / (hi - lo)
+
+
+def _resample(x: np.ndarray, y: np.ndarray, xnew: np.ndarray) -> np.ndarray:
+    """Linearly interpolates the columns of y, given at x, to xnew, keeping the
+    end values beyond the range of x.
+    """
+    i = np.clip(np.searchsorted(x, xnew), 1, x.size - 1)
+    f = np.clip((xnew - x[i - 1]) / (x[i] - x[i - 1]), 0.0, 1.0)[:, np.newaxis]
+    return y[i - 1] * (1 - f) + y[i] * f
+
+
+def interpolate(
+    grid: Mapping[GridPoint, units.Atmosphere],
+    teff: float,
+    grav: float,
+    scale: str = "tau",
+) -> units.Atmosphere:
+    """Interpolates model atmospheres to the given Teff and log g.
+
+    grid: model atmospheres by (Teff, log g). They must have the same number
+          of depths and parameters.
+    scale: the depth scale the structures are matched on, see depthscale.
+    The depth scale of the new model is the weighted mean of those of the
+    surrounding models, on which their structures are resampled and combined
+    (in log for quantities that are positive everywhere). All depths and
+    parameters are handled at once as arrays.
+    """
+    w = weights(grid, teff, grav)
+    models = [grid[point] for point in w]
+    shapes = {(m.nd, m.numpar) for m in models}
+    if len(shapes) != 1:
+        raise ValueError(f"Models differ in depths and parameters: {shapes}")
+    x = [depthscale(m, scale) for m in models]
+    xnew = np.sum([wi * xi for wi, xi in zip(w.values(), x)], axis=0)
+    values = [np.column_stack((m.dm, m.structure)) for m in models]
+    positive = np.all([(v > 0).all(axis=0) for v in values], axis=0)
+    result = np.zeros(values[0].shape)
+    for wi, xi, v in zip(w.values(), x, values):
+        v = np.where(positive, np.log10(np.where(positive, v, 1.0)), v)
+        result += wi * _resample(xi, v, xnew)
+    result[:, positive] = 10 ** result[:, positive]
+    return units.Atmosphere(result[:, 0], result[:, 1:], models[0].numpar)
+
+
+def interpolate_model(
+    models: Iterable[str | Path],
+    teff: float,
+    grav: float,
+    output: str | Path,
+    scale: str = "tau",
+) -> None:
+    """Interpolates models (paths without extension, as passed to
+    Synspec.run) to the given Teff and log g and writes the new model as
+    {output}.7 and {output}.5, ready for Synspec.run(output).
+
+    The .5 file is that of the model with the largest weight, with Teff and
+    log g replaced.
+    """
+    grid: dict[GridPoint, units.Atmosphere] = {}
+    inputs: dict[GridPoint, str] = {}
+    for model in models:
+        text = Path(f"{model}.5").read_text()
+        modelinput = units.readinput(text)
+        if "grav" not in modelinput:
+            raise ValueError(f"{model}.5 is not of a stellar atmosphere")
+        point = (float(modelinput["teff"]), float(modelinput["grav"]))
+        grid[point] = units.read8f(f"{model}.7")
+        inputs[point] = text
+    atmosphere = interpolate(grid, teff, grav, scale)
+    w = weights(grid, teff, grav)
+    template = inputs[max(w, key=lambda point: w[point])]
+    units.write8f(f"{output}.7", atmosphere)
+    Path(f"{output}.5").write_text(units.write5header(template, teff, grav))
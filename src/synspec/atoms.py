@@ -0,0 +1,251 @@
+import os
+import re
+import uuid
+import warnings
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from synspec import utils
+
+_SECTION = re.compile(r"^\*+\s*(Levels|Continuum transitions|Line transitions)")
+_INT = re.compile(r"^[+-]?\d+$")
+
+
+@dataclass(frozen=True)
+class Levels:
+    """Energy levels of a model atom, one array element per level.
+
+    enion: ionisation frequency in Hz.
+    g: statistical weight.
+    nquant: principal quantum number.
+    typlev: level designation.
+    ifwop: occupation probability switch.
+    frodf: frequency parameter for merged levels.
+    imodl: level mode.
+    """
+
+    enion: np.ndarray
+    g: np.ndarray
+    nquant: np.ndarray
+    typlev: np.ndarray
+    ifwop: np.ndarray
+    frodf: np.ndarray
+    imodl: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.enion)
+
+
+@dataclass(frozen=True)
+class Transitions:
+    """Bound-free or bound-bound transitions of a model atom, one array element
+    per transition.
+
+    lower, upper: indices (from 1) of the levels.
+    mode, ifancy, icolis, ifrq0, ifrq1: transition switches.
+    osc: oscillator strength or cross-section.
+    cparam: collisional parameter.
+    extra: the continuation lines following the transition.
+    """
+
+    lower: np.ndarray
+    upper: np.ndarray
+    mode: np.ndarray
+    ifancy: np.ndarray
+    icolis: np.ndarray
+    ifrq0: np.ndarray
+    ifrq1: np.ndarray
+    osc: np.ndarray
+    cparam: np.ndarray
+    extra: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.lower)
+
+
+@dataclass(frozen=True)
+class ModelAtom:
+    """Contents of an ion data file (filei in the ions block of the input
+    file).
+    """
+
+    levels: Levels
+    continua: Transitions
+    lines: Transitions
+
+
+def readatom(text: str) -> ModelAtom:
+    """Converts the contents of an ion data file to a ModelAtom."""
+    sections: dict[str, list[str]] = {}
+    current: list[str] | None = None
+    for line in text.splitlines():
+        if match := _SECTION.match(line):
+            current = sections.setdefault(match[1], [])
+        elif line.startswith("*") or not line.strip():
+            continue
+        elif current is None:
+            raise ValueError(f"data before the first section: {line}")
+        else:
+            current.append(line)
+    if "Levels" not in sections:
+        raise ValueError("no levels found")
+    return ModelAtom(
+        _readlevels(sections["Levels"]),
+        _readtransitions(sections.get("Continuum transitions", [])),
+        _readtransitions(sections.get("Line transitions", [])),
+    )
+
+
+def readatomf(file: str | Path) -> ModelAtom:
+    """Reads an ion data file."""
+    return readatom(Path(file).read_text())
+
+
+def _readlevels(lines: list[str]) -> Levels:
+    columns: list[list[Any]] = [[] for _ in fields(Levels)]
+    for line in lines:
+        tokens = utils.tokensfort(line)
+        if len(tokens) < 7:
+            raise ValueError(f"invalid level: {line}")
+        for column, token in zip(columns, tokens):
+            column.append(token)
+    enion, g, nquant, typlev, ifwop, frodf, imodl = columns
+    return Levels(
+        np.array(enion, dtype=float),
+        np.array(g, dtype=float),
+        np.array(nquant, dtype=int),
+        np.array(typlev, dtype=str),
+        np.array(ifwop, dtype=int),
+        np.array(frodf, dtype=float),
+        np.array(imodl, dtype=int),
+    )
+
+
+def _readtransitions(lines: list[str]) -> Transitions:
+    records: list[list[str]] = []
+    extra: list[list[str]] = []
+    for line in lines:
+        tokens = line.split("!")[0].split()
+        # Transitions start with seven integers followed by two reals; any
+        # other line continues the previous transition.
+        if len(tokens) >= 9 and all(_INT.match(x) for x in tokens[:7]):
+            records.append(tokens[:9])
+            extra.append([])
+        elif records:
+            extra[-1].append(line.rstrip())
+        else:
+            raise ValueError(f"invalid transition: {line}")
+    columns = list(zip(*records)) or [()] * 9
+    lower, upper, mode, ifancy, icolis, ifrq0, ifrq1 = (
+        np.array(column, dtype=int) for column in columns[:7]
+    )
+    osc, cparam = (
+        np.array([utils.fortfloat(x) for x in column], dtype=float)
+        for column in columns[7:]
+    )
+    return Transitions(
+        lower,
+        upper,
+        mode,
+        ifancy,
+        icolis,
+        ifrq0,
+        ifrq1,
+        osc,
+        cparam,
+        np.array(["\n".join(x) for x in extra], dtype=str),
+    )
+
+
+def save(atom: ModelAtom, file: str | Path) -> None:
+    """Stores a ModelAtom in a NumPy .npz file."""
+    arrays = {}
+    for name in ("levels", "continua", "lines"):
+        part = getattr(atom, name)
+        for field in fields(part):
+            arrays[f"{name}.{field.name}"] = getattr(part, field.name)
+    with open(file, "wb") as f:
+        np.savez(f, **arrays)
+
+
+def load(file: str | Path) -> ModelAtom:
+    """Loads a ModelAtom stored by `save`."""
+    with np.load(file) as arrays:
+        return ModelAtom(
+            *(
+                cls(**{f.name: arrays[f"{name}.{f.name}"] for f in fields(cls)})
+                for name, cls in [
+                    ("levels", Levels),
+                    ("continua", Transitions),
+                    ("lines", Transitions),
+                ]
+            )
+        )
+
+
+_loaded: dict[str, ModelAtom] = {}
+
+
+def cached(file: str | Path, cachedir: str | Path | None = None) -> ModelAtom:
+    """Returns the ModelAtom of an ion data file, parsing each version of the
+    file only once per process. If cachedir is given, the parsed atoms are
+    also stored there in binary form and shared between processes.
+    """
+    key = utils.statkey(file)
+    if key in _loaded:
+        return _loaded[key]
+    if cachedir is None:
+        atom = readatomf(file)
+    else:
+        cachefile = Path(cachedir) / f"{key}.npz"
+        try:
+            atom = load(cachefile)
+        except FileNotFoundError:
+            atom = readatomf(file)
+            cachefile.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cachefile.with_name(f"{uuid.uuid4()}.tmp")
+            save(atom, tmp)
+            os.replace(tmp, cachefile)
+    _loaded[key] = atom
+    return atom
+
+
+def validate(
+    modelinput: dict[str, Any],
+    basedir: str | Path = ".",
+    cachedir: str | Path | None = None,
+) -> None:
+    """Checks the ion data files of a parsed input file (see units.readinput)
+    against the numbers of levels the input file asks for.
+
+    basedir: directory relative paths in the input file are relative to.
+    cachedir: directory for binary copies of the parsed files.
+    Missing files are left for synspec to report. Raises ValueError if a file
+    has fewer levels than nlevs. Files that can't be parsed (synspec ignores
+    the comment lines readatom relies on to find the sections) or that have
+    line transitions between levels they don't have only raise a warning.
+    """
+    for ion in modelinput.get("ions", []):
+        file = Path(basedir) / str(ion["filei"])
+        if not str(ion["filei"]).strip() or not file.is_file():
+            continue
+        try:
+            atom = cached(file, cachedir)
+        except ValueError as e:
+            warnings.warn(f"{ion['filei']} not validated: {e}", RuntimeWarning)
+            continue
+        nlevs = int(ion["nlevs"])
+        if len(atom.levels) < nlevs:
+            raise ValueError(
+                f"{ion['filei']} has {len(atom.levels)} levels, "
+                f"the input file asks for {nlevs}"
+            )
+        if len(atom.lines) and atom.lines.upper.max() > len(atom.levels):
+            warnings.warn(
+                f"{ion['filei']} has line transitions to levels beyond "
+                f"{len(atom.levels)}",
+                RuntimeWarning,
+            )
@@ -0,0 +1,403 @@
+import dataclasses
+import hashlib
+import json
+import math
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Iterable
+
+import numpy as np
+
+from synspec import costmodel, profiling, units, utils
+from synspec.costmodel import CostModel, Features
+from synspec.journal import Journal
+from synspec.limits import ResourceLimits
+from synspec.metrics import Metrics
+from synspec.shared import SharedArray, SharedResults, load7, unlink
+from synspec.synspec import ResourceLimitExceeded, Synspec
+
+
+@dataclass(frozen=True)
+class Job:
+    """A single synspec run of a grid.
+
+    model: path to the model (without extension), as passed to Synspec.run.
+    outdir: directory to copy the output files to. Defaults to workdir.
+    outfile: name (without extension) of the output files.
+    links: extra links as passed to Synspec.add_link, mapping the name in the
+           run directory to the file it points to.
+    workdir: directory against which relative paths are resolved.
+             Defaults to the current directory when the job is created.
+    synspec: path to the synspec executable.
+    stage: stage the run directory in memory, see Synspec.run.
+    datacache: directory of the node-local atomic data cache, see Synspec.
+    abort_patterns: patterns aborting the run early, see Synspec.
+    limits: resource limits of the synspec process, see Synspec.
+    profile: directory to write cProfile and tracemalloc profiles of the job
+             to, see profiling.profiled. Defaults to SYNSPEC_PROFILE.
+    output_format: format to store the output files in, see Synspec.
+    """
+
+    model: str
+    outdir: str | None = None
+    outfile: str | None = None
+    links: dict[str, str] = field(default_factory=dict)
+    workdir: str = field(default_factory=lambda: str(Path.cwd()))
+    synspec: str = "synspec"
+    stage: bool | str = False
+    datacache: str | None = None
+    abort_patterns: list[str] | None = None
+    limits: ResourceLimits | None = None
+    profile: str | None = None
+    output_format: str | None = None
+
+    @property
+    def name(self) -> str:
+        """Name identifying the job in a grid."""
+        if self.outfile is not None:
+            return self.outfile
+        return Path(self.model).name
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "Job":
+        data = dict(data)
+        if data.get("limits") is not None:
+            data["limits"] = ResourceLimits.from_dict(data["limits"])
+        return cls(**data)
+
+
+@dataclass(frozen=True)
+class JobResult:
+    name: str
+    status: str  # "done", "failed" or "resource" (exceeded its limits)
+    outdir: str
+    wall: float
+    error: str | None = None
+    cpu: float = 0.0  # CPU time of the synspec process
+    cache_hits: int = 0
+    cache_misses: int = 0
+    # The .spec and .cont outputs in shared memory, see run_batch.
+    spectrum: SharedArray | None = None
+    continuum: SharedArray | None = None
+    # Why they couldn't be loaded into shared memory; the files are in outdir.
+    share_error: str | None = None
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "JobResult":
+        data = dict(data)
+        for key in ("spectrum", "continuum"):
+            if data.get(key) is not None:
+                data[key] = SharedArray.from_dict(data[key])
+        return cls(**data)
+
+
+def run_job(job: Job, share: bool = False) -> JobResult:
+    """Runs a single job in a temporary directory. Failures are reported in the
+    returned JobResult instead of being raised.
+
+    share: load the .spec and .cont outputs into shared memory, see
+           load7. The receiving process has to unlink the blocks. If they
+           can't be loaded, the job is still done and share_error says why.
+    """
+    outdir = job.outdir if job.outdir is not None else job.workdir
+    start = time.perf_counter()
+    cpu = _children_cpu()
+    synspec = None
+    status, error = "done", None
+    spectrum = continuum = None
+    share_error = None
+    try:
+        with profiling.profiled(job.name, job.profile):
+            synspec = _synspec(job)
+            synspec.run(
+                job.model,
+                rundir=None,
+                outdir=outdir,
+                outfile=job.outfile,
+                stage=job.stage,
+                basedir=job.workdir,
+            )
+    except ResourceLimitExceeded as e:
+        status, error = "resource", repr(e)
+    except Exception as e:
+        status, error = "failed", repr(e)
+    if share and status == "done":
+        try:
+            spectrum, continuum = _load_outputs(Path(job.workdir, outdir), job.name)
+        except Exception as e:
+            share_error = repr(e)
+    cache = None if synspec is None else synspec.datacache
+    return JobResult(
+        job.name,
+        status,
+        outdir,
+        time.perf_counter() - start,
+        error,
+        _children_cpu() - cpu,
+        0 if cache is None else cache.hits,
+        0 if cache is None else cache.misses,
+        spectrum,
+        continuum,
+        share_error,
+    )
+
+
+def _load_outputs(output: Path, name: str) -> tuple[SharedArray, SharedArray]:
+    """Loads the .spec and .cont outputs of a job into shared memory, see
+    load7. If the second fails, the block of the first is unlinked.
+    """
+    spectrum = load7(output / f"{name}.spec")
+    try:
+        continuum = load7(output / f"{name}.cont")
+    except BaseException:
+        unlink(spectrum)
+        raise
+    return spectrum, continuum
+
+
+def _synspec(job: Job) -> Synspec:
+    synspec = Synspec(
+        job.synspec,
+        datacache=job.datacache,
+        abort_patterns=job.abort_patterns,
+        limits=job.limits,
+        output_format=job.output_format,
+    )
+    for linkto, linkfrom in job.links.items():
+        synspec.add_link(linkfrom, linkto)
+    return synspec
+
+
+def _children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def record(metrics: Metrics, result: JobResult) -> None:
+    """Adds a job result to the metrics."""
+    metrics.counter("synspec_jobs", "Finished jobs by status.").inc(
+        status=result.status
+    )
+    metrics.histogram(
+        "synspec_job_wall_seconds", "Wall time of jobs, including setup."
+    ).observe(result.wall)
+    metrics.histogram(
+        "synspec_job_cpu_seconds", "CPU time of the synspec processes of jobs."
+    ).observe(result.cpu)
+    hits = metrics.counter("synspec_datacache_hits", "Atomic data cache hits.")
+    misses = metrics.counter("synspec_datacache_misses", "Atomic data cache misses.")
+    hits.inc(result.cache_hits)
+    misses.inc(result.cache_misses)
+    nhits, nmisses = hits.values.get((), 0.0), misses.values.get((), 0.0)
+    if nhits + nmisses:
+        metrics.gauge(
+            "synspec_datacache_hit_ratio", "Fraction of cache lookups that hit."
+        ).set(nhits / (nhits + nmisses))
+
+
+def input_hash(job: Job, keys: dict[Path, str] | None = None) -> str:
+    """Hash identifying a job and the versions of its input files, by their
+    size and modification time (see utils.statkey).
+
+    keys: memo of the statkeys of files, shared by the jobs of a batch so
+          that common inputs such as the data directory are only walked once.
+    """
+    if keys is None:
+        keys = {}
+    digest = hashlib.sha256(json.dumps(job.to_dict(), sort_keys=True).encode())
+    try:
+        plan = _synspec(job).plan(job.model, job.workdir)
+    except (OSError, ValueError):
+        # The job will fail, so the hash only has to be stable.
+        return digest.hexdigest()
+    for name, src in sorted(plan.links.items()):
+        if src not in keys:
+            keys[src] = utils.statkey(src) if src.exists() else ""
+        digest.update(f"\n{name}:{keys[src]}".encode())
+    return digest.hexdigest()
+
+
+def _journaled(journal: Journal, job: Job, hash: str) -> JobResult | None:
+    """Returns the result of the job if the journal shows it is done with the
+    same inputs and its outputs are still there.
+    """
+    record = journal.last(job.name)
+    if (
+        record is None
+        or record["event"] != "end"
+        or record["status"] != "done"
+        or record["hash"] != hash
+    ):
+        return None
+    result = JobResult.from_dict(
+        {
+            f.name: record[f.name]
+            for f in dataclasses.fields(JobResult)
+            if f.name in record
+        }
+    )
+    try:
+        units.unitfile(Path(job.workdir, result.outdir) / f"{job.name}.spec")
+    except FileNotFoundError:
+        return None
+    return result
+
+
+def run_batch(
+    jobs: Iterable[Job],
+    workers: int | None = None,
+    metrics: Metrics | None = None,
+    journal: str | Path | None = None,
+    shared: SharedResults | None = None,
+    cost: CostModel | None = None,
+) -> list[JobResult]:
+    """Runs the jobs in parallel on this machine.
+
+    workers: number of worker processes. Defaults to the number of CPUs.
+    metrics: metrics to record the progress of the batch in. They are
+             published after every job.
+    journal: file to journal the jobs in, see Journal. Jobs the journal shows
+             done, with unchanged inputs and outputs still in place, are not
+             run again; failed jobs and those interrupted by a crash are.
+    shared: have the workers parse the .spec and .cont outputs of successful
+            jobs into shared memory, held by this SharedResults. The results
+            then only carry descriptors (spectrum and continuum), which
+            shared.spectrum turns into NumPy views without copying. Outputs
+            that can't be loaded are left to the files, see run_job.
+    cost: model to order the jobs by, longest predicted runtime first, so that
+          the batch does not end waiting for a long job started last. The
+          runtimes of the jobs are recorded in it.
+    Results are returned in the order of the jobs.
+    """
+    jobs = list(jobs)
+    results: list[JobResult | None] = [None] * len(jobs)
+    hashes = [""] * len(jobs)
+    with ExitStack() as stack:
+        log = None
+        if journal is not None:
+            log = stack.enter_context(Journal(journal))
+            keys: dict[Path, str] = {}
+            hashes = [input_hash(job, keys) for job in jobs]
+            results = [_journaled(log, job, h) for job, h in zip(jobs, hashes)]
+            if shared is not None:
+                results = [
+                    None if result is None else _share(shared, job, result)
+                    for job, result in zip(jobs, results)
+                ]
+        todo = [i for i, result in enumerate(results) if result is None]
+        estimates: list[Features | None] = [None] * len(jobs)
+        if cost is not None:
+            memo: dict[str, np.ndarray] = {}
+            for i in todo:
+                estimates[i] = job_features(jobs[i], memo)
+            # Jobs without features will fail at once, so they can go first.
+            todo.sort(
+                key=lambda i: (
+                    -math.inf if (f := estimates[i]) is None else -cost.predict(f)
+                )
+            )
+
+        if metrics is not None:
+            remaining = metrics.gauge(
+                "synspec_batch_jobs_remaining", "Unfinished jobs."
+            )
+            remaining.set(len(todo))
+            metrics.publish()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for i in todo:
+                if log is not None:
+                    log.started(jobs[i].name, hashes[i])
+                futures[pool.submit(run_job, jobs[i], shared is not None)] = i
+            for n, future in enumerate(as_completed(futures), start=1):
+                i = futures[future]
+                result = results[i] = future.result()
+                if shared is not None:
+                    for array in (result.spectrum, result.continuum):
+                        if array is not None:
+                            shared.array(array)  # take over the block
+                if log is not None:
+                    log.finished(
+                        jobs[i].name,
+                        hashes[i],
+                        dataclasses.replace(
+                            result, spectrum=None, continuum=None, share_error=None
+                        ).to_dict(),
+                    )
+                if cost is not None and result.status == "done":
+                    if (f := estimates[i]) is not None:
+                        cost.observe(f, result.wall)
+                if metrics is not None:
+                    record(metrics, result)
+                    remaining.set(len(todo) - n)
+                    metrics.publish()
+    return [result for result in results if result is not None]
+
+
+def job_features(
+    job: Job, memo: dict[str, np.ndarray] | None = None
+) -> Features | None:
+    """Returns the features of a job for the cost model, or None if it can't
+    be planned (and so will fail).
+
+    memo: see costmodel.linewavelengths.
+    """
+    try:
+        return costmodel.features(_synspec(job).plan(job.model, job.workdir), memo)
+    except (OSError, ValueError):
+        return None
+
+
+def split_job(
+    job: Job, cost: CostModel, seconds: float, directory: str | Path
+) -> list[Job]:
+    """Splits a job into jobs over consecutive wavelength chunks, each
+    predicted by cost to take at most seconds, see CostModel.chunks.
+
+    The fort.55 of the chunks are written to directory (relative to the
+    workdir of the job) and the chunks are named {name}_{i}. Their spectra
+    join, in order, into the spectrum of the job, overlapping at the edges.
+    A job short enough is returned as is.
+    """
+    plan = _synspec(job).plan(job.model, job.workdir)
+    memo: dict[str, np.ndarray] = {}
+    wavelengths = np.empty(0)
+    if "fort.19" in plan.links:
+        wavelengths = costmodel.linewavelengths(plan.links["fort.19"], memo)
+    ranges = cost.chunks(costmodel.features(plan, memo), wavelengths, seconds)
+    if len(ranges) == 1:
+        return [job]
+    directory = Path(job.workdir, directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    chunks = []
+    for i, (alam0, alam1) in enumerate(ranges):
+        name = f"{job.name}_{i}"
+        config = dataclasses.replace(plan.config, alam0=alam0, alam1=alam1)
+        units.write55f(directory / f"{name}.55", config)
+        links = {**job.links, "fort.55": str(directory / f"{name}.55")}
+        chunks.append(dataclasses.replace(job, outfile=name, links=links))
+    return chunks
+
+
+def _share(shared: SharedResults, job: Job, result: JobResult) -> JobResult:
+    """Loads the outputs of a result from an earlier run into shared memory,
+    see run_job for failures.
+    """
+    output = Path(job.workdir, result.outdir)
+    try:
+        spectrum, continuum = _load_outputs(output, result.name)
+    except Exception as e:
+        return dataclasses.replace(result, share_error=repr(e))
+    shared.array(spectrum)  # take over the blocks
+    shared.array(continuum)
+    return dataclasses.replace(result, spectrum=spectrum, continuum=continuum)
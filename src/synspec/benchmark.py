@@ -0,0 +1,177 @@
+import argparse
+import json
+import multiprocessing
+import resource
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+
+from synspec import units
+from synspec.synspec import Synspec, tempdir
+
+# Output files compared numerically.
+NUMERIC_OUTPUTS = ("spec", "cont")
+# Relative slowdown of the median beyond which a measurement is a regression.
+DEFAULT_TOLERANCE = 0.2
+
+
+@dataclass(frozen=True)
+class Measurement:
+    """Resources used by one run of a model.
+
+    wall: wall time of Synspec.run in seconds, including setup.
+    cpu: CPU time of the synspec process in seconds.
+    rss: peak resident set size of the synspec process in bytes.
+    """
+
+    wall: float
+    cpu: float
+    rss: int
+
+
+def _run_once(modeldir: str, synspec: str, outdir: str) -> Measurement:
+    """Runs a bundled model (models/<name> with input/, data/ and output/) in a
+    fresh worker process, so that the resource usage of its children is that
+    of this run alone.
+    """
+    model = Path(modeldir).name
+    with tempdir() as workdir:
+        for file in (Path(modeldir) / "input").iterdir():
+            if file.name != "data":
+                (workdir / file.name).symlink_to(file.resolve())
+        if (Path(modeldir) / "data").is_dir():
+            (workdir / "data").symlink_to(Path(modeldir, "data").resolve())
+        runner = Synspec(synspec)
+        runner.add_link("data")
+        start = time.perf_counter()
+        runner.run(model, rundir=None, outdir=outdir, basedir=workdir)
+        wall = time.perf_counter() - start
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kilobytes on Linux.
+    return Measurement(wall, usage.ru_utime + usage.ru_stime, usage.ru_maxrss * 1024)
+
+
+def run_model(
+    modeldir: str | Path, synspec: str, outdir: str | Path, repeats: int = 5
+) -> list[Measurement]:
+    """Runs a bundled model repeatedly, leaving the outputs of the last run in
+    outdir, and returns the measurements of the runs.
+    """
+    measurements = []
+    # One process per run: peak RSS of children can't be reset otherwise.
+    for _ in range(repeats):
+        with multiprocessing.Pool(1, maxtasksperchild=1) as pool:
+            measurements.append(
+                pool.apply(_run_once, (str(modeldir), synspec, str(outdir)))
+            )
+    return measurements
+
+
+def compare_outputs(
+    reference: str | Path,
+    output: str | Path,
+    model: str,
+    rtol: float = 1e-4,
+    atol: float = 0.0,
+) -> list[str]:
+    """Compares the numerical outputs of a run with reference outputs.
+
+    Both files must have the same number of rows; wavelengths and values must
+    agree within the tolerances. Returns descriptions of the differences.
+    """
+    problems = []
+    for ext in NUMERIC_OUTPUTS:
+        ref = units.read7f(Path(reference) / f"{model}.{ext}")
+        out = units.read7f(Path(output) / f"{model}.{ext}")
+        if ref.wavelength.shape != out.wavelength.shape:
+            problems.append(
+                f"{model}.{ext}: {out.wavelength.size} rows, "
+                f"{ref.wavelength.size} expected"
+            )
+            continue
+        for column in ("wavelength", "flux"):
+            expected, actual = getattr(ref, column), getattr(out, column)
+            bad = ~np.isclose(actual, expected, rtol=rtol, atol=atol)
+            if bad.any():
+                i = int(np.argmax(bad))
+                problems.append(
+                    f"{model}.{ext}: {column} differs in {bad.sum()} rows, "
+                    f"first at row {i + 1}: {actual[i]} != {expected[i]}"
+                )
+    return problems
+
+
+def summarize(measurements: Sequence[Measurement]) -> dict[str, list[float]]:
+    """Converts measurements to the lists of values stored in baselines."""
+    return {
+        key: [getattr(m, key) for m in measurements] for key in ("wall", "cpu", "rss")
+    }
+
+
+def compare_baseline(
+    current: dict[str, list[float]],
+    baseline: dict[str, list[float]],
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> list[str]:
+    """Compares the medians of measurements with those of a baseline. Returns
+    descriptions of the quantities that got worse by more than the tolerance.
+    """
+    regressions = []
+    for key, values in current.items():
+        if not baseline.get(key) or not values:
+            continue
+        old, new = statistics.median(baseline[key]), statistics.median(values)
+        if new > old * (1 + tolerance):
+            regressions.append(f"{key}: median {new:.4g} vs baseline {old:.4g}")
+    return regressions
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m synspec.benchmark",
+        description="Run the bundled models, check their outputs and compare "
+        "their resource usage with a baseline.",
+    )
+    parser.add_argument("models", nargs="+", help="model directories")
+    parser.add_argument("--synspec", default="synspec")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--baseline", default=None, help="baseline json file")
+    parser.add_argument(
+        "--update", action="store_true", help="store the measurements as baseline"
+    )
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--rtol", type=float, default=1e-4)
+    args = parser.parse_args(argv)
+
+    baselines = {}
+    if args.baseline is not None and Path(args.baseline).exists():
+        baselines = json.loads(Path(args.baseline).read_text())
+    failed = False
+    for modeldir in map(Path, args.models):
+        model = modeldir.name
+        with tempdir() as outdir:
+            measurements = run_model(modeldir, args.synspec, outdir, args.repeats)
+            problems = compare_outputs(modeldir / "output", outdir, model, args.rtol)
+        current = summarize(measurements)
+        if not args.update:
+            problems += compare_baseline(
+                current, baselines.get(model, {}), args.tolerance
+            )
+        wall = statistics.median(current["wall"])
+        print(f"{model}: median wall {wall:.3f} s over {args.repeats} runs")
+        for problem in problems:
+            print(f"  {problem}")
+        failed |= bool(problems)
+        baselines[model] = current
+    if args.update and args.baseline is not None:
+        Path(args.baseline).write_text(json.dumps(baselines, indent=2) + "\n")
+    return int(failed)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import fcntl
+import hashlib
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from synspec import utils
+
+CHUNK_SIZE = 1024**2
+
+
+class DataCache:
+    """Node-local, content-addressed cache of atomic data files.
+
+    Files are copied once into objects/, named by the sha256 of their
+    contents. Directories (e.g. data/) become trees/ of hard links to the
+    objects. An index maps a source path, size and modification time to its
+    cached copy, so a hit only costs a stat of the source. Fetches of the same
+    source by concurrent processes are serialised with a lock file, so each
+    source is read from central storage once per node.
+
+    Cached files are read only and are never removed by the cache; delete the
+    cache directory to clear it.
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root).resolve()
+        for sub in ("objects", "trees", "index", "locks", "tmp"):
+            (self.root / sub).mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, src: str | Path) -> Path:
+        """Returns the cached copy of the file or directory, fetching it into
+        the cache first if necessary.
+        """
+        src = Path(src).resolve()
+        key = utils.statkey(src)
+        index = self.root / "index" / key
+        if (cached := self._lookup(index)) is not None:
+            self.hits += 1
+            return cached
+        with self._lock(key):
+            # Another process may have fetched it while we were waiting.
+            if (cached := self._lookup(index)) is not None:
+                self.hits += 1
+                return cached
+            self.misses += 1
+            if src.is_dir():
+                cached = self._fetch_tree(src, key)
+            else:
+                cached = self._fetch_file(src)
+            self._write_index(index, cached)
+        return cached
+
+    def _lookup(self, index: Path) -> Path | None:
+        try:
+            cached = self.root / index.read_text()
+        except FileNotFoundError:
+            return None
+        return cached if cached.exists() else None
+
+    def _write_index(self, index: Path, cached: Path) -> None:
+        tmp = self.root / "tmp" / str(uuid.uuid4())
+        tmp.write_text(str(cached.relative_to(self.root)))
+        os.replace(tmp, index)
+
+    def _fetch_file(self, src: Path) -> Path:
+        tmp = self.root / "tmp" / str(uuid.uuid4())
+        digest = hashlib.sha256()
+        try:
+            with open(src, "rb") as fin, open(tmp, "wb") as fout:
+                while chunk := fin.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    fout.write(chunk)
+            tmp.chmod(0o444)
+            obj = self.root / "objects" / digest.hexdigest()
+            if obj.exists():
+                tmp.unlink()
+            else:
+                os.replace(tmp, obj)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return obj
+
+    def _fetch_tree(self, src: Path, key: str) -> Path:
+        tree = self.root / "trees" / key
+        if tree.exists():
+            return tree
+        tmp = self.root / "tmp" / str(uuid.uuid4())
+        try:
+            tmp.mkdir()
+            for file in sorted(src.rglob("*")):
+                dst = tmp / file.relative_to(src)
+                if file.is_dir():
+                    dst.mkdir()
+                elif file.is_file():
+                    os.link(self._fetch_file(file), dst)
+            os.replace(tmp, tree)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        return tree
+
+    @contextmanager
+    def _lock(self, key: str) -> Iterator[None]:
+        with open(self.root / "locks" / key, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
@@ -0,0 +1,222 @@
+import dataclasses
+import json
+import math
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from synspec import linelist, units, utils
+from synspec.synspec import RunPlan
+
+# Prior weights of the log of the runtime on Features.vector, roughly
+# proportional to the wavelength points and growing slowly with the lines and
+# levels. They only have to order jobs sensibly until runs are recorded.
+PRIOR = (-9.0, 1.0, 0.3, 0.5, 0.0, 0.0)
+# Weight of the prior in the fit, in recorded runs.
+PRIOR_WEIGHT = 1.0
+# Smallest chunk chunks() cuts, in wavelength points.
+MIN_CHUNK_POINTS = 10
+# Wavelength step in Angstrom assumed for runs whose fort.55 doesn't set
+# space, in which case synspec picks the step itself.
+DEFAULT_STEP = 0.01
+
+
+@dataclass(frozen=True)
+class Features:
+    """The inputs of a run its runtime depends on.
+
+    alam0, alam1: wavelength range in Angstrom, from fort.55.
+    step: wavelength step in Angstrom: space from fort.55, or DEFAULT_STEP if
+          space is not set.
+    nfread: frequency points of the continuum, from the input file.
+    ions: explicit ions in the input file.
+    levels: explicit levels of those ions.
+    lines: lines in fort.19 between alam0 and alam1.
+    """
+
+    alam0: float
+    alam1: float
+    step: float
+    nfread: int
+    ions: int
+    levels: int
+    lines: int
+
+    @property
+    def points(self) -> float:
+        """Wavelength points of the run."""
+        return max((self.alam1 - self.alam0) / self.step, 1.0)
+
+    def vector(self) -> np.ndarray:
+        """The regressors of the log of the runtime."""
+        return np.array(
+            [
+                1.0,
+                math.log(self.points),
+                math.log1p(self.lines),
+                math.log1p(self.levels),
+                math.log1p(self.nfread),
+                math.log1p(self.ions),
+            ]
+        )
+
+    def window(self, alam0: float, alam1: float, wavelengths: np.ndarray) -> "Features":
+        """The features of the run restricted to alam0 to alam1.
+
+        wavelengths: sorted wavelengths of the lines, see linewavelengths.
+        """
+        i0, i1 = np.searchsorted(wavelengths, [alam0, alam1], side="left")
+        return dataclasses.replace(self, alam0=alam0, alam1=alam1, lines=int(i1 - i0))
+
+
+def linewavelengths(
+    file: str | Path, memo: dict[str, np.ndarray] | None = None
+) -> np.ndarray:
+    """Returns the sorted wavelengths, in Angstrom, of the lines in a .19 file
+    (which may be compressed, see units.openunit).
+
+    memo: wavelengths by statkey of the file, so that line lists shared by
+          many jobs are read once.
+    """
+    key = utils.statkey(file)
+    if memo is not None and key in memo:
+        return memo[key]
+    with units.openunit(file) as f:
+        wavelengths = np.sort(
+            np.fromiter((k[0] * 10 for k, _ in linelist.records(f)), dtype=float)
+        )
+    if memo is not None:
+        memo[key] = wavelengths
+    return wavelengths
+
+
+def features(plan: RunPlan, memo: dict[str, np.ndarray] | None = None) -> Features:
+    """Returns the features of a planned run, see Synspec.plan.
+
+    memo: see linewavelengths.
+    """
+    config = plan.config
+    step = config.space if config.space > 0 else DEFAULT_STEP
+    ions = plan.modelinput["ions"]
+    result = Features(
+        config.alam0,
+        config.alam1,
+        step,
+        int(plan.modelinput["nfread"]),
+        len(ions),
+        sum(int(ion["nlevs"]) for ion in ions),
+        0,
+    )
+    if "fort.19" in plan.links:
+        wavelengths = linewavelengths(plan.links["fort.19"], memo)
+        result = result.window(config.alam0, config.alam1, wavelengths)
+    return result
+
+
+class CostModel:
+    """Predicts the runtimes of synspec runs from their Features.
+
+    The log of the runtime is fitted by least squares to recorded runs as a
+    linear function of Features.vector, pulled towards PRIOR with the weight
+    of prior_weight runs, so the model can be used before any run is recorded
+    and follows the machine it runs on as runs are recorded.
+
+    path: json lines file of recorded runs. Runs recorded with observe are
+          appended to it, so models with the same path learn across batches.
+    """
+
+    def __init__(
+        self, path: str | Path | None = None, prior_weight: float = PRIOR_WEIGHT
+    ):
+        self.path = Path(path) if path is not None else None
+        self.prior_weight = prior_weight
+        self.records: list[tuple[Features, float]] = []
+        self._weights: np.ndarray | None = None
+        if self.path is not None and self.path.exists():
+            for line in self.path.read_text().splitlines():
+                try:
+                    data = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # A record torn by a crash.
+                self.records.append((Features(**data["features"]), data["seconds"]))
+
+    def observe(self, features: Features, seconds: float) -> None:
+        """Records the runtime of a run."""
+        if seconds <= 0:
+            return
+        self.records.append((features, seconds))
+        self._weights = None
+        if self.path is not None:
+            with open(self.path, "a") as f:
+                record = {"features": dataclasses.asdict(features), "seconds": seconds}
+                f.write(json.dumps(record) + "\n")
+
+    @property
+    def weights(self) -> np.ndarray:
+        """The fitted weights of Features.vector."""
+        if self._weights is None:
+            prior = np.array(PRIOR)
+            a = self.prior_weight * np.eye(prior.size)
+            b = self.prior_weight * prior
+            if self.records:
+                x = np.array([f.vector() for f, _ in self.records])
+                y = np.log([seconds for _, seconds in self.records])
+                a = a + x.T @ x
+                b = b + x.T @ y
+            self._weights = np.linalg.solve(a, b)
+        return self._weights
+
+    def predict(self, features: Features) -> float:
+        """Predicted runtime of a run in seconds."""
+        return math.exp(features.vector() @ self.weights)
+
+    def chunks(
+        self, features: Features, wavelengths: np.ndarray, seconds: float
+    ) -> list[tuple[float, float]]:
+        """Splits the wavelength range of a run into as few consecutive chunks
+        as are each predicted to take at most seconds (but at least
+        MIN_CHUNK_POINTS points), balanced so that the longest is as short as
+        possible.
+
+        wavelengths: sorted wavelengths of the lines, see linewavelengths.
+        """
+        edges = self._cut(features, wavelengths, seconds)
+        low, high = 0.0, seconds
+        for _ in range(30):
+            limit = (low + high) / 2
+            if len(self._cut(features, wavelengths, limit, len(edges))) <= len(edges):
+                high = limit
+            else:
+                low = limit
+        edges = self._cut(features, wavelengths, high)
+        return list(zip(edges[:-1], edges[1:]))
+
+    def _cut(
+        self,
+        features: Features,
+        wavelengths: np.ndarray,
+        limit: float,
+        max_edges: int | None = None,
+    ) -> list[float]:
+        """Edges of the greedy chunks predicted to take at most limit. Gives up
+        once there are more than max_edges.
+        """
+        alam1 = features.alam1
+        edges = [features.alam0]
+        while edges[-1] < alam1 and (max_edges is None or len(edges) <= max_edges):
+            start = edges[-1]
+            low = min(start + MIN_CHUNK_POINTS * features.step, alam1)
+            high = alam1
+            if self.predict(features.window(start, high, wavelengths)) <= limit:
+                low = high
+            elif self.predict(features.window(start, low, wavelengths)) <= limit:
+                for _ in range(40):
+                    middle = (low + high) / 2
+                    window = features.window(start, middle, wavelengths)
+                    if self.predict(window) <= limit:
+                        low = middle
+                    else:
+                        high = middle
+            edges.append(low)
+        return edges
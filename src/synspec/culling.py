@@ -0,0 +1,249 @@
+import bisect
+import json
+import math
+import os
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Mapping
+
+from synspec import linelist, units, utils
+from synspec.linedata import EV
+from synspec.synspec import RunPlan, Synspec
+
+# Largest differences between a line of an .iden file and of fort.19 that
+# are the same line, in wavelength (Angstrom) and lower level energy (cm^-1).
+WAVELENGTH_TOLERANCE = 0.0015
+ENERGY_TOLERANCE = 1.0
+
+
+def strength(gf: float, excl: float, teff: float) -> float:
+    """Boltzmann-weighted log gf of a line, which orders the lines of a
+    species by strength: log gf - theta * chi, with theta = 5040 / teff and
+    chi the energy of the lower level in eV.
+    """
+    return gf - 5040.0 / teff * excl / EV
+
+
+def line_order_teff(modelinput: Mapping[str, Any]) -> float:
+    """The Teff to order the lines of a model by (see strength): that of the
+    model, or any for disk models, which have none.
+    """
+    return float(modelinput.get("teff", 0.0)) or 10000.0
+
+
+def cull(
+    source: str | Path,
+    output: str | Path,
+    iden: Iterable[units.IdenLine],
+    teff: float,
+    margin: float = 1.0,
+) -> int:
+    """Writes the lines of the .19 file source that an .iden file identified,
+    with a safety margin, to output and returns the number of lines kept.
+
+    The margin keeps all lines of the species identified that are no more
+    than margin dex weaker (see strength) than the weakest identified line
+    of the species, so that lines that become significant as the parameters
+    change a little are kept too. The source is streamed, so it may be of any
+    size, and may be compressed (see units.openunit).
+    """
+    identified: dict[float, list[tuple[float, float]]] = {}
+    thresholds: dict[float, float] = {}
+    for line in iden:
+        identified.setdefault(line.anum, []).append((line.wavelength, line.excl))
+        s = strength(line.gf, line.excl, teff) - margin
+        thresholds[line.anum] = min(thresholds.get(line.anum, math.inf), s)
+    for lines in identified.values():
+        lines.sort()
+
+    def keep(text: str) -> bool:
+        line = units.read19line(text)
+        anum = round(line.anum, 2)
+        if anum not in thresholds:
+            return False
+        if strength(line.gf, line.excl, teff) >= thresholds[anum]:
+            return True
+        lines = identified[anum]
+        i = bisect.bisect_left(lines, (line.wavelength - WAVELENGTH_TOLERANCE,))
+        for wavelength, excl in lines[i:]:
+            if wavelength > line.wavelength + WAVELENGTH_TOLERANCE:
+                break
+            if abs(excl - line.excl) <= ENERGY_TOLERANCE:
+                return True
+        return False
+
+    output = Path(output)
+    partial = output.with_name(f".{output.name}.{uuid.uuid4()}")
+    count = 0
+    try:
+        with units.openunit(source) as f, open(partial, "w") as out:
+            for _, text in linelist.records(f):
+                if keep(text):
+                    out.write(text)
+                    count += 1
+        os.replace(partial, output)
+    finally:
+        partial.unlink(missing_ok=True)
+    return count
+
+
+@dataclass(frozen=True)
+class Drift:
+    """How far the parameters of a run may drift from those of the reference
+    run before the culled line list is rebuilt.
+
+    teff: in K.
+    grav: in dex (log g).
+    abundance: in dex, of any abundance in the input file or fort.56.
+    vtb: turbulent velocity in km/s.
+    """
+
+    teff: float = 1000.0
+    grav: float = 0.3
+    abundance: float = 0.3
+    vtb: float = 2.0
+
+
+def parameters(plan: RunPlan) -> dict[str, Any]:
+    """The parameters of a planned run that the significant lines depend on,
+    and what the culled line list is cut from: the line list and range.
+    """
+    modelinput = plan.modelinput
+    config = plan.config
+    abundances = {
+        str(iatom): float(atom["abd"])
+        for iatom, atom in enumerate(modelinput["atoms"], start=1)
+    }
+    if config.ichemc != 0 and "fort.56" in plan.links:
+        for abundance in units.read56f(plan.links["fort.56"]):
+            abundances[f"56:{abundance.iatom}"] = abundance.abn
+    return {
+        "teff": float(modelinput.get("teff", 0.0)),
+        "grav": float(modelinput.get("grav", 0.0)),
+        "vtb": config.vtb,
+        "abundances": abundances,
+        "range": [config.alam0, config.alam1],
+        "fort.19": utils.statkey(plan.links["fort.19"]),
+    }
+
+
+def _dex(a: float, b: float) -> float:
+    """Difference of two abundances in dex; infinite if not comparable."""
+    if a == b:
+        return 0.0
+    if a > 0 and b > 0:
+        return abs(math.log10(a / b))
+    return math.inf
+
+
+def drifted(reference: Mapping[str, Any], new: Mapping[str, Any], drift: Drift) -> bool:
+    """Whether the parameters of a run (see parameters) drifted from those of
+    the reference run by more than drift, or it has another line list or a
+    wavelength range outside that of the reference.
+    """
+    if new["fort.19"] != reference["fort.19"]:
+        return True
+    if (
+        new["range"][0] < reference["range"][0]
+        or new["range"][1] > reference["range"][1]
+    ):
+        return True
+    if abs(new["teff"] - reference["teff"]) > drift.teff:
+        return True
+    if abs(new["grav"] - reference["grav"]) > drift.grav:
+        return True
+    if abs(new["vtb"] - reference["vtb"]) > drift.vtb:
+        return True
+    old, abundances = reference["abundances"], new["abundances"]
+    return any(
+        _dex(old.get(key, 0.0), abundances.get(key, 0.0)) > drift.abundance
+        for key in set(old) | set(abundances)
+    )
+
+
+class CulledSynthesis:
+    """Runs a sweep of models around a reference with a line list culled to
+    the lines the reference run identified as significant.
+
+    The first run, and any run whose parameters drifted too far from those of
+    the reference (see drifted), is run with the full line list and becomes
+    the reference: the lines its .iden file lists, with a margin (see cull),
+    are written to culled.19 in workdir. Every other run stages culled.19 as
+    its fort.19. The reference is kept in workdir, so a sweep can be resumed.
+
+    synspec: Synspec object to run with.
+    workdir: directory for the culled line list and the reference.
+    margin: see cull.
+    drift: see Drift.
+    """
+
+    def __init__(
+        self,
+        synspec: Synspec,
+        workdir: str | Path,
+        margin: float = 1.0,
+        drift: Drift = Drift(),
+    ):
+        self.synspec = synspec
+        self.workdir = Path(workdir).resolve()
+        self.workdir.mkdir(parents=True, exist_ok=True)
+        self.margin = margin
+        self.drift = drift
+        self.rebuilds = 0
+
+    @property
+    def culled(self) -> Path:
+        """The culled line list."""
+        return self.workdir / "culled.19"
+
+    def reference(self) -> dict[str, Any] | None:
+        """The parameters of the reference run, None before the first run."""
+        try:
+            return json.loads((self.workdir / "reference.json").read_text())
+        except FileNotFoundError:
+            return None
+
+    def run(
+        self,
+        model: str,
+        outdir: str | Path | None = None,
+        outfile: str | None = None,
+        basedir: str | Path | None = None,
+        links: Mapping[str, str | Path] | None = None,
+    ) -> bool:
+        """Runs the model in a temporary directory, see Synspec.run, with the
+        culled line list unless it has to be rebuilt. Returns whether this run
+        became the reference.
+        """
+        plan = self.synspec.plan(model, basedir, links)
+        params = utils.jsonable(parameters(plan))
+        reference = self.reference()
+        rebuild = (
+            reference is None
+            or reference["margin"] != self.margin
+            or not self.culled.exists()
+            or drifted(reference, params, self.drift)
+        )
+        if not rebuild:
+            links = {**(links or {}), "fort.19": self.culled}
+        self.synspec.run(
+            model,
+            rundir=None,
+            outdir=outdir,
+            outfile=outfile,
+            basedir=basedir,
+            links=links,
+        )
+        if rebuild:
+            output = plan.basedir / (outdir if outdir is not None else ".")
+            iden = units.read12f(
+                units.unitfile(output / f"{outfile or plan.model}.iden")
+            )
+            teff = line_order_teff(plan.modelinput)
+            cull(plan.links["fort.19"], self.culled, iden, teff, self.margin)
+            tmp = self.workdir / f".reference.{uuid.uuid4()}"
+            tmp.write_text(json.dumps({**params, "margin": self.margin}))
+            os.replace(tmp, self.workdir / "reference.json")
+            self.rebuilds += 1
+        return rebuild
@@ -0,0 +1,253 @@
+import dataclasses
+import json
+from pathlib import Path
+from typing import Any, Iterable
+
+import numpy as np
+
+from synspec import units, utils
+from synspec.synspec import RunPlan, Synspec, tempdir
+
+# Elements whose lines are not (only) in the line list, or which change the
+# continuum or the electron density. Changing these requires a full run.
+FULL_RUN_ELEMENTS = {1, 2}
+
+
+class DifferentialSynthesis:
+    """Re-synthesises only the wavelength windows affected by abundance
+    changes.
+
+    The first run synthesises the full spectrum and caches it along with a
+    snapshot of its inputs. When the abundances of some elements (in the atoms
+    block of the input file or in fort.56) are all that changed since the cached
+    run, synspec is only run on windows around the lines of those elements in
+    fort.19, and the results are spliced into the cached spectrum. Any other
+    change to the inputs causes a full run.
+
+    The continuum and the lines of the changed elements outside the windows
+    are assumed not to change, so choose `padding` to cover the line wings.
+    Only the .spec and .cont outputs are kept up to date.
+
+    The inputs are those of Synspec.plan, so the snapshot tracks the files
+    that are actually run.
+
+    synspec: Synspec object to run with.
+    model: path to the model (without extension), relative to basedir.
+    cachedir: directory for the cached run, relative to basedir.
+    padding: distance in Angstrom from a line to the edge of its window. Runs
+             on a window extend another `padding` beyond it.
+    basedir: directory relative paths are resolved against, see Synspec.run.
+    """
+
+    def __init__(
+        self,
+        synspec: Synspec,
+        model: str,
+        cachedir: str | Path,
+        padding: float = 5.0,
+        basedir: str | Path | None = None,
+    ):
+        self.synspec = synspec
+        self.basedir = (
+            Path.cwd().resolve() if basedir is None else Path(basedir).resolve()
+        )
+        self.modelpath = (self.basedir / model).resolve()
+        self.cachedir = (self.basedir / cachedir).resolve()
+        self.cachedir.mkdir(parents=True, exist_ok=True)
+        self.padding = padding
+        self.windows: list[tuple[float, float]] | None = None
+        self._lines: tuple[str, list[units.Line]] | None = None
+
+    @property
+    def model(self) -> str:
+        return self.modelpath.name
+
+    def run(
+        self, outdir: str | Path | None = None, outfile: str | None = None
+    ) -> units.Spectrum:
+        """Synthesises the spectrum, re-using the cached run where possible.
+
+        outdir: directory to copy the .spec and .cont files to, relative to
+                basedir, stored in the output format of synspec (see
+                units.storeunit).
+        outfile: name (without extension) of the output files.
+        Returns the spectrum. The windows that were synthesised are left in
+        `windows`, which is None after a full run.
+        """
+        plan = self.synspec.plan(str(self.modelpath), self.basedir)
+        snapshot = utils.jsonable(self._snapshot(plan))
+        reference = self._load_reference()
+        elements = None
+        if reference is not None:
+            elements = changed_elements(reference, snapshot)
+        if elements is None or elements & FULL_RUN_ELEMENTS:
+            spectrum = self._run_full()
+            self.windows = None
+        else:
+            config = plan.config
+            self.windows = affected_windows(
+                self._linelist(plan.links["fort.19"]),
+                elements,
+                config.alam0,
+                config.alam1,
+                self.padding,
+            )
+            spectrum = units.read7f(self.cachedir / "reference.spec")
+            for window in self.windows:
+                spectrum = splice(spectrum, self._run_window(config, window), *window)
+            with tempdir() as tmp:
+                units.write7f(tmp / "reference.spec", spectrum)
+                units.storeunit(
+                    tmp / "reference.spec",
+                    self.cachedir / "reference.spec",
+                    self.synspec.output_format,
+                )
+        (self.cachedir / "reference.json").write_text(json.dumps(snapshot))
+
+        if outdir is not None:
+            outdir = self.basedir / outdir
+            outdir.mkdir(exist_ok=True)
+            if outfile is None:
+                outfile = self.model
+            for ext in ["spec", "cont"]:
+                units.storeunit(
+                    self.cachedir / f"reference.{ext}",
+                    outdir / f"{outfile}.{ext}",
+                    self.synspec.output_format,
+                )
+        return spectrum
+
+    def _run_full(self) -> units.Spectrum:
+        (self.cachedir / "reference.json").unlink(missing_ok=True)
+        self.synspec.run(
+            str(self.modelpath),
+            rundir=None,
+            outdir=self.cachedir,
+            outfile="reference",
+            basedir=self.basedir,
+        )
+        return units.read7f(self.cachedir / "reference.spec")
+
+    def _run_window(
+        self, config: units.SynConfig, window: tuple[float, float]
+    ) -> units.Spectrum:
+        config = dataclasses.replace(
+            config, alam0=window[0] - self.padding, alam1=window[1] + self.padding
+        )
+        with tempdir() as tmp:
+            units.write55f(tmp / "fort.55", config)
+            self.synspec.run(
+                str(self.modelpath),
+                rundir=None,
+                outdir=tmp,
+                outfile="window",
+                basedir=self.basedir,
+                links={"fort.55": tmp / "fort.55"},
+            )
+            return units.read7f(tmp / "window.spec")
+
+    def _snapshot(self, plan: RunPlan) -> dict[str, Any]:
+        """The inputs of a planned run, with the abundances separated out.
+        Files other than the parsed ones are tracked by version (see
+        utils.statkey).
+        """
+        modelinput = dict(plan.modelinput)
+        abundances: dict[str, list] = {}
+        atoms = []
+        for iatom, atom in enumerate(modelinput.pop("atoms"), start=1):
+            atom = dict(atom)
+            abundances[str(iatom)] = [atom.pop("abd"), None]
+            atoms.append(atom)
+        modelinput["atoms"] = atoms
+        if plan.config.ichemc != 0 and "fort.56" in plan.links:
+            for abundance in units.read56f(plan.links["fort.56"]):
+                abundances.setdefault(str(abundance.iatom), [None, None])
+                abundances[str(abundance.iatom)][1] = abundance.abn
+        parsed = {f"{plan.model}.5", "fort.55", "fort.56"}
+        return {
+            "input": modelinput,
+            "abundances": abundances,
+            "config": dataclasses.asdict(plan.config),
+            "files": {
+                name: utils.statkey(src) if src.exists() else None
+                for name, src in sorted(plan.links.items())
+                if name not in parsed
+            },
+        }
+
+    def _load_reference(self) -> dict[str, Any] | None:
+        try:
+            return json.loads((self.cachedir / "reference.json").read_text())
+        except FileNotFoundError:
+            return None
+
+    def _linelist(self, file: Path) -> list[units.Line]:
+        """The line list, read once for as long as fort.19 doesn't change."""
+        key = utils.statkey(file)
+        if self._lines is None or self._lines[0] != key:
+            self._lines = (key, units.read19f(file))
+        return self._lines[1]
+
+
+def changed_elements(old: dict[str, Any], new: dict[str, Any]) -> set[int] | None:
+    """Returns the atomic numbers of the elements whose abundance differs
+    between two input snapshots, or None if anything else differs.
+    """
+    if any(old[key] != new[key] for key in ("input", "config", "files")):
+        return None
+    iatoms = set(old["abundances"]) | set(new["abundances"])
+    return {
+        int(iatom)
+        for iatom in iatoms
+        if old["abundances"].get(iatom) != new["abundances"].get(iatom)
+    }
+
+
+def affected_windows(
+    lines: Iterable[units.Line],
+    elements: set[int],
+    alam0: float,
+    alam1: float,
+    padding: float,
+) -> list[tuple[float, float]]:
+    """Returns the windows (in Angstrom) within alam0 to alam1 containing the
+    lines of the given elements, padded on both sides. Windows closer than
+    twice the padding are merged.
+    """
+    wavelengths = sorted(
+        line.wavelength
+        for line in lines
+        if line.iatom in elements
+        and alam0 - padding <= line.wavelength <= alam1 + padding
+    )
+    windows: list[tuple[float, float]] = []
+    for wavelength in wavelengths:
+        low = max(wavelength - padding, alam0)
+        high = min(wavelength + padding, alam1)
+        if windows and low - windows[-1][1] < 2 * padding:
+            windows[-1] = (windows[-1][0], high)
+        else:
+            windows.append((low, high))
+    return windows
+
+
+def splice(
+    spectrum: units.Spectrum, patch: units.Spectrum, low: float, high: float
+) -> units.Spectrum:
+    """Replaces the part of the spectrum from low to high with the same part of
+    the patch.
+    """
+    i0 = np.searchsorted(spectrum.wavelength, low, side="left")
+    i1 = np.searchsorted(spectrum.wavelength, high, side="right")
+    j0 = np.searchsorted(patch.wavelength, low, side="left")
+    j1 = np.searchsorted(patch.wavelength, high, side="right")
+    return units.Spectrum(
+        np.concatenate(
+            [
+                spectrum.wavelength[:i0],
+                patch.wavelength[j0:j1],
+                spectrum.wavelength[i1:],
+            ]
+        ),
+        np.concatenate([spectrum.flux[:i0], patch.flux[j0:j1], spectrum.flux[i1:]]),
+    )
@@ -0,0 +1,372 @@
+import dataclasses
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Mapping, Sequence
+
+import numpy as np
+
+from synspec import atmospheres, units
+from synspec.differential import FULL_RUN_ELEMENTS, affected_windows, splice
+from synspec.synspec import Synspec
+
+TEFF = "teff"
+GRAV = "grav"
+VTB = "vtb"
+ABUNDANCE_PREFIX = "abd:"
+
+
+def abundance(iatom: int) -> str:
+    """Name of the parameter for the abundance (abd in the input file) of the
+    element with the given atomic number.
+    """
+    return f"{ABUNDANCE_PREFIX}{iatom}"
+
+
+def _element(name: str) -> int | None:
+    """Atomic number of an abundance parameter, None for other parameters."""
+    if name.startswith(ABUNDANCE_PREFIX):
+        return int(name[len(ABUNDANCE_PREFIX) :])  # noqa: E203
+    return None
+
+
+@dataclass(frozen=True)
+class FitResult:
+    """Outcome of a fit.
+
+    names: names of the fitted parameters.
+    values: best-fit values of the parameters.
+    covariance: covariance matrix of the parameters, from the Jacobian at the
+                best fit. Scale it by the reduced chi^2 if sigma was not known.
+    chi2: chi^2 of the best fit.
+    dof: degrees of freedom, the number of points less the parameters.
+    iterations: Levenberg-Marquardt iterations done.
+    runs: synspec runs done; the others were found in the cache.
+    converged: whether chi^2 stopped improving within max_iterations.
+    """
+
+    names: tuple[str, ...]
+    values: np.ndarray
+    covariance: np.ndarray
+    chi2: float
+    dof: int
+    iterations: int
+    runs: int
+    converged: bool
+
+    @property
+    def parameters(self) -> dict[str, float]:
+        return dict(zip(self.names, map(float, self.values)))
+
+    @property
+    def errors(self) -> dict[str, float]:
+        return dict(zip(self.names, map(float, np.sqrt(np.diag(self.covariance)))))
+
+
+# A synthetic spectrum and its continuum.
+Synthesis = tuple[units.Spectrum, units.Spectrum]
+
+
+class SpectrumFit:
+    """Fits synthetic spectra to an observed one by varying abundances, Teff,
+    log g and vtb with the Levenberg-Marquardt method.
+
+    The columns of the Jacobian are evaluated by finite differences, all at
+    once in a thread pool, so an iteration takes about as long as two synspec
+    runs given as many cores as parameters. For the abundance of an element
+    that only has lines (see differential.FULL_RUN_ELEMENTS), the perturbed
+    spectrum is only synthesised in windows around the lines of the element
+    and spliced into the unperturbed one. Every synthesis is cached in
+    workdir by its parameters, so repeated points, and fits restarted with
+    the same workdir, don't run synspec again.
+
+    When fort.55 sets ichemc, the abundances fort.56 lists override those of
+    the input file. The abundance parameter of such an element is its value
+    in fort.56, which is rewritten for each synthesis instead.
+
+    synspec: Synspec object to run with. It is shared by the threads.
+    model: path to the model (without extension), relative to basedir.
+    observed: the observed spectrum, in Angstrom.
+    steps: finite difference step of each parameter, by name (TEFF, GRAV,
+           VTB or abundance(iatom)). These are the parameters fitted.
+    sigma: uncertainty of the observed fluxes.
+    grid: model atmospheres (paths without extension) to interpolate with
+          atmospheres.interpolate when fitting Teff or log g.
+    workdir: directory for the synthesised spectra.
+    basedir: directory relative paths are resolved against, see Synspec.run.
+    workers: threads running synspec. Defaults to the number of parameters.
+    normalize: fit the flux divided by the continuum.
+    padding: padding of the windows around lines, see DifferentialSynthesis.
+    """
+
+    def __init__(
+        self,
+        synspec: Synspec,
+        model: str | Path,
+        observed: units.Spectrum,
+        steps: Mapping[str, float],
+        workdir: str | Path,
+        sigma: float | np.ndarray = 1.0,
+        grid: Sequence[str | Path] = (),
+        basedir: str | Path | None = None,
+        workers: int | None = None,
+        normalize: bool = True,
+        padding: float = 5.0,
+    ):
+        self.synspec = synspec
+        self.observed = observed
+        self.sigma = np.broadcast_to(
+            np.asarray(sigma, dtype=float), observed.flux.shape
+        )
+        self.names = tuple(steps)
+        self.steps = np.array([steps[name] for name in self.names], dtype=float)
+        self.workdir = Path(workdir).resolve()
+        self.workdir.mkdir(parents=True, exist_ok=True)
+        self.workers = workers if workers is not None else len(self.names)
+        self.normalize = normalize
+        self.padding = padding
+        for name in self.names:
+            if name not in (TEFF, GRAV, VTB) and _element(name) is None:
+                raise ValueError(f"Unknown parameter: {name}")
+
+        self.plan = synspec.plan(model, basedir)
+        self.basedir = self.plan.basedir
+        self.input = self.plan.links[f"{self.plan.model}.5"].read_text()
+        self.config = self.plan.config
+        self.grid: dict[atmospheres.GridPoint, units.Atmosphere] = {}
+        if TEFF in self.names or GRAV in self.names:
+            if not grid:
+                raise ValueError("Fitting Teff or log g needs a grid of models")
+            for path in grid:
+                modelinput = units.readinput(Path(f"{path}.5").read_text())
+                point = (float(modelinput["teff"]), float(modelinput["grav"]))
+                self.grid[point] = units.read8f(f"{path}.7")
+        self.lines = units.read19f(self.plan.links["fort.19"])
+        # Abundances that override those of the input file, see units.read56.
+        self.abundances: dict[int, float] = {}
+        if "fort.56" in self.plan.links:
+            self.abundances = dict(units.read56f(self.plan.links["fort.56"]))
+        self.runs = 0
+        self._cache: dict[str, Synthesis] = {}
+        self._lock = threading.Lock()
+
+    def initial(self) -> dict[str, float]:
+        """The values of the parameters in the model."""
+        modelinput = self.plan.modelinput
+        values = {}
+        for name in self.names:
+            if name == VTB:
+                values[name] = self.config.vtb
+            elif name in (TEFF, GRAV):
+                values[name] = float(modelinput[name])
+            else:
+                iatom = _element(name)
+                assert iatom is not None
+                if iatom in self.abundances:
+                    values[name] = self.abundances[iatom]
+                else:
+                    values[name] = float(modelinput["atoms"][iatom - 1]["abd"])
+        return values
+
+    def fit(
+        self,
+        initial: Mapping[str, float] | None = None,
+        max_iterations: int = 20,
+        tol: float = 1e-4,
+    ) -> FitResult:
+        """Fits the parameters, starting from initial (by default the values
+        in the model). Stops when chi^2 improves by less than the fraction
+        tol in an iteration.
+        """
+        start = {**self.initial(), **(initial or {})}
+        x = np.array([start[name] for name in self.names], dtype=float)
+        with ThreadPoolExecutor(self.workers) as pool:
+            flux = self._flux(x)
+            chi2 = self._chi2(flux)
+            lam = 1e-3
+            converged = False
+            iterations = 0
+            jacobian_at = None
+            for iterations in range(1, max_iterations + 1):
+                jac = self._jacobian(pool, x)
+                jacobian_at = x
+                resid = (self.observed.flux - flux) / self.sigma
+                a = jac.T @ jac
+                g = jac.T @ resid
+                while lam < 1e10:
+                    damped = a + lam * np.diag(np.diag(a))
+                    dx = np.linalg.lstsq(damped, g, rcond=None)[0]
+                    trial = self._flux(x + dx)
+                    trial_chi2 = self._chi2(trial)
+                    if trial_chi2 < chi2:
+                        break
+                    lam *= 10
+                else:
+                    converged = True
+                    break
+                x, flux, lam = x + dx, trial, lam / 10
+                improvement = (chi2 - trial_chi2) / chi2
+                chi2 = trial_chi2
+                if improvement < tol:
+                    converged = True
+                    break
+            if jacobian_at is None or not np.array_equal(jacobian_at, x):
+                jac = self._jacobian(pool, x)
+        covariance = np.linalg.pinv(jac.T @ jac)
+        return FitResult(
+            self.names,
+            x,
+            covariance,
+            float(chi2),
+            self.observed.flux.size - len(self.names),
+            iterations,
+            self.runs,
+            converged,
+        )
+
+    def _chi2(self, flux: np.ndarray) -> float:
+        return float(np.sum(((self.observed.flux - flux) / self.sigma) ** 2))
+
+    def _jacobian(self, pool: ThreadPoolExecutor, x: np.ndarray) -> np.ndarray:
+        """Derivatives of the model fluxes, divided by sigma, by forward
+        differences, with the columns evaluated concurrently.
+        """
+        center = self._synthesis(x)
+        columns = []
+        for j, step in enumerate(self.steps):
+            perturbed = x.copy()
+            perturbed[j] += step
+            columns.append(pool.submit(self._perturbed, perturbed, j, center))
+        f0 = self._observe(center)
+        return (
+            np.column_stack(
+                [(f.result() - f0) / step for f, step in zip(columns, self.steps)]
+            )
+            / self.sigma[:, np.newaxis]
+        )
+
+    def _perturbed(self, x: np.ndarray, j: int, center: Synthesis) -> np.ndarray:
+        """Model fluxes with parameter j perturbed, synthesised only in the
+        windows around the lines of the element if it is an abundance.
+        """
+        iatom = _element(self.names[j])
+        if iatom is None or iatom in FULL_RUN_ELEMENTS:
+            return self._flux(x)
+        spectrum, continuum = center
+        windows = affected_windows(
+            self.lines, {iatom}, self.config.alam0, self.config.alam1, self.padding
+        )
+        for window in windows:
+            patch, _ = self._synthesis(x, window)
+            spectrum = splice(spectrum, patch, *window)
+        return self._observe((spectrum, continuum))
+
+    def _flux(self, x: np.ndarray) -> np.ndarray:
+        return self._observe(self._synthesis(x))
+
+    def _observe(self, synthesis: Synthesis) -> np.ndarray:
+        """The synthetic fluxes at the observed wavelengths."""
+        spectrum, continuum = synthesis
+        flux = spectrum.flux
+        if self.normalize:
+            flux = flux / np.interp(
+                spectrum.wavelength, continuum.wavelength, continuum.flux
+            )
+        return np.interp(self.observed.wavelength, spectrum.wavelength, flux)
+
+    def _synthesis(
+        self, x: np.ndarray, window: tuple[float, float] | None = None
+    ) -> Synthesis:
+        """Synthesises the spectrum for the parameters x, over the window (in
+        Angstrom, padded) if given, or looks it up in the cache.
+        """
+        values = dict(zip(self.names, map(float, x)))
+        key = hashlib.sha256(
+            json.dumps([values, window], sort_keys=True).encode()
+        ).hexdigest()[:16]
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        rundir = self.workdir / key
+        try:
+            synthesis = (
+                units.read7f(rundir / "fit.spec"),
+                units.read7f(rundir / "fit.cont"),
+            )
+        except FileNotFoundError:
+            self._prepare(rundir, values, window)
+            self.synspec.run(
+                str(rundir / "fit"),
+                rundir=None,
+                outdir=rundir,
+                outfile="fit",
+                basedir=self.basedir,
+                links=self._links(rundir, values),
+            )
+            synthesis = (
+                units.read7f(rundir / "fit.spec"),
+                units.read7f(rundir / "fit.cont"),
+            )
+            with self._lock:
+                self.runs += 1
+        with self._lock:
+            self._cache[key] = synthesis
+        return synthesis
+
+    def _prepare(
+        self,
+        rundir: Path,
+        values: Mapping[str, float],
+        window: tuple[float, float] | None,
+    ) -> None:
+        """Writes the input files of a synthesis to rundir."""
+        rundir.mkdir(exist_ok=True)
+        abundances = {
+            iatom: value
+            for name, value in values.items()
+            if (iatom := _element(name)) is not None
+        }
+        text = units.write5abundances(
+            self.input,
+            {
+                iatom: value
+                for iatom, value in abundances.items()
+                if iatom not in self.abundances
+            },
+        )
+        if self.abundances:
+            fort56 = {
+                iatom: abundances.get(iatom, abn)
+                for iatom, abn in self.abundances.items()
+            }
+            units.write56f(rundir / "fort.56", list(fort56.items()))
+        if TEFF in values or GRAV in values:
+            modelinput = self.plan.modelinput
+            teff = values.get(TEFF, float(modelinput[TEFF]))
+            grav = values.get(GRAV, float(modelinput[GRAV]))
+            text = units.write5header(text, teff, grav)
+            units.write8f(
+                rundir / "fit.7", atmospheres.interpolate(self.grid, teff, grav)
+            )
+        (rundir / "fit.5").write_text(text)
+        config = self.config
+        if VTB in values:
+            config = dataclasses.replace(config, vtb=values[VTB])
+        if window is not None:
+            config = dataclasses.replace(
+                config,
+                alam0=window[0] - self.padding,
+                alam1=window[1] + self.padding,
+            )
+        units.write55f(rundir / "fort.55", config)
+
+    def _links(self, rundir: Path, values: Mapping[str, float]) -> dict[str, Path]:
+        links = {"fort.55": rundir / "fort.55"}
+        if self.abundances:
+            links["fort.56"] = rundir / "fort.56"
+        if TEFF not in values and GRAV not in values:
+            links["{model}.7"] = self.plan.links[f"{self.plan.model}.7"]
+        return links
@@ -0,0 +1,85 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any
+
+
+class Journal:
+    """An append-only journal of the jobs of a batch, for resuming it after a
+    crash.
+
+    Every job gets a "start" record when it is submitted and an "end" record,
+    with its result, when it finishes. Records are json lines carrying the job
+    name, the hash of its inputs and the time. Each record is written with a
+    single append, so it survives the process being killed; the journal is
+    fsync'd at most every `sync_interval` seconds and when it is closed, so
+    records of the last interval may be lost if the machine goes down. Jobs
+    whose end record is lost are just run again.
+
+    A record torn by a crash at the end of the journal is dropped when the
+    journal is opened.
+    """
+
+    def __init__(self, path: str | Path, sync_interval: float = 1.0):
+        self.path = Path(path)
+        self.sync_interval = sync_interval
+        self.records: dict[str, dict[str, Any]] = {}  # last record of each job
+        created = not self.path.exists()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        if created:
+            _fsync_dir(self.path.parent)
+        self._load()
+        self._synced = time.monotonic()
+
+    def _load(self) -> None:
+        data = self.path.read_bytes()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            os.ftruncate(self._fd, end)
+            os.fsync(self._fd)
+        for line in data[:end].splitlines():
+            record = json.loads(line)
+            self.records[record["name"]] = record
+
+    def last(self, name: str) -> dict[str, Any] | None:
+        """Returns the last record of the named job, if any."""
+        return self.records.get(name)
+
+    def started(self, name: str, hash: str) -> None:
+        self._append({"event": "start", "name": name, "hash": hash})
+
+    def finished(self, name: str, hash: str, result: dict[str, Any]) -> None:
+        self._append({**result, "event": "end", "name": name, "hash": hash})
+
+    def _append(self, record: dict[str, Any]) -> None:
+        record["time"] = time.time()
+        os.write(self._fd, (json.dumps(record) + "\n").encode())
+        self.records[record["name"]] = record
+        if time.monotonic() - self._synced >= self.sync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        os.fsync(self._fd)
+        self._synced = time.monotonic()
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            self.sync()
+            os.close(self._fd)
+            self._fd = -1
+
+    def __enter__(self) -> "Journal":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def _fsync_dir(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,144 @@
+import errno
+import json
+import os
+import resource
+import shutil
+import signal
+import struct
+import sys
+from dataclasses import asdict, dataclass
+from typing import Any, Sequence
+
+# Seconds of CPU time between the soft limit (SIGXCPU) and the hard limit
+# (SIGKILL), for processes that ignore SIGXCPU.
+CPU_GRACE = 5
+# Written to standard error by the wrapper once the limits are applied (see
+# main): what the process writes after it is what ran under the limits.
+APPLIED = "synspec.limits: limits applied"
+# What failing allocations write to standard error: strerror(ENOMEM), which
+# the gfortran runtime, the dynamic loader and the wrapper print, and
+# Python's MemoryError.
+MEMORY_ERRORS = ("Cannot allocate memory", "MemoryError")
+
+
+@dataclass(frozen=True)
+class ResourceLimits:
+    """Resource limits for a synspec process.
+
+    memory: address space limit in bytes (RLIMIT_AS).
+    cpu: CPU time limit in seconds (RLIMIT_CPU).
+    fsize: limit in bytes on the size of files written (RLIMIT_FSIZE).
+    nice: niceness increment.
+    cpus: CPUs to pin the process to.
+    """
+
+    memory: int | None = None
+    cpu: int | None = None
+    fsize: int | None = None
+    nice: int = 0
+    cpus: tuple[int, ...] | None = None
+
+    def apply(self) -> None:
+        """Applies the limits to the current process. Used by the wrapper the
+        synspec subprocess is started through, see command.
+        """
+        if self.memory is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (self.memory, self.memory))
+        if self.cpu is not None:
+            resource.setrlimit(resource.RLIMIT_CPU, (self.cpu, self.cpu + CPU_GRACE))
+        if self.fsize is not None:
+            resource.setrlimit(resource.RLIMIT_FSIZE, (self.fsize, self.fsize))
+        if self.nice:
+            os.nice(self.nice)
+        if self.cpus is not None:
+            os.sched_setaffinity(0, self.cpus)
+
+    def exceeded(self, errors: str) -> bool:
+        """Whether a failed process ran out of memory under the memory limit,
+        judging by its standard error: a failed allocation reported after the
+        wrapper applied the limits (see APPLIED and MEMORY_ERRORS).
+        """
+        if self.memory is None or APPLIED not in errors:
+            return False
+        errors = errors.split(APPLIED, 1)[1]
+        return any(message in errors for message in MEMORY_ERRORS)
+
+    def command(self, args: Sequence[str]) -> list[str]:
+        """The command running args with these limits: a Python process that
+        applies them and then executes args in its place (see main). Unlike a
+        preexec_fn, it is safe to start from any thread. This file is run as a
+        script, which only needs the standard library, so it works wherever
+        the package is imported from.
+        """
+        limits = json.dumps(self.to_dict())
+        return [sys.executable, "-S", os.path.abspath(__file__), limits, *args]
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "ResourceLimits":
+        data = dict(data)
+        if data.get("cpus") is not None:
+            data["cpus"] = tuple(data["cpus"])
+        return cls(**data)
+
+
+def image_size(program: str) -> int | None:
+    """Bytes of address space the loadable segments of an executable span,
+    static arrays included, or None if it isn't a little-endian 64-bit ELF
+    file (e.g. a script).
+    """
+    path = shutil.which(program)
+    if path is None:
+        return None
+    with open(path, "rb") as f:
+        header = f.read(64)
+        if len(header) < 64 or header[:6] != b"\x7fELF\x02\x01":
+            return None
+        (phoff,) = struct.unpack_from("<Q", header, 32)
+        phentsize, phnum = struct.unpack_from("<HH", header, 54)
+        f.seek(phoff)
+        table = f.read(phentsize * phnum)
+    spans = []
+    for i in range(phnum):
+        p_type, _, _, vaddr, _, _, memsz = struct.unpack_from(
+            "<IIQQQQQ", table, i * phentsize
+        )
+        if p_type == 1:  # PT_LOAD
+            spans.append((vaddr, vaddr + memsz))
+    if not spans:
+        return None
+    return max(end for _, end in spans) - min(start for start, _ in spans)
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    """Applies the limits given as json (see ResourceLimits.to_dict) and
+    executes the rest of the arguments: limits program [args...].
+
+    Writes APPLIED to standard error once the limits are applied. An
+    executable too large to load under the memory limit would be killed by
+    SIGSEGV while loading, without a word; it isn't started, and the wrapper
+    fails with strerror(ENOMEM) instead.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    # Python ignores these, and ignored signals stay ignored across exec;
+    # restore them as Popen(restore_signals=True) does.
+    for signum in (signal.SIGPIPE, signal.SIGXFSZ):
+        signal.signal(signum, signal.SIG_DFL)
+    limits = ResourceLimits.from_dict(json.loads(argv[0]))
+    limits.apply()
+    print(APPLIED, file=sys.stderr, flush=True)
+    program = argv[1]
+    try:
+        size = image_size(program) if limits.memory is not None else None
+        if size is not None and limits.memory is not None and size > limits.memory:
+            raise OSError(errno.ENOMEM, os.strerror(errno.ENOMEM))
+        os.execvp(program, list(argv[1:]))
+    except OSError as e:
+        print(f"{program}: {e.strerror}", file=sys.stderr)
+        sys.exit(127 if e.errno == errno.ENOENT else 126)
+
+
+if __name__ == "__main__":
+    main()
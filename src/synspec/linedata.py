@@ -0,0 +1,290 @@
+import argparse
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import IO, Callable, Iterable, Iterator, Sequence
+
+from synspec import linelist, units, utils
+
+FORMATS = ("vald", "kurucz")
+# Lines converted and written at a time.
+CHUNK_LINES = 100_000
+# Bytes hashed at a time.
+CHUNK_SIZE = 1024**2
+# Part of the keys of cached conversions; bump it when conversions change.
+VERSION = 1
+# cm^-1 per eV.
+EV = 8065.54394
+
+
+def species(name: str) -> float | None:
+    """Returns the species code of fort.19 (atomic number + charge / 100) of a
+    VALD species name such as "Fe 2", or None for molecules.
+    """
+    tokens = name.split()
+    if len(tokens) != 2 or tokens[0] not in utils.elements[1:]:
+        return None
+    return utils.elements.index(tokens[0]) + (int(tokens[1]) - 1) / 100
+
+
+def vacuum_to_air(wavelength: float) -> float:
+    """Converts a vacuum wavelength in Angstrom to air (Morton 2000) above
+    2000 Angstrom, the convention of synspec.
+    """
+    if wavelength < 2000:
+        return wavelength
+    s2 = (1e4 / wavelength) ** 2
+    n = 1 + 8.34254e-5 + 2.406147e-2 / (130 - s2) + 1.5998e-4 / (38.9 - s2)
+    return wavelength / n
+
+
+def _line(
+    wavelength: float,
+    anum: float,
+    gf: float,
+    e1: float,
+    j1: float,
+    e2: float,
+    j2: float,
+    damping: Sequence[float],
+) -> units.Line:
+    """A Line from a wavelength in Angstrom and energies in cm^-1 of the levels
+    in either order.
+    """
+    if e1 > e2:
+        e1, j1, e2, j2 = e2, j2, e1, j1
+    agam, gs, gw = damping
+    return units.Line(wavelength / 10, anum, gf, e1, j1, e2, j2, agam, gs, gw)
+
+
+def read_vald(f: IO) -> Iterator[units.Line]:
+    """Streams the atomic lines of a VALD3 "extract all" or "extract element"
+    list in short format. Energies in eV or cm^-1 and vacuum wavelengths (in
+    Angstrom or nm) are converted as their column headers state. Molecular
+    lines are skipped, as are van der Waals constants in the ABO
+    (sigma.alpha) notation, which synspec can't use.
+    """
+    wavelength_scale, energy_scale, vacuum = 1.0, EV, False
+    for line in f:
+        if not line.startswith("'"):
+            if "WL_" in line and "E_low" in line:
+                wavelength_scale = 10.0 if "(nm)" in line else 1.0
+                energy_scale = 1.0 if "E_low(cm" in line else EV
+                vacuum = "WL_vac" in line
+            elif "Excit(" in line:
+                raise ValueError(
+                    "VALD extract stellar lists lack J; use extract all or element"
+                )
+            continue
+        fields = line.split(",")
+        if len(fields) < 14:
+            continue  # A level description of a long format list.
+        anum = species(fields[0].strip().strip("'"))
+        if anum is None:
+            continue
+        wl, gf, el, jl, eu, ju = map(float, fields[1:7])
+        rad, stark, waals = map(float, fields[10:13])
+        wl *= wavelength_scale
+        if vacuum:
+            wl = vacuum_to_air(wl)
+        damping = (rad, stark, waals if waals <= 0 else 0.0)
+        yield _line(wl, anum, gf, el * energy_scale, jl, eu * energy_scale, ju, damping)
+
+
+def read_kurucz(f: IO) -> Iterator[units.Line]:
+    """Streams the atomic lines of a Kurucz line list (gfall format, fixed
+    columns, wavelengths in nm). Molecular lines are skipped. Predicted
+    levels, with negative energies, are taken at their absolute energies.
+    """
+    for line in f:
+        if not line.strip():
+            continue
+        code = float(line[18:24])
+        if code >= 100:
+            continue
+        yield _line(
+            float(line[0:11]) * 10,
+            round(code, 2),
+            float(line[11:18]),
+            abs(float(line[24:36])),
+            float(line[36:41]),
+            abs(float(line[52:64])),
+            float(line[64:69]),
+            (float(line[80:86]), float(line[86:92]), float(line[92:98])),
+        )
+
+
+READERS: dict[str, Callable[[IO], Iterator[units.Line]]] = {
+    "vald": read_vald,
+    "kurucz": read_kurucz,
+}
+
+
+def detect(file: str | Path) -> str:
+    """Guesses the format of a line list from its first lines."""
+    with units.openunit(file) as f:
+        for _, line in zip(range(5), f):
+            if line.startswith("'") or "Wavelength region" in line:
+                return "vald"
+    return "kurucz"
+
+
+def _write(lines: Iterable[str], output: Path) -> int:
+    """Writes lines to output, CHUNK_LINES at a time, through a temporary file
+    moved into place. Returns the number of lines.
+    """
+    partial = output.with_name(f".{output.name}.{uuid.uuid4()}")
+    count = 0
+    try:
+        with open(partial, "w") as out:
+            chunk = []
+            for text in lines:
+                chunk.append(text)
+                if len(chunk) >= CHUNK_LINES:
+                    out.writelines(chunk)
+                    count += len(chunk)
+                    chunk = []
+            out.writelines(chunk)
+            count += len(chunk)
+        os.replace(partial, output)
+    finally:
+        partial.unlink(missing_ok=True)
+    return count
+
+
+def _inside(wavelength: float, window: tuple[float, float] | None) -> bool:
+    return window is None or window[0] <= wavelength <= window[1]
+
+
+def convert(
+    source: str | Path,
+    output: str | Path,
+    format: str | None = None,
+    window: tuple[float, float] | None = None,
+) -> int:
+    """Converts a VALD or Kurucz line list to a .19 file and returns the number
+    of lines written.
+
+    The source (which may be compressed, see units.openunit) is streamed and
+    written CHUNK_LINES at a time, so memory use doesn't depend on its size.
+    Lines keep the order of the source; see linelist.sortlines to sort them.
+
+    format: "vald" or "kurucz". Guessed from the contents by default.
+    window: range of wavelengths (in Angstrom) to convert the lines of.
+    """
+    if format is None:
+        format = detect(source)
+    if format not in READERS:
+        raise ValueError(f"Unknown line list format: {format}, expected {FORMATS}")
+    with units.openunit(source) as f:
+        return _write(
+            (
+                units.write19line(line)
+                for line in READERS[format](f)
+                if _inside(line.wavelength, window)
+            ),
+            Path(output),
+        )
+
+
+class LineCache:
+    """Cache of line lists converted to .19 files.
+
+    Conversions are keyed by the sha256 of the contents of the source, so
+    copies of a source share them, and by the format and window converted.
+    The hashes of sources are indexed by path, size and modification time, so
+    an unchanged source is only hashed once. Windows are cut from the full
+    conversion of the source when it is cached, without reading the source.
+    Concurrent conversions of the same list do the work twice but are safe.
+    """
+
+    def __init__(self, root: str | Path):
+        self.root = Path(root).resolve()
+        for sub in ("lines", "sources"):
+            (self.root / sub).mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+    def get(
+        self,
+        source: str | Path,
+        format: str | None = None,
+        window: tuple[float, float] | None = None,
+    ) -> Path:
+        """Returns the .19 file of the source, see convert, converting it
+        first if it isn't cached.
+        """
+        if format is None:
+            format = detect(source)
+        digest = self._hash(Path(source))
+        cached = self._path(digest, format, window)
+        if cached.exists():
+            self.hits += 1
+            return cached
+        self.misses += 1
+        full = self._path(digest, format, None)
+        if window is not None and full.exists():
+            with open(full) as f:
+                _write(
+                    (
+                        text
+                        for key, text in linelist.records(f)
+                        if _inside(key[0] * 10, window)
+                    ),
+                    cached,
+                )
+        else:
+            convert(source, cached, format, window)
+        return cached
+
+    def _path(
+        self, digest: str, format: str, window: tuple[float, float] | None
+    ) -> Path:
+        key = f"{digest}:{format}:{window}:{VERSION}"
+        return self.root / "lines" / f"{hashlib.sha256(key.encode()).hexdigest()}.19"
+
+    def _hash(self, source: Path) -> str:
+        """The sha256 of the contents of source, looked up by its statkey."""
+        index = self.root / "sources" / utils.statkey(source)
+        try:
+            return index.read_text()
+        except FileNotFoundError:
+            pass
+        digest = hashlib.sha256()
+        with open(source, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                digest.update(chunk)
+        tmp = index.with_name(f".{index.name}.{uuid.uuid4()}")
+        tmp.write_text(digest.hexdigest())
+        os.replace(tmp, index)
+        return digest.hexdigest()
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m synspec.linedata",
+        description="Convert a VALD or Kurucz line list to a fort.19 file.",
+    )
+    parser.add_argument("output", help="output .19 file")
+    parser.add_argument("source", help="VALD or Kurucz line list")
+    parser.add_argument("--format", choices=FORMATS, default=None)
+    parser.add_argument(
+        "--window",
+        nargs=2,
+        type=float,
+        metavar=("W0", "W1"),
+        help="only convert lines between W0 and W1 (Angstrom)",
+    )
+    parser.add_argument("--cache", default=None, help="directory of a LineCache")
+    args = parser.parse_args(argv)
+    window = None if args.window is None else (args.window[0], args.window[1])
+    if args.cache is None:
+        convert(args.source, args.output, args.format, window)
+    else:
+        cached = LineCache(args.cache).get(args.source, args.format, window)
+        utils.copyf(cached, args.output)
+
+
+if __name__ == "__main__":
+    main()
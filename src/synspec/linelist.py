@@ -0,0 +1,151 @@
+import argparse
+import heapq
+import itertools
+import os
+import tempfile
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+from typing import IO, Iterable, Iterator, Sequence, TextIO
+
+from synspec import units, utils
+
+# Lines sorted in memory at a time.
+CHUNK_LINES = 1_000_000
+# Sorted runs merged at a time, bounding the number of open files.
+FAN_IN = 64
+
+# A line of a .19 file (with its continuation line, if any) and its sort key.
+Record = tuple[tuple[float, ...], str]
+
+
+def records(f: IO) -> Iterator[Record]:
+    """Streams the lines of a .19 file with their keys: wavelength, species
+    and the energies and J of the lower and upper levels (J tells apart
+    fine structure components). A line with a nonzero inext is followed by a
+    continuation line, which is kept with it.
+    """
+    lines = iter(f)
+    for line in lines:
+        if not line.strip():
+            continue
+        tokens = line.split()
+        if len(tokens) < 10:
+            raise ValueError(f"unit 19 line has {len(tokens)} fields, 10 expected")
+        alam, anum, _, excl, ql, excu, qu = map(utils.fortfloat, tokens[:7])
+        text = line if line.endswith("\n") else line + "\n"
+        if len(tokens) > 10 and int(tokens[10]) != 0:
+            text += next(lines, "")
+        yield (alam, anum, excl, ql, excu, qu), text
+
+
+def _write_run(chunk: list[Record], directory: Path) -> Path:
+    chunk.sort(key=lambda record: record[0])
+    run = directory / f"run-{uuid.uuid4()}.19"
+    with open(run, "w") as f:
+        f.writelines(text for _, text in chunk)
+    return run
+
+
+def _merge(runs: Sequence[Path], out: TextIO, dedup: bool) -> None:
+    """Merges sorted runs into out, dropping repeated keys if dedup."""
+    with ExitStack() as stack:
+        streams = [records(stack.enter_context(open(run))) for run in runs]
+        merged = heapq.merge(*streams, key=lambda record: record[0])
+        if dedup:
+            merged = (
+                next(group) for _, group in itertools.groupby(merged, lambda r: r[0])
+            )
+        out.writelines(text for _, text in merged)
+
+
+def sortlines(
+    sources: Iterable[str | Path],
+    output: str | Path,
+    dedup: bool = True,
+    chunk_lines: int = CHUNK_LINES,
+    fan_in: int = FAN_IN,
+    tmpdir: str | Path | None = None,
+) -> None:
+    """Merges .19 files into one sorted by wavelength, with bounded memory.
+
+    The sources (which may be compressed, see units.openunit) are read as
+    streams and cut into chunks of chunk_lines lines, which are sorted in
+    memory and written to temporary runs. The runs are then merged, fan_in at
+    a time, the last merge writing the output in one sequential pass. Memory
+    use is bounded by chunk_lines, independent of the size of the sources.
+
+    dedup: drop all but the first of lines with the same wavelength, species
+           and levels.
+    tmpdir: directory for the runs, which take about the size of the sources.
+            Defaults to the system temporary directory.
+    The output is written to a temporary file next to it and moved into
+    place, so it can be one of the sources.
+    """
+    if chunk_lines < 1 or fan_in < 2:
+        raise ValueError("chunk_lines must be at least 1 and fan_in at least 2")
+    output = Path(output)
+    with tempfile.TemporaryDirectory(dir=tmpdir) as tmp:
+        directory = Path(tmp)
+        runs = []
+        for source in sources:
+            with units.openunit(source) as f:
+                chunk: list[Record] = []
+                for record in records(f):
+                    chunk.append(record)
+                    if len(chunk) >= chunk_lines:
+                        runs.append(_write_run(chunk, directory))
+                        chunk = []
+                if chunk:
+                    runs.append(_write_run(chunk, directory))
+        while len(runs) > fan_in:
+            merged = []
+            for i in range(0, len(runs), fan_in):
+                run = directory / f"run-{uuid.uuid4()}.19"
+                with open(run, "w") as out:
+                    _merge(runs[i : i + fan_in], out, dedup)  # noqa: E203
+                for old in runs[i : i + fan_in]:  # noqa: E203
+                    old.unlink()
+                merged.append(run)
+            runs = merged
+        partial = output.with_name(f".{output.name}.{uuid.uuid4()}")
+        try:
+            with open(partial, "w") as out:
+                _merge(runs, out, dedup)
+            os.replace(partial, output)
+        finally:
+            partial.unlink(missing_ok=True)
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m synspec.linelist",
+        description="Merge fort.19 line lists into one sorted by wavelength, "
+        "dropping duplicate lines.",
+    )
+    parser.add_argument("output", help="output .19 file")
+    parser.add_argument("sources", nargs="+", help="input .19 files")
+    parser.add_argument(
+        "--keep-duplicates", action="store_true", help="don't drop duplicates"
+    )
+    parser.add_argument(
+        "--chunk-lines",
+        type=int,
+        default=CHUNK_LINES,
+        help="lines sorted in memory at a time",
+    )
+    parser.add_argument("--fan-in", type=int, default=FAN_IN)
+    parser.add_argument("--tmpdir", default=None, help="directory for sorted runs")
+    args = parser.parse_args(argv)
+    sortlines(
+        args.sources,
+        args.output,
+        dedup=not args.keep_duplicates,
+        chunk_lines=args.chunk_lines,
+        fan_in=args.fan_in,
+        tmpdir=args.tmpdir,
+    )
+
+
+if __name__ == "__main__":
+    main()
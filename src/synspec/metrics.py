@@ -0,0 +1,201 @@
+import math
+import os
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Sequence, TypeVar
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+# Histogram buckets in seconds, from quick window runs to long full spectra.
+DEFAULT_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 600.0, 1800.0, 3600.0)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class _Family:
+    """A metric family: a named metric with one sample (set) per label set."""
+
+    type = ""
+
+    def __init__(self, metrics: "Metrics", name: str, help: str):
+        self.metrics = metrics
+        self.name = name
+        self.help = help
+        self.values: dict[Labels, float] = {}
+
+    def _key(self, labels: dict[str, str]) -> Labels:
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def samples(self) -> list[str]:
+        suffix = "_total" if self.type == "counter" else ""
+        return [
+            f"{self.name}{suffix}{_labels(key)} {_number(value)}"
+            for key, value in sorted(self.values.items())
+        ]
+
+
+class Counter(_Family):
+    type = "counter"
+
+    def inc(self, value: float = 1.0, **labels: str) -> None:
+        if value < 0:
+            raise ValueError("counters can only be increased")
+        key = self._key(labels)
+        with self.metrics.lock:
+            self.values[key] = self.values.get(key, 0.0) + value
+
+
+class Gauge(_Family):
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self.metrics.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(_Family):
+    type = "histogram"
+
+    def __init__(
+        self,
+        metrics: "Metrics",
+        name: str,
+        help: str,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(metrics, name, help)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.counts: dict[Labels, list[int]] = {}
+        self.sums: dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self.metrics.lock:
+            counts = self.counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.sums[key] = self.sums.get(key, 0.0) + value
+
+    def samples(self) -> list[str]:
+        lines = []
+        for key, counts in sorted(self.counts.items()):
+            for bound, count in zip(self.buckets, counts):
+                le = (("le", "+Inf" if math.isinf(bound) else _number(bound)),)
+                lines.append(f"{self.name}_bucket{_labels(key + le)} {count}")
+            lines.append(f"{self.name}_count{_labels(key)} {counts[-1]}")
+            lines.append(f"{self.name}_sum{_labels(key)} {_number(self.sums[key])}")
+        return lines
+
+
+_F = TypeVar("_F", bound=_Family)
+
+
+class Metrics:
+    """A thread-safe set of counters, gauges and histograms, exported in the
+    OpenMetrics text format for scraping by Prometheus and the like.
+
+    file: file to write the metrics to on every `publish`, for collection by
+          e.g. the node exporter's textfile collector.
+    """
+
+    def __init__(self, file: str | Path | None = None):
+        self.file = None if file is None else Path(file)
+        self.lock = threading.RLock()
+        self.families: dict[str, _Family] = {}
+
+    def counter(self, name: str, help: str = "") -> Counter:
+        return self._family(Counter, name, help)
+
+    def gauge(self, name: str, help: str = "") -> Gauge:
+        return self._family(Gauge, name, help)
+
+    def histogram(
+        self, name: str, help: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._family(Histogram, name, help, buckets)
+
+    def _family(self, cls: type[_F], name: str, help: str, *args: Any) -> _F:
+        """Returns the named family, creating it if it doesn't exist yet."""
+        with self.lock:
+            if name not in self.families:
+                self.families[name] = cls(self, name, help, *args)
+            family = self.families[name]
+        if not isinstance(family, cls):
+            raise TypeError(f"{name} is a {family.type}, not a {cls.type}")
+        return family
+
+    def render(self) -> str:
+        """Returns the metrics in the OpenMetrics text format."""
+        lines = []
+        with self.lock:
+            for name, family in sorted(self.families.items()):
+                lines.append(f"# TYPE {name} {family.type}")
+                if family.help:
+                    lines.append(f"# HELP {name} {family.help}")
+                lines.extend(family.samples())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def publish(self) -> None:
+        """Writes the metrics to the file, if any, atomically."""
+        if self.file is None:
+            return
+        self.file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.file.with_name(f".{self.file.name}.{uuid.uuid4()}")
+        tmp.write_text(self.render())
+        os.replace(tmp, self.file)
+
+
+class MetricsServer:
+    """Serves metrics over HTTP in a background thread, as a context manager.
+
+    port: port to listen on. 0 picks a free port, see `port`.
+    host: address to listen on. Defaults to the local host only.
+    """
+
+    def __init__(self, metrics: Metrics, port: int = 0, host: str = "127.0.0.1"):
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args: object) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def __enter__(self) -> "MetricsServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+
+def _labels(key: Labels) -> str:
+    if not key:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in key
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,78 @@
+import re
+from pathlib import Path
+from typing import NamedTuple, Sequence
+
+# Messages after which synspec produces no useful output. Pass these, or your
+# own, as abort_patterns to Synspec to abort runs early.
+FATAL_PATTERNS = (
+    r"(?i)\berror\b",
+    r"(?i)\bfatal\b",
+    r"(?i)fortran runtime",
+    r"(?i)segmentation fault",
+    r"(?i)\bnan\b",
+)
+CONVERGENCE_PATTERNS = (
+    r"(?i)not\s+converged",
+    r"(?i)no\s+convergence",
+    r"(?i)convergence\s+fail",
+    r"(?i)too many iterations",
+)
+
+
+class LogMatch(NamedTuple):
+    file: str
+    lineno: int
+    line: str
+
+
+class LogWatcher:
+    """Tails files written by a running synspec and matches new lines against
+    a set of regular expressions.
+
+    rundir: run directory containing the files.
+    patterns: regular expressions to look for.
+    files: names of the files to watch. Files that don't exist yet are picked
+           up when they are created.
+    """
+
+    def __init__(
+        self,
+        rundir: Path,
+        patterns: Sequence[str],
+        files: Sequence[str] = ("fort.log",),
+    ):
+        self.rundir = rundir
+        self.patterns = [re.compile(p) for p in patterns]
+        self.files = list(files)
+        self._offsets = {file: 0 for file in files}
+        self._linenos = {file: 0 for file in files}
+        self._partial = {file: b"" for file in files}
+
+    def poll(self, final: bool = False) -> list[LogMatch]:
+        """Reads what has been written since the last poll and returns the
+        matching lines. Incomplete last lines are kept for the next poll,
+        unless final is set.
+        """
+        matches = []
+        for file in self.files:
+            for line in self._read(file, final):
+                self._linenos[file] += 1
+                if any(p.search(line) for p in self.patterns):
+                    matches.append(LogMatch(file, self._linenos[file], line))
+        return matches
+
+    def _read(self, file: str, final: bool) -> list[str]:
+        try:
+            with open(self.rundir / file, "rb") as f:
+                f.seek(self._offsets[file])
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        self._offsets[file] += len(data)
+        data = self._partial[file] + data
+        lines = data.split(b"\n")
+        self._partial[file] = lines.pop()
+        if final and self._partial[file]:
+            lines.append(self._partial[file])
+            self._partial[file] = b""
+        return [line.decode(errors="replace").rstrip() for line in lines]
@@ -0,0 +1,218 @@
+import dataclasses
+import hashlib
+import os
+import threading
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Mapping
+
+import numpy as np
+
+from synspec import costmodel, linelist, units, utils
+from synspec.culling import line_order_teff, strength
+from synspec.synspec import Synspec, tempdir
+
+# Previews of models with the same line list and a Teff within this many K
+# share the thinned line list.
+TEFF_BIN = 1000.0
+
+
+@dataclass(frozen=True)
+class Coarsening:
+    """How much coarser than the requested settings a preview is.
+
+    space: factor the wavelength step (space in fort.55, or
+           costmodel.DEFAULT_STEP if it isn't set) is multiplied by.
+    relop: factor relop (the opacity, relative to the continuum, of the
+           weakest lines included) is multiplied by.
+    keep: fraction of the lines of fort.19 kept, the strongest (see thin).
+    """
+
+    space: float = 10.0
+    relop: float = 100.0
+    keep: float = 0.1
+
+
+def coarsen(config: units.SynConfig, coarsening: Coarsening) -> units.SynConfig:
+    """The fort.55 of the preview of a run with the given fort.55."""
+    return dataclasses.replace(
+        config,
+        space=(config.space or costmodel.DEFAULT_STEP) * coarsening.space,
+        relop=config.relop * coarsening.relop,
+    )
+
+
+def thin(source: str | Path, output: str | Path, teff: float, keep: float) -> int:
+    """Writes the strongest lines of the .19 file source (see
+    culling.strength), the fraction keep of them, to output in their order in
+    source. Returns the number of lines kept. The source is streamed twice
+    and may be compressed (see units.openunit).
+    """
+    with units.openunit(source) as f:
+        lines = (units.read19line(text) for _, text in linelist.records(f))
+        strengths = np.array([strength(line.gf, line.excl, teff) for line in lines])
+    n = int(np.ceil(keep * strengths.size))
+    # Ties at the threshold are kept, so a few more than n lines may be.
+    threshold = np.sort(strengths)[-n] if n > 0 else np.inf
+    output = Path(output)
+    partial = output.with_name(f".{output.name}.{uuid.uuid4()}")
+    count = 0
+    try:
+        with units.openunit(source) as f, open(partial, "w") as out:
+            for (_, text), s in zip(linelist.records(f), strengths):
+                if s >= threshold:
+                    out.write(text)
+                    count += 1
+        os.replace(partial, output)
+    finally:
+        partial.unlink(missing_ok=True)
+    return count
+
+
+@dataclass(frozen=True)
+class Preview:
+    """The two stages of a previewed run, as futures of their spectra.
+
+    coarse: the preview, with the coarser settings.
+    fine: the spectrum with the requested settings, submitted once the
+          preview is done. Cancel it to skip the refinement if it hasn't
+          started.
+    Use asyncio.wrap_future to await them from a coroutine.
+    """
+
+    coarse: "Future[units.Spectrum]"
+    fine: "Future[units.Spectrum]"
+
+
+class Previewer:
+    """Runs models in two stages: a quick preview with coarser settings (see
+    Coarsening) and a thinned line list, then, in the background, a run with
+    the requested settings. Use as a context manager, or close it when done.
+
+    The preview runs in a temporary directory with its own fort.55 (the
+    requested one coarsened, see coarsen) and fort.19 (see thin). Thinned
+    line lists are kept until the Previewer is closed and shared by previews
+    of the same line list and similar Teff (see TEFF_BIN). Previews run on
+    threads of their own, so that they aren't queued behind refinements.
+
+    synspec: Synspec object to run with.
+    coarsening: see Coarsening.
+    workers: number of previews, and of refinements, run at a time.
+    """
+
+    def __init__(
+        self,
+        synspec: Synspec,
+        coarsening: Coarsening = Coarsening(),
+        workers: int = 2,
+    ):
+        self.synspec = synspec
+        self.coarsening = coarsening
+        self._stack = ExitStack()
+        # Closed in reverse: the line lists once no run uses them, the pool
+        # once no finishing preview submits to it.
+        self._lines = self._stack.enter_context(tempdir())
+        self._pool = self._stack.enter_context(ThreadPoolExecutor(workers))
+        self._previews = self._stack.enter_context(ThreadPoolExecutor(workers))
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "Previewer":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Waits for the runs submitted and removes the thinned line lists."""
+        self._stack.close()
+
+    def submit(
+        self,
+        model: str,
+        outdir: str | Path | None = None,
+        outfile: str | None = None,
+        basedir: str | Path | None = None,
+        links: Mapping[str, str | Path] | None = None,
+    ) -> Preview:
+        """Submits a previewed run, see Synspec.run for the arguments. The
+        output files of the preview are named {outfile}.preview.*, those of
+        the refined run {outfile}.*.
+        """
+        coarse = self._previews.submit(
+            self._preview, model, outdir, outfile, basedir, links
+        )
+        fine: "Future[units.Spectrum]" = Future()
+        coarse.add_done_callback(
+            lambda _: self._pool.submit(
+                self._refine, fine, model, outdir, outfile, basedir, links
+            )
+        )
+        return Preview(coarse, fine)
+
+    def _thinned(self, source: Path, teff: float) -> Path:
+        """The thinned line list of source, thinned first if it isn't yet."""
+        teff = round(teff / TEFF_BIN) * TEFF_BIN
+        key = f"{utils.statkey(source)}:{self.coarsening.keep}:{teff}"
+        thinned = self._lines / f"{hashlib.sha256(key.encode()).hexdigest()}.19"
+        with self._lock:
+            if not thinned.exists():
+                thin(source, thinned, teff, self.coarsening.keep)
+        return thinned
+
+    def _preview(
+        self,
+        model: str,
+        outdir: str | Path | None,
+        outfile: str | None,
+        basedir: str | Path | None,
+        links: Mapping[str, str | Path] | None,
+    ) -> units.Spectrum:
+        plan = self.synspec.plan(model, basedir, links)
+        name = f"{outfile or plan.model}.preview"
+        with tempdir() as directory:
+            units.write55f(directory / "fort.55", coarsen(plan.config, self.coarsening))
+            coarse = {**(links or {}), "fort.55": directory / "fort.55"}
+            if "fort.19" in plan.links:
+                teff = line_order_teff(plan.modelinput)
+                coarse["fort.19"] = self._thinned(plan.links["fort.19"], teff)
+            self.synspec.run(
+                model,
+                rundir=None,
+                outdir=outdir,
+                outfile=name,
+                basedir=basedir,
+                links=coarse,
+            )
+        return units.read7f(plan.basedir / (outdir or ".") / f"{name}.spec")
+
+    def _refine(
+        self,
+        fine: "Future[units.Spectrum]",
+        model: str,
+        outdir: str | Path | None,
+        outfile: str | None,
+        basedir: str | Path | None,
+        links: Mapping[str, str | Path] | None,
+    ) -> None:
+        """Runs the refinement into fine, unless it was cancelled."""
+        if not fine.set_running_or_notify_cancel():
+            return
+        try:
+            plan = self.synspec.plan(model, basedir, links)
+            self.synspec.run(
+                model,
+                rundir=None,
+                outdir=outdir,
+                outfile=outfile,
+                basedir=basedir,
+                links=links,
+            )
+            name = outfile or plan.model
+            spectrum = units.read7f(plan.basedir / (outdir or ".") / f"{name}.spec")
+        except BaseException as e:
+            fine.set_exception(e)
+        else:
+            fine.set_result(spectrum)
@@ -0,0 +1,238 @@
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from synspec import units, utils
+
+# Rydberg constants in cm^-1.
+RYDBERG_H = 109677.58
+RYDBERG_HE = 109722.27
+
+# Default distance in Angstrom from the edge of the wavelength range within
+# which the profile tables of a line are kept.
+PROFILE_MARGIN = 200.0
+
+
+@dataclass(frozen=True)
+class StarkTable:
+    """Stark broadening table of a hydrogen (hydprf.dat) or He II (he2prf.dat)
+    line.
+
+    species: "HI" or "HEII".
+    lower, upper: principal quantum numbers of the levels.
+    w: the profile grid.
+    t: log temperatures.
+    e: log electron densities.
+    profile: log profile, with shape (len(e), len(t), len(w)).
+    text: the table as it appears in the file.
+    """
+
+    species: str
+    lower: int
+    upper: int
+    w: np.ndarray
+    t: np.ndarray
+    e: np.ndarray
+    profile: np.ndarray
+    text: str
+
+    @property
+    def wavelength(self) -> float:
+        """Vacuum wavelength of the line centre in Angstrom."""
+        if self.species == "HI":
+            wavenumber = RYDBERG_H * (1 / self.lower**2 - 1 / self.upper**2)
+        else:
+            wavenumber = 4 * RYDBERG_HE * (1 / self.lower**2 - 1 / self.upper**2)
+        return 1e8 / wavenumber
+
+
+@dataclass(frozen=True)
+class HeITable:
+    """Profile table of a He I line at one electron density (he1prf.dat).
+
+    wavelength: wavelength of the line in Angstrom.
+    table: number of the table of the line.
+    ne: electron density.
+    dlam: wavelength offsets from the line centre in Angstrom.
+    profile: the profile, with shape (len(dlam), number of temperatures).
+    text: the table as it appears in the file.
+    """
+
+    wavelength: float
+    table: int
+    ne: float
+    dlam: np.ndarray
+    profile: np.ndarray
+    text: str
+
+
+@dataclass(frozen=True)
+class ProfileFile:
+    """The tables of a profile table file, with the text preceding them."""
+
+    header: str
+    tables: list
+
+
+_STARK_HEADER = re.compile(r"^ ?(HI|HEII)\s", re.MULTILINE)
+_HEI_HEADER = re.compile(r"^[ \t]*line no\.", re.MULTILINE)
+_HEI_TITLE = re.compile(
+    r"He I\s+([\d.]+)\s+table no\.\s*(\d+)\s+ne\s*=\s*(\S+)\s+nwl\s*=\s*(\d+)"
+)
+_STARK_LABELS = {"'W'", "W", "'T'", "T", "'E'", "E"}
+
+
+def readstark(text: str) -> ProfileFile:
+    """Converts the contents of hydprf.dat or he2prf.dat to StarkTables."""
+    header, blocks = _split(text, _STARK_HEADER)
+    return ProfileFile(header, [_readstark(block) for block in blocks])
+
+
+def _readstark(text: str) -> StarkTable:
+    title, _, body = text.partition("\n")
+    species = title.split()[0]
+    lower, upper = (int(x) for x in re.findall(r"H(?:E2)?\s*(\d+)", title[5:])[:2])
+    tokens = iter(x for x in body.split() if x not in _STARK_LABELS)
+    grids = []
+    try:
+        for _ in range(3):
+            n = int(next(tokens))
+            grids.append(np.array([utils.fortfloat(next(tokens)) for _ in range(n)]))
+    except StopIteration:
+        raise ValueError(f"{species} {lower}-{upper} table is incomplete") from None
+    w, t, e = grids
+    values = list(tokens)
+    if values[:1] == ["SCALE"]:
+        values = values[4:]
+    profile = np.array([utils.fortfloat(x) for x in values])
+    if profile.size != e.size * t.size * w.size:
+        raise ValueError(
+            f"{species} {lower}-{upper} table has {profile.size} values, "
+            f"{e.size * t.size * w.size} expected"
+        )
+    return StarkTable(
+        species,
+        lower,
+        upper,
+        w,
+        t,
+        e,
+        profile.reshape(e.size, t.size, w.size),
+        text,
+    )
+
+
+def readhe1(text: str) -> ProfileFile:
+    """Converts the contents of he1prf.dat to HeITables."""
+    header, blocks = _split(text, _HEI_HEADER)
+    return ProfileFile(header, [_readhe1(block) for block in blocks])
+
+
+def _readhe1(text: str) -> HeITable:
+    lines = text.splitlines()
+    match = _HEI_TITLE.search(lines[0])
+    if match is None:
+        raise ValueError(f"invalid he1prf table title: {lines[0]}")
+    nwl = int(match[4])
+    rows = [line for line in lines[1:] if line.strip()]
+    if len(rows) != nwl:
+        raise ValueError(f"He I table has {len(rows)} rows, {nwl} expected")
+    # Fixed width fields, which may run into each other or contain blanks.
+    data = np.array(
+        [
+            [
+                utils.fortfloat(field.replace(" ", ""))
+                for field in re.findall(".{1,10}", row.rstrip())
+            ]
+            for row in rows
+        ]
+    )
+    return HeITable(
+        float(match[1]),
+        int(match[2]),
+        utils.fortfloat(match[3]),
+        data[:, 0],
+        data[:, 1:],
+        text,
+    )
+
+
+def _split(text: str, pattern: re.Pattern) -> tuple[str, list[str]]:
+    """Splits text into the header and blocks starting with pattern."""
+    starts = [m.start() for m in pattern.finditer(text)]
+    if not starts:
+        raise ValueError("no profile tables found")
+    ends = starts[1:] + [len(text)]
+    return text[: starts[0]], [text[s:e] for s, e in zip(starts, ends)]
+
+
+def writeprofiles(profiles: ProfileFile) -> str:
+    """Converts a ProfileFile to a string storable in a profile table file."""
+    return profiles.header + "".join(table.text for table in profiles.tables)
+
+
+def window(
+    profiles: ProfileFile, alam0: float, alam1: float, margin: float = PROFILE_MARGIN
+) -> ProfileFile:
+    """Returns the tables of the lines within margin (in Angstrom) of the
+    wavelength range alam0 to alam1, in their original order.
+    """
+    return ProfileFile(
+        profiles.header,
+        [
+            table
+            for table in profiles.tables
+            if alam0 - margin <= table.wavelength <= alam1 + margin
+        ],
+    )
+
+
+_loaded: dict[tuple[str, str], ProfileFile] = {}
+
+
+def load(file: str | Path, reader: Callable[[str], ProfileFile]) -> ProfileFile:
+    """Reads a profile table file with the reader, parsing each version of the
+    file only once per process.
+    """
+    key = (utils.statkey(file), reader.__name__)
+    if key not in _loaded:
+        _loaded[key] = reader(Path(file).read_text())
+    return _loaded[key]
+
+
+# Profile table files in the data directory, with their readers and the
+# switches in unit 55 selecting them.
+PROFILE_FILES = {
+    "hydprf.dat": ("ihydpr", readstark),
+    "he1prf.dat": ("ihe1pr", readhe1),
+    "he2prf.dat": ("ihe2pr", readstark),
+}
+
+
+def reduce_profiles(
+    datadir: Path, config: units.SynConfig, margin: float = PROFILE_MARGIN
+) -> None:
+    """Replaces the profile tables selected by config in the data directory of
+    a run directory with tables reduced to the lines within margin of alam0 to
+    alam1.
+
+    If datadir is a link to a directory, it is first replaced by a directory
+    of links to its files. Files are replaced rather than written to, so
+    linked or cached tables are never modified.
+    """
+    if datadir.is_symlink():
+        target = datadir.resolve()
+        datadir.unlink()
+        datadir.mkdir()
+        for file in target.iterdir():
+            (datadir / file.name).symlink_to(file, file.is_dir())
+    for name, (switch, reader) in PROFILE_FILES.items():
+        file = datadir / name
+        if getattr(config, switch) == 0 or not file.exists():
+            continue
+        reduced = window(load(file, reader), config.alam0, config.alam1, margin)
+        file.unlink()
+        file.write_text(writeprofiles(reduced))
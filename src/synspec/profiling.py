@@ -0,0 +1,74 @@
+import cProfile
+import os
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+# Set to a directory to profile every run and batch job without changing any
+# code, e.g. SYNSPEC_PROFILE=/tmp/profiles.
+PROFILE_ENV = "SYNSPEC_PROFILE"
+# Number of frames tracemalloc keeps per allocation.
+TRACEMALLOC_FRAMES = 25
+
+# Profiling in progress in the current thread, for nested calls.
+_local = threading.local()
+# tracemalloc is process wide: it is started by the first of the concurrent
+# profiled calls (unless already tracing) and stopped by the last.
+_lock = threading.Lock()
+_tracing = 0
+_started = False
+
+
+def profile_dir(directory: str | Path | None = None) -> Path | None:
+    """Returns the directory to write profiles to: the given one, else the one
+    in the SYNSPEC_PROFILE environment variable, else None (profiling off).
+    """
+    if directory is None:
+        directory = os.environ.get(PROFILE_ENV) or None
+    return None if directory is None else Path(directory)
+
+
+@contextmanager
+def profiled(name: str, directory: str | Path | None = None) -> Iterator[None]:
+    """Context manager profiling its body with cProfile and tracemalloc.
+
+    The cProfile statistics are written to {name}.prof (readable with pstats or
+    snakeviz) and the allocations still alive at the end to {name}.tracemalloc
+    (readable with tracemalloc.Snapshot.load) in the profile directory, see
+    profile_dir. Does nothing if profiling is off or already running in this
+    thread, so only the outermost of nested calls is profiled.
+
+    cProfile only sees the calling thread, so other threads (such as those
+    of concurrent runs, each profiled separately) don't show in the .prof
+    files. tracemalloc is process wide: the .tracemalloc files include the
+    allocations of all threads.
+    """
+    global _tracing, _started
+    directory = profile_dir(directory)
+    if directory is None or getattr(_local, "active", False):
+        yield
+        return
+    directory.mkdir(parents=True, exist_ok=True)
+    _local.active = True
+    with _lock:
+        if _tracing == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            _started = True
+        _tracing += 1
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        with _lock:
+            snapshot = tracemalloc.take_snapshot()
+            _tracing -= 1
+            if _tracing == 0 and _started:
+                tracemalloc.stop()
+                _started = False
+        _local.active = False
+        profile.dump_stats(directory / f"{name}.prof")
+        snapshot.dump(str(directory / f"{name}.tracemalloc"))
@@ -0,0 +1,157 @@
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+from synspec import units
+
+# Speed of light in km/s.
+C = 299792.458
+
+
+@dataclass(frozen=True)
+class CrossCorrelation:
+    """Cross-correlation functions of observed spectra against templates.
+
+    velocities: velocities (in km/s) of the lags, increasing.
+    ccf: the CCFs, indexed by observation, template and lag. They are
+         normalised so that identical spectra correlate to 1 at zero lag.
+    velocity: velocity of the peak of each CCF, by observation and template,
+              refined between lags by a parabola through the highest three.
+    height: height of the peak of each CCF.
+    width: full width at half maximum of the peak of each CCF in km/s, NaN if
+           the CCF doesn't fall to half the peak within the lags.
+    """
+
+    velocities: np.ndarray
+    ccf: np.ndarray
+    velocity: np.ndarray
+    height: np.ndarray
+    width: np.ndarray
+
+    def best(self) -> np.ndarray:
+        """Index of the template with the highest peak for each observation."""
+        return np.argmax(self.height, axis=1)
+
+
+def loggrid(w0: float, w1: float, step: float) -> np.ndarray:
+    """Returns wavelengths from w0 to w1 (in Angstrom) evenly spaced in log
+    wavelength, step km/s apart, so that a Doppler shift is a constant shift
+    in index.
+    """
+    n = int(np.log(w1 / w0) / np.log1p(step / C)) + 1
+    return w0 * np.exp(np.arange(n) * np.log1p(step / C))
+
+
+def normalize(spectrum: units.Spectrum, continuum: units.Spectrum) -> units.Spectrum:
+    """Divides a spectrum by its continuum, interpolated to its wavelengths."""
+    return units.Spectrum(
+        spectrum.wavelength,
+        spectrum.flux
+        / np.interp(spectrum.wavelength, continuum.wavelength, continuum.flux),
+    )
+
+
+def read_normalized(output: str | Path) -> units.Spectrum:
+    """Reads the normalised spectrum of a synspec run from {output}.spec and
+    {output}.cont, which may be compressed or packed (see units.storeunit).
+    """
+    return normalize(
+        units.read7f(units.unitfile(Path(f"{output}.spec"))),
+        units.read7f(units.unitfile(Path(f"{output}.cont"))),
+    )
+
+
+def resample(spectra: Iterable[units.Spectrum], grid: np.ndarray) -> np.ndarray:
+    """Interpolates normalised spectra to the wavelengths of grid (see
+    loggrid). Returns an array indexed by spectrum and grid point, with the
+    continuum (1) outside the wavelengths of each spectrum.
+    """
+    return np.array(
+        [
+            np.interp(grid, spectrum.wavelength, spectrum.flux, left=1.0, right=1.0)
+            for spectrum in spectra
+        ]
+    ).reshape(-1, grid.size)
+
+
+def crosscorrelate(
+    observed: np.ndarray,
+    templates: np.ndarray,
+    step: float,
+    max_velocity: float | None = None,
+) -> CrossCorrelation:
+    """Cross-correlates every observed spectrum against every template.
+
+    observed, templates: normalised spectra resampled to the same log
+                         wavelength grid (see resample), one per row.
+    step: velocity step of the grid in km/s, as passed to loggrid.
+    max_velocity: largest velocity (in km/s) of the lags returned. Defaults
+                  to all lags.
+    All the CCFs are computed at once by FFTs: each spectrum is transformed
+    once, zero padded to avoid wrap-around, and the products of all the
+    pairs are transformed back in one call. They take
+    observations x templates x (twice the grid size) floats of memory.
+    """
+    observed = np.atleast_2d(observed)
+    templates = np.atleast_2d(templates)
+    n = observed.shape[1]
+    if templates.shape[1] != n:
+        raise ValueError("observed spectra and templates are on different grids")
+    nfft = 1 << (2 * n - 1).bit_length()
+    spectra = []
+    for flux in (observed, templates):
+        depth = 1.0 - flux
+        depth = depth - depth.mean(axis=1, keepdims=True)
+        norm = np.sqrt(np.sum(depth**2, axis=1, keepdims=True))
+        spectra.append(np.fft.rfft(depth / np.where(norm > 0, norm, 1.0), nfft))
+    ccf = np.fft.irfft(spectra[0][:, np.newaxis, :] * np.conj(spectra[1]), nfft)
+
+    maxlag = n - 1
+    if max_velocity is not None:
+        maxlag = min(maxlag, int(np.log1p(max_velocity / C) / np.log1p(step / C)))
+    if maxlag < 1:
+        raise ValueError("too few lags to find peaks, max_velocity < step?")
+    lags = np.arange(-maxlag, maxlag + 1)
+    ccf = ccf[..., lags % nfft]
+    velocities = C * (np.exp(lags * np.log1p(step / C)) - 1)
+    return _peaks(velocities, ccf, step)
+
+
+def _peaks(velocities: np.ndarray, ccf: np.ndarray, step: float) -> CrossCorrelation:
+    """Finds the velocities, heights and widths of the peaks of the CCFs."""
+    nlags = velocities.size
+    peak = np.argmax(ccf, axis=-1)
+    # A parabola through the highest lag and its neighbours, unless at an end.
+    inner = np.clip(peak, 1, nlags - 2)
+    y0, y1, y2 = (
+        np.take_along_axis(ccf, (inner + k)[..., np.newaxis], axis=-1)[..., 0]
+        for k in (-1, 0, 1)
+    )
+    curvature = y0 - 2 * y1 + y2
+    refine = (inner == peak) & (curvature < 0)
+    offset = np.zeros(peak.shape)
+    offset[refine] = np.clip(0.5 * (y0 - y2)[refine] / curvature[refine], -0.5, 0.5)
+    height = np.where(refine, y1 - 0.25 * (y0 - y2) * offset, y1)
+    height = np.where(inner == peak, height, np.max(ccf, axis=-1))
+    position = peak + offset
+    velocity = np.interp(position, np.arange(nlags), velocities)
+
+    # Half maximum crossings on either side of the peak, interpolated.
+    half = (height / 2)[..., np.newaxis]
+    index = np.arange(nlags)
+    below = ccf < half
+    left = np.max(np.where(below & (index < peak[..., np.newaxis]), index, -1), -1)
+    right = np.min(np.where(below & (index > peak[..., np.newaxis]), index, nlags), -1)
+    width = np.full(peak.shape, np.nan)
+    found = (left >= 0) & (right < nlags)
+    if found.any():
+        h = half[..., 0][found]
+        c = ccf[found]
+        i, j = left[found], right[found]
+        rows = np.arange(c.shape[0])
+        left_at = i + (h - c[rows, i]) / (c[rows, i + 1] - c[rows, i])
+        right_at = j - (h - c[rows, j]) / (c[rows, j - 1] - c[rows, j])
+        width[found] = (right_at - left_at) * step
+    return CrossCorrelation(velocities, ccf, velocity, height, width)
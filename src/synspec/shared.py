@@ -0,0 +1,112 @@
+from dataclasses import dataclass
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from synspec import units
+
+# Rows parsed at a time when loading a unit into shared memory.
+CHUNK_ROWS = 65536
+
+
+@dataclass(frozen=True)
+class SharedArray:
+    """Descriptor of an array in a shared memory block. It is all that has to
+    be passed between processes, whatever the size of the array.
+    """
+
+    name: str
+    shape: tuple[int, ...]
+    dtype: str = "float64"
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> "SharedArray":
+        return cls(data["name"], tuple(data["shape"]), data["dtype"])
+
+
+def _create(shape: tuple[int, ...], dtype: str) -> tuple[SharedMemory, np.ndarray]:
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    # Blocks can't be empty.
+    block = SharedMemory(create=True, size=max(size, 1))
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def load7(file: Path | str) -> SharedArray:
+    """Parses a .spec (unit 7) or .cont (unit 17) file, or its compressed or
+    packed version, into a new shared memory block of (wavelength, flux) rows
+    and returns its descriptor.
+
+    Plain files are parsed straight into the block, CHUNK_ROWS at a time. The
+    block is left for the receiving process to attach and, when done, unlink
+    (see SharedResults).
+    """
+    with units.SpecFile(file) as spec:
+        n = len(spec)
+        block, array = _create((n, 2), "float64")
+        try:
+            for i in range(0, n, CHUNK_ROWS):
+                array[i : i + CHUNK_ROWS] = spec.rows(i, i + CHUNK_ROWS)  # noqa: E203
+        except BaseException:
+            block.unlink()
+            raise
+        finally:
+            del array  # The block can't be closed while viewed.
+            block.close()
+    return SharedArray(block.name, (n, 2))
+
+
+def unlink(shared: SharedArray) -> None:
+    """Frees the block of a shared array that won't be passed on, see load7."""
+    block = SharedMemory(shared.name)
+    block.close()
+    block.unlink()
+
+
+class SharedResults:
+    """Holds the shared memory blocks of results in the receiving process.
+
+    Arrays are attached as NumPy views of the blocks, without copying. The
+    blocks are unlinked when this is closed; views must not be used after
+    that. Create it before starting worker processes, so that they share its
+    resource tracker.
+    """
+
+    def __init__(self) -> None:
+        resource_tracker.ensure_running()
+        self._blocks: dict[str, SharedMemory] = {}
+
+    def array(self, shared: SharedArray) -> np.ndarray:
+        """Returns a view of the shared array."""
+        if shared.name not in self._blocks:
+            self._blocks[shared.name] = SharedMemory(shared.name)
+        block = self._blocks[shared.name]
+        return np.ndarray(shared.shape, dtype=shared.dtype, buffer=block.buf)
+
+    def spectrum(self, shared: SharedArray) -> units.Spectrum:
+        """Returns a Spectrum of views of the shared array, see load7."""
+        array = self.array(shared)
+        return units.Spectrum(array[:, 0], array[:, 1])
+
+    def load7(self, file: Path | str) -> SharedArray:
+        """Loads a unit file into shared memory held by this object."""
+        shared = load7(file)
+        self.array(shared)
+        return shared
+
+    def close(self) -> None:
+        for block in self._blocks.values():
+            block.unlink()
+            try:
+                block.close()
+            except BufferError:
+                pass  # Views still exist; the memory is freed with them.
+        self._blocks.clear()
+
+    def __enter__(self) -> "SharedResults":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
@@ -1,20 +1,144 @@
+import errno
 import functools
+import os
 import shutil
+import signal
 import subprocess
 import tempfile
-from contextlib import _GeneratorContextManager, contextmanager
+import warnings
+from contextlib import ExitStack, _GeneratorContextManager, contextmanager
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Callable, Iterator
+from typing import Any, Callable, Iterator, Mapping, Sequence
 
-from synspec import units, utils
+from synspec import atoms, profiles, profiling, units, utils
+from synspec.cache import DataCache
+from synspec.limits import APPLIED, ResourceLimits
+from synspec.monitor import LogMatch, LogWatcher
+
+STAGING_DIR = "/dev/shm"
+# Free space to leave in the staging directory besides the copied inputs, for
+# the output units written by synspec.
+STAGING_HEADROOM = 256 * 1024**2
+
+
+class SynspecError(RuntimeError):
+    """A synspec run failed."""
+
+
+class SynspecAborted(SynspecError):
+    """A synspec run was aborted because a fatal message was found in its
+    output.
+
+    matches: the matching lines.
+    """
+
+    def __init__(self, matches: list[LogMatch]):
+        self.matches = matches
+        lines = "\n".join(f"{m.file}:{m.lineno}: {m.line}" for m in matches)
+        super().__init__(f"synspec aborted on fatal output:\n{lines}")
+
+
+class ResourceLimitExceeded(SynspecError):
+    """A synspec run was killed for exceeding one of its ResourceLimits."""
+
+
+class CPULimitExceeded(ResourceLimitExceeded):
+    pass
+
+
+class MemoryLimitExceeded(ResourceLimitExceeded):
+    pass
+
+
+class FileSizeLimitExceeded(ResourceLimitExceeded):
+    pass
+
+
+@dataclass(frozen=True)
+class RunPlan:
+    """Everything a run needs, resolved before anything is set up.
+
+    model: name of the model.
+    basedir: directory relative paths were resolved against.
+    links: names in the run directory mapped to the absolute paths of the
+           files they are linked or copied from.
+    cacheable: names of the links to atomic data, which may go through the
+               datacache.
+    modelinput: the parsed input file, see units.readinput.
+    config: the parsed fort.55.
+    """
+
+    model: str
+    basedir: Path
+    links: Mapping[str, Path]
+    cacheable: frozenset[str]
+    modelinput: Mapping[str, Any]
+    config: units.SynConfig
 
 
 class Synspec:
-    def __init__(self, synspecpath: str = "synspec", version: int = 51):
+    def __init__(
+        self,
+        synspecpath: str = "synspec",
+        version: int = 51,
+        datacache: DataCache | str | Path | None = None,
+        abort_patterns: Sequence[str] | None = None,
+        watch_files: Sequence[str] = ("fort.log",),
+        watch_interval: float = 0.5,
+        limits: ResourceLimits | None = None,
+        profile_margin: float | None = None,
+        validate_atoms: bool = True,
+        profile_dir: str | Path | None = None,
+        output_format: str | None = None,
+    ):
+        """synspecpath: path to the synspec executable.
+        version: synspec version.
+        datacache: node-local cache (or its directory) through which the atomic
+                   data files referenced by the input file are linked.
+        abort_patterns: regular expressions (e.g. monitor.FATAL_PATTERNS) which,
+                        when matched by a line written to one of watch_files,
+                        abort the run with SynspecAborted.
+        watch_files: files in the run directory to watch.
+        watch_interval: seconds between checks of the watched files.
+        limits: resource limits, niceness and CPU affinity of the synspec
+                process, applied through a wrapper (see
+                ResourceLimits.command), so runs can be started from any
+                thread. Runs exceeding a limit raise a ResourceLimitExceeded
+                subclass, see _check_limits. With limits set, the standard
+                error of synspec is written to fort.err in the run directory.
+        profile_margin: if set, runs in temporary run directories use hydrogen
+                        and helium profile tables reduced to the lines within
+                        this many Angstrom of the wavelength range.
+        validate_atoms: check the ion data files against the numbers of levels
+                        in the input file before setting up the run. The
+                        parsed files are kept in the datacache, if any.
+        profile_dir: directory to write cProfile and tracemalloc profiles of
+                     each run to, named after the output files. Defaults to
+                     the SYNSPEC_PROFILE environment variable, if set.
+        output_format: store the output files compressed ("gzip", "xz" or
+                       "bz2") or, for .spec and .cont, packed as arrays
+                       ("float32" or "float64"), see units.storeunit. The
+                       readers in units open them transparently. float32
+                       keeps about 7 significant digits of the wavelengths.
+        """
+        if output_format is not None and output_format not in units.OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format}")
         if version != 51:
             raise NotImplementedError("Only version 51 is supported")
         self.version = version
         self.synspec = synspecpath
+        if datacache is not None and not isinstance(datacache, DataCache):
+            datacache = DataCache(datacache)
+        self.datacache = datacache
+        self.abort_patterns = abort_patterns
+        self.watch_files = watch_files
+        self.watch_interval = watch_interval
+        self.limits = limits
+        self.profile_margin = profile_margin
+        self.validate_atoms = validate_atoms
+        self.profile_dir = profile_dir
+        self.output_format = output_format
         self.linkfiles: dict[str, str | Path] = {  # default links
             "fort.19": "fort.19",
             "fort.55": "fort.55",
@@ -22,52 +146,244 @@ class Synspec:
             "{model}.7": "{modelpath}.7",
         }
 
-    def add_link(self, linkfrom: str, linkto: str = None) -> None:
+    def add_link(self, linkfrom: str, linkto: str | None = None) -> None:
         """Adds a link from the given file to the given file."""
         if linkto is None:
             linkto = linkfrom
         self.linkfiles[linkto] = linkfrom
 
+    def plan(
+        self,
+        model: str | Path,
+        basedir: str | Path | None = None,
+        links: Mapping[str, str | Path] | None = None,
+    ) -> RunPlan:
+        """Resolves the inputs of a run of the given model.
+
+        basedir: directory relative paths are resolved against. Defaults to
+                 the current directory.
+        links: extra links for this run only, mapping the name in the run
+               directory to the file it points to (as in add_link).
+        The Synspec object is not modified, so runs can be planned and run
+        from several threads at once.
+        """
+        basedir = Path.cwd().resolve() if basedir is None else Path(basedir).resolve()
+        modelpath = (basedir / model).resolve()
+        model = modelpath.name
+        linkfiles = dict(self.linkfiles)
+        linkfiles.update(links or {})
+
+        def source(name: str) -> Path:
+            linkfrom = str(linkfiles[name]).format(model=model, modelpath=modelpath)
+            return (basedir / linkfrom).resolve()
+
+        modelinput = units.readinput(source("{model}.5").read_text())
+        config = units.read55f(source("fort.55"))
+        if self.validate_atoms:
+            atoms.validate(
+                modelinput,
+                basedir,
+                cachedir=(
+                    None if self.datacache is None else self.datacache.root / "atoms"
+                ),
+            )
+
+        # Link the atomic data referenced by the input file.
+        reqs = []
+        if modelinput.get("finstd"):
+            reqs.append(modelinput["finstd"])
+        for ion in modelinput.get("ions", []):
+            reqs.append(ion["filei"])
+        cacheable = {
+            str(x).split("/", maxsplit=1)[0]
+            for x in map(Path, reqs)
+            if not x.is_absolute()
+        }
+        for req in cacheable:
+            if (basedir / req).exists() and req not in linkfiles:
+                linkfiles[req] = req
+
+        # Detect need for fort.56
+        if "fort.56" not in linkfiles and config.ichemc != 0:
+            if (basedir / "fort.56").is_file():
+                linkfiles["fort.56"] = "fort.56"
+            else:
+                raise FileNotFoundError("Need for fort.56 detected but not found")
+
+        return RunPlan(
+            model,
+            basedir,
+            {
+                linkto.format(model=model, modelpath=modelpath): source(linkto)
+                for linkto in linkfiles
+            },
+            frozenset(cacheable),
+            modelinput,
+            config,
+        )
+
     def run(
         self,
         model: str,
         rundir: str | Path | None = ".",
         outdir: str | Path | None = None,
         outfile: str | None = None,
+        stage: bool | str | Path = False,
+        basedir: str | Path | None = None,
+        links: Mapping[str, str | Path] | None = None,
     ) -> None:
         """Runs synspec with the given model.
         rundir: directory to run synspec in.
-                defaults to running in the current directory.
+                defaults to running in the base directory.
                 if explicitly set to None, a temporary directory is used.
         outdir: directory to copy the output files to.
         outfile: name (without extension) of the output files.
+        stage: stage the temporary run directory in memory (requires
+               rundir=None). If True, STAGING_DIR is used, otherwise the given
+               directory, e.g. a tmpfs mount. The inputs are copied instead of
+               linked. Falls back to linking if the staging directory is short
+               of space, and to the default temporary directory if it is not
+               available.
+        basedir: directory the model and all other relative paths are relative
+                 to. Defaults to the current directory.
+        links: extra links for this run only, see plan.
+        Raises SynspecError if synspec fails.
+        Runs don't modify the Synspec object, so one object can be shared by
+        threads running concurrently.
         """
-        modelpath = Path(model).resolve()
-        model = modelpath.name
+        if stage is not False and rundir is not None:
+            raise ValueError("stage requires rundir=None")
+        staging = staging_dir(stage)
+        plan = self.plan(model, basedir, links)
+        if outdir is not None:
+            outdir = plan.basedir / outdir
+        temporary = rundir is None
         if rundir is None:
             if outdir is None:
-                outdir = Path.cwd()
-            rdprovider: Callable[[], _GeneratorContextManager[Path]] = tempdir
+                outdir = plan.basedir
+            rdprovider: Callable[[], _GeneratorContextManager[Path]] = (
+                functools.partial(tempdir, dir=staging)
+            )
         else:
-            rundir = Path(rundir).resolve()
+            rundir = (plan.basedir / rundir).resolve()
             rundir.mkdir(exist_ok=True)
             rdprovider = functools.partial(
                 utils.folderlock, path=rundir, lockfn="synspec.lock"
             )
-        with rdprovider() as rundir:
-            self._copy_to_rundir(model, modelpath, rundir)
-            self._check_files(model, rundir)
-            self._run(model, rundir)
-            self._extract_outfiles(model, rundir, outdir, outfile)
+        with profiling.profiled(
+            outfile or plan.model, self.profile_dir
+        ), rdprovider() as rundir:
+            self.stage_inputs(plan, rundir, copy=staging is not None)
+            if temporary and self.profile_margin is not None:
+                profiles.reduce_profiles(
+                    rundir / "data", plan.config, self.profile_margin
+                )
+            self.run_staged(plan, rundir, outdir or rundir, outfile)
+
+    def stage_inputs(
+        self, plan: RunPlan, rundir: str | Path, copy: bool = False
+    ) -> None:
+        """Links the inputs of a planned run into rundir, or copies them (see
+        stage in run). Files already there are replaced, so a run directory
+        can be kept and staged again with only the inputs that changed.
+        """
+        self._copy_to_rundir(plan, Path(rundir), copy)
+
+    def run_staged(
+        self,
+        plan: RunPlan,
+        rundir: str | Path,
+        outdir: str | Path | None = None,
+        outfile: str | None = None,
+    ) -> None:
+        """Runs synspec on a planned run in rundir, where its inputs are
+        staged (see stage_inputs). The output units are left in rundir.
+        outdir: directory to also copy the output files to.
+        outfile: name (without extension) of the output files.
+        Raises FileNotFoundError if an input is missing, SynspecError if
+        synspec fails.
+        """
+        rundir = Path(rundir)
+        self._check_files(plan.model, rundir)
+        self._run(plan.model, rundir)
+        if outdir is not None:
+            self._extract_outfiles(plan.model, rundir, outdir, outfile)
 
     def _run(self, model: str, rundir: Path) -> None:
         utils.symlinkf(f"{model}.7", rundir / "fort.8")
-        with open(rundir / f"{model}.5") as modelinput, open(
-            rundir / "fort.log", "w"
-        ) as log:
-            subprocess.run(
-                [self.synspec], stdin=modelinput, stdout=log, cwd=rundir, check=True
+        with ExitStack() as stack:
+            modelinput = stack.enter_context(open(rundir / f"{model}.5"))
+            log = stack.enter_context(open(rundir / "fort.log", "w"))
+            err = None
+            command = [self.synspec]
+            if self.limits is not None:
+                err = stack.enter_context(open(rundir / "fort.err", "w"))
+                command = self.limits.command(command)
+            proc = subprocess.Popen(
+                command,
+                stdin=modelinput,
+                stdout=log,
+                stderr=err,
+                cwd=rundir,
             )
+            try:
+                if self.abort_patterns is None:
+                    proc.wait()
+                else:
+                    self._watch(proc, rundir)
+            finally:
+                if proc.poll() is None:
+                    proc.kill()
+                    proc.wait()
+        if proc.returncode != 0:
+            self._check_limits(proc.returncode, rundir)
+            raise SynspecError(
+                f"synspec failed with exit status {proc.returncode}"
+            ) from subprocess.CalledProcessError(proc.returncode, [self.synspec])
+
+    def _check_limits(self, returncode: int, rundir: Path) -> None:
+        """Raises the matching ResourceLimitExceeded if a failed run was stopped
+        by a limit: by SIGXCPU or SIGXFSZ, or by failing to allocate memory
+        under the memory limit, as reported in fort.err (see
+        ResourceLimits.exceeded). Other failures, including crashes and kills
+        by the OOM killer or an operator, are left to the caller.
+        """
+        if self.limits is None:
+            return
+        signum = -returncode
+        if self.limits.cpu is not None and signum == signal.SIGXCPU:
+            raise CPULimitExceeded(
+                f"synspec exceeded the CPU time limit of {self.limits.cpu} s"
+            )
+        if self.limits.fsize is not None and signum == signal.SIGXFSZ:
+            raise FileSizeLimitExceeded(
+                f"synspec exceeded the file size limit of {self.limits.fsize} bytes"
+            )
+        errors = (rundir / "fort.err").read_text(errors="replace")
+        if self.limits.exceeded(errors):
+            raise MemoryLimitExceeded(
+                f"synspec exceeded the memory limit of {self.limits.memory} "
+                f"bytes:\n{errors.split(APPLIED, 1)[1].strip()}"
+            )
+
+    def _watch(self, proc: subprocess.Popen, rundir: Path) -> None:
+        """Waits for synspec to finish, killing it as soon as a fatal message
+        appears in the watched files.
+        """
+        assert self.abort_patterns is not None
+        watcher = LogWatcher(rundir, self.abort_patterns, self.watch_files)
+        while True:
+            try:
+                proc.wait(timeout=self.watch_interval)
+            except subprocess.TimeoutExpired:
+                if matches := watcher.poll():
+                    proc.kill()
+                    proc.wait()
+                    raise SynspecAborted(matches)
+            else:
+                break
+        if matches := watcher.poll(final=True):
+            raise SynspecAborted(matches)
 
     def _extract_outfiles(
         self, model: str, rundir: Path, outdir: Path | str | None, outfile: str | None
@@ -87,55 +403,48 @@ class Synspec:
             ("16", "eqws"),
             ("17", "cont"),
         ]:
-            shutil.copyfile(rundir / f"fort.{unit}", outdir / f"{outfile}.{ext}")
+            units.storeunit(
+                rundir / f"fort.{unit}",
+                outdir / f"{outfile}.{ext}",
+                self.output_format,
+            )
         shutil.copyfile(rundir / "fort.log", outdir / f"{outfile}.log")
 
-    def _copy_to_rundir(self, model: str, modelpath: Path, rundir: Path) -> None:
-        # Read the input file to see if extra links are required.
-        inputfile = str(self.linkfiles["{model}.5"]).format(
-            model=model, modelpath=modelpath
-        )
-        with open(inputfile) as f:
-            modelinput = units.readinput(f.read())
-        reqs = []
-        if modelinput.get("finstd"):
-            reqs.append(modelinput["finstd"])
-        if "ions" in modelinput:
-            for ion in modelinput["ions"]:
-                reqs.append(ion["filei"])
-        reqs = list(
-            {
-                str(x).split("/", maxsplit=1)[0]
-                for x in map(Path, reqs)
-                if not x.is_absolute()
-            }
-        )
-
-        for req in reqs:
-            if Path(req).exists() and req not in self.linkfiles:
-                self.linkfiles[req] = req
+    def _copy_to_rundir(self, plan: RunPlan, rundir: Path, copy: bool = False) -> None:
+        links = {rundir / linkto: src for linkto, src in plan.links.items()}
 
-        # Detect need for fort.56
-        if "fort.56" not in self.linkfiles:
-            cofigfile = Path(str(self.linkfiles["fort.55"]).format(model=model))
-            config = units.read55f(cofigfile)
-            if config.ichemc != 0:
-                if Path("fort.56").is_file():
-                    self.linkfiles["fort.56"] = "fort.56"
-                else:
-                    raise FileNotFoundError("Need for fort.56 detected but not found")
-
-        # Link the required files to the run directory.
-        for dst, src in self.linkfiles.items():
-            src = Path(str(src).format(model=model, modelpath=modelpath)).resolve()
-            if (
-                rundir != Path.cwd().resolve()
-                or src
-                != Path(str(dst).format(model=model, modelpath=modelpath)).resolve()
-            ):
-                utils.symlinkf(
-                    src, rundir / dst.format(model=model, modelpath=modelpath)
+        if copy:
+            size = sum(utils.du(src) for src in links.values() if src.exists())
+            if shutil.disk_usage(rundir).free < size + STAGING_HEADROOM:
+                warnings.warn(
+                    f"Not enough space to stage inputs in {rundir}, linking instead",
+                    RuntimeWarning,
                 )
+                copy = False
+
+        # Link the required files to the run directory. The atomic data
+        # referenced by the input file is linked through the cache if there is
+        # one.
+        cacheable = {rundir / req for req in plan.cacheable}
+        for dst, src in links.items():
+            if rundir == plan.basedir and src == dst.resolve():
+                continue
+            if self.datacache is not None and dst in cacheable and src.exists():
+                src = self.datacache.get(src)
+            if copy and src.exists():
+                try:
+                    utils.copyf(src, dst)
+                    continue
+                except OSError as e:
+                    if e.errno != errno.ENOSPC:
+                        raise
+                    warnings.warn(
+                        f"Ran out of space staging inputs in {rundir}, "
+                        "linking instead",
+                        RuntimeWarning,
+                    )
+                    copy = False
+            utils.symlinkf(src, dst)
 
     def _check_files(self, model: str, rundir: Path) -> None:
         """Checks if the required files exist."""
@@ -146,7 +455,28 @@ class Synspec:
 
 
 @contextmanager
-def tempdir() -> Iterator[Path]:
+def tempdir(dir: str | Path | None = None) -> Iterator[Path]:
     """Context manager for temporary directories."""
-    with tempfile.TemporaryDirectory() as tmpdir:
+    with tempfile.TemporaryDirectory(dir=dir) as tmpdir:
         yield Path(tmpdir).resolve()
+
+
+def staging_dir(stage: bool | str | Path) -> Path | None:
+    """Returns the directory to create staged run directories in for the stage
+    argument of Synspec.run, or None to use the default temporary directory.
+    """
+    if stage is False:
+        return None
+    return _staging_dir(STAGING_DIR if stage is True else stage)
+
+
+def _staging_dir(path: str | Path) -> Path | None:
+    """Returns the staging directory, or None if it can't be used."""
+    path = Path(path)
+    if path.is_dir() and os.access(path, os.W_OK | os.X_OK):
+        return path
+    warnings.warn(
+        f"Staging directory {path} not available, using default temporary directory",
+        RuntimeWarning,
+    )
+    return None
@@ -1,6 +1,15 @@
+import bisect
+import bz2
+import gzip
+import lzma
+import mmap
+import re
+import shutil
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, NamedTuple, TextIO
+from typing import IO, Any, Callable, Mapping, NamedTuple, TextIO
+
+import numpy as np
 
 from synspec import utils
 
@@ -173,6 +182,81 @@ def write55f(file: Path | str | TextIO, config: SynConfig) -> None:
     utils.write_to_file(file, write55(config))
 
 
+# Unit 8 ({model}.7):
+
+
+@dataclass(frozen=True)
+class Atmosphere:
+    """A model atmosphere in the format of unit 8, as written by TLUSTY.
+
+    dm: mass column (g cm^-2) at each depth.
+    structure: array of shape (nd, abs(numpar)) with, at each depth, the
+               temperature, electron density, mass density and the other
+               parameters (e.g. level populations) of the model.
+    numpar: number of parameters per depth, as in the header (TLUSTY uses its
+            sign as a flag, so it is kept as is).
+    """
+
+    dm: np.ndarray
+    structure: np.ndarray
+    numpar: int
+
+    @property
+    def nd(self) -> int:
+        return self.dm.size
+
+    @property
+    def temperature(self) -> np.ndarray:
+        return self.structure[:, 0]
+
+    @property
+    def electron_density(self) -> np.ndarray:
+        return self.structure[:, 1]
+
+    @property
+    def density(self) -> np.ndarray:
+        return self.structure[:, 2]
+
+
+def read8(text: str) -> Atmosphere:
+    """Converts the contents of a .7 (unit 8) file to an Atmosphere."""
+    tokens = text.split()
+    nd, numpar = int(tokens[0]), int(tokens[1])
+    values = np.array([utils.fortfloat(x) for x in tokens[2:]])
+    if values.size != nd * (1 + abs(numpar)):
+        raise ValueError(
+            f"unit 8 has {values.size} values, {nd * (1 + abs(numpar))} expected"
+        )
+    return Atmosphere(values[:nd], values[nd:].reshape(nd, abs(numpar)), numpar)
+
+
+def read8f(file: Path | str) -> Atmosphere:
+    """Reads a .7 (unit 8) file."""
+    return read8(Path(file).read_text())
+
+
+def write8(atmosphere: Atmosphere) -> str:
+    """Converts an Atmosphere to a string in the format of unit 8."""
+
+    def rows(values: np.ndarray, fmt: str, per_row: int) -> list[str]:
+        text = [format(x, fmt).replace("E", "D") for x in values]
+        return [
+            "".join(text[i : i + per_row]) + "\n"  # noqa: E203
+            for i in range(0, len(text), per_row)
+        ]
+
+    lines = [f"{atmosphere.nd:5d}{atmosphere.numpar:5d}\n"]
+    lines += rows(atmosphere.dm, "13.6E", 6)
+    for depth in atmosphere.structure:
+        lines += rows(depth, "15.6E", 5)
+    return "".join(lines)
+
+
+def write8f(file: Path | str | TextIO, atmosphere: Atmosphere) -> None:
+    """Writes an Atmosphere in the format of unit 8."""
+    utils.write_to_file(file, write8(atmosphere))
+
+
 # Read the input file
 
 
@@ -226,3 +310,349 @@ def readinput(text: str) -> dict[str, Any]:
                 }
             )
     return result
+
+
+def write5header(text: str, teff: float, grav: float) -> str:
+    """Returns the contents of an input file ({model}.5) of a stellar
+    atmosphere with TEFF and GRAV (log g) on its first line replaced, keeping
+    its comment.
+    """
+    first, newline, rest = text.partition("\n")
+    values, bang, comment = first.partition("!")
+    if len(values.split()) != 2:
+        raise ValueError("input file is not of a stellar atmosphere")
+    header = f" {teff:.1f} {grav:.4g}"
+    if bang:
+        header = header.ljust(len(values) - 1) + " " + bang + comment
+    return header + newline + rest
+
+
+def write5abundances(text: str, abundances: Mapping[int, float]) -> str:
+    """Returns the contents of an input file ({model}.5) with the abundances
+    (abd) in the atoms block replaced, by atomic number.
+    """
+    lines = text.splitlines(keepends=True)
+    natoms = None
+    nline = 0  # index of the line among those with data
+    for i, line in enumerate(lines):
+        if not utils.tokensfort(line.rstrip("\n")):
+            continue
+        if nline == 4:
+            natoms = int(utils.tokensfort(line)[0])
+        elif natoms is not None and 5 <= nline < 5 + natoms:
+            iatom = nline - 4
+            if iatom in abundances:
+                lines[i] = re.sub(
+                    r"^(\s*\S+\s+)\S+",
+                    lambda m: m.group(1) + format(abundances[iatom], ".6g"),
+                    line,
+                )
+        nline += 1
+    if natoms is None or max(abundances, default=0) > natoms:
+        raise ValueError("abundance of an element beyond NATOMS")
+    return "".join(lines)
+
+
+# Unit 19:
+
+
+class Line(NamedTuple):
+    alam: float  # wavelength in nm
+    anum: float  # species code: atomic number + charge / 100
+    gf: float  # log gf
+    excl: float  # energy of the lower level in cm^-1
+    ql: float  # J of the lower level
+    excu: float  # energy of the upper level in cm^-1
+    qu: float  # J of the upper level
+    agam: float  # radiative damping
+    gs: float  # Stark damping
+    gw: float  # Van der Waals damping
+    inext: int = 0
+
+    @property
+    def iatom(self) -> int:
+        return int(self.anum)
+
+    @property
+    def wavelength(self) -> float:
+        """Wavelength in Angstrom."""
+        return self.alam * 10
+
+
+def read19line(line: str) -> Line:
+    """Converts a line of a .19 file to a Line."""
+    tokens = line.split()
+    if len(tokens) < 10:
+        raise ValueError(f"unit 19 line has {len(tokens)} fields, 10 expected")
+    inext = int(tokens[10]) if len(tokens) > 10 else 0
+    return Line(*(utils.fortfloat(x) for x in tokens[:10]), inext)  # type: ignore
+
+
+def read19(text: str) -> list[Line]:
+    """Converts the contents of a .19 file to a python list."""
+    return [read19line(line) for line in text.splitlines() if line.strip()]
+
+
+def read19f(file: Path) -> list[Line]:
+    """Reads the contents of a .19 file."""
+    return read19(file.read_text())
+
+
+def write19line(line: Line) -> str:
+    """Converts a Line to a line storable in a .19 file."""
+    return (
+        f"{line.alam:10.4f}{line.anum:6.2f}{line.gf:7.3f}{line.excl:12.3f}"
+        f"{line.ql:4.1f}{line.excu:12.3f}{line.qu:4.1f}{line.agam:8.2f}"
+        f"{line.gs:7.2f}{line.gw:7.2f} {line.inext}\n"
+    )
+
+
+def write19(lines: list[Line]) -> str:
+    """Converts a list of Lines to a string storable in a .19 file."""
+    return "".join(write19line(line) for line in lines)
+
+
+def write19f(file: Path | str | TextIO, lines: list[Line]) -> None:
+    """Writes a list of Lines to a .19 file."""
+    utils.write_to_file(file, write19(lines))
+
+
+# Unit 12 (.iden):
+
+_ROMAN = {"I": 1, "V": 5, "X": 10}
+
+
+class IdenLine(NamedTuple):
+    wavelength: float  # in Angstrom
+    anum: float  # species code, as in unit 19
+    gf: float  # log gf
+    excl: float  # energy of the lower level in cm^-1
+    strength: float  # line to continuum opacity ratio at the line centre
+    eqw: float  # approximate equivalent width in mA
+
+
+def _roman(numeral: str) -> int:
+    values = [_ROMAN[c] for c in numeral]
+    return sum(-v if v < w else v for v, w in zip(values, values[1:] + [0]))
+
+
+def read12(text: str) -> list[IdenLine]:
+    """Converts the contents of a .iden file, the lines synspec found
+    significant, to a python list.
+    """
+    lines = []
+    for line in text.splitlines():
+        tokens = line.split()
+        if len(tokens) < 9:
+            continue
+        iatom = utils.elements.index(tokens[3])
+        anum = round(iatom + (_roman(tokens[4]) - 1) / 100, 2)
+        wavelength, gf, excl, strength, eqw = map(
+            utils.fortfloat, (tokens[2], *tokens[5:9])
+        )
+        lines.append(IdenLine(wavelength, anum, gf, excl, strength, eqw))
+    return lines
+
+
+def read12f(file: Path | str) -> list[IdenLine]:
+    """Reads the contents of a .iden file, which may be compressed (see
+    openunit).
+    """
+    with openunit(file) as f:
+        return read12(f.read())
+
+
+# Units 7 and 17 (.spec and .cont):
+
+
+class Spectrum(NamedTuple):
+    wavelength: np.ndarray  # in Angstrom
+    flux: np.ndarray
+
+
+def read7(text: str) -> Spectrum:
+    """Converts the contents of a .spec (unit 7) or .cont (unit 17) file to
+    arrays.
+    """
+    data = np.array(text.split(), dtype=float).reshape(-1, 2)
+    return Spectrum(data[:, 0], data[:, 1])
+
+
+def read7f(file: Path | str) -> Spectrum:
+    """Reads a .spec (unit 7) or .cont (unit 17) file, or its compressed or
+    packed version, see unitfile.
+    """
+    file = unitfile(file)
+    if file.suffix == PACKED:
+        data = np.load(file).reshape(-1, 2)
+    else:
+        with openunit(file) as f:
+            data = np.loadtxt(f, ndmin=2).reshape(-1, 2)
+    return Spectrum(data[:, 0], data[:, 1])
+
+
+def write7(spectrum: Spectrum) -> str:
+    """Converts a Spectrum to a string in the format of unit 7."""
+    return "".join(
+        f"{w:12.5f}{f:15.5E}\n" for w, f in zip(spectrum.wavelength, spectrum.flux)
+    )
+
+
+def write7f(file: Path | str | TextIO, spectrum: Spectrum) -> None:
+    """Writes a Spectrum in the format of unit 7."""
+    utils.write_to_file(file, write7(spectrum))
+
+
+class SpecFile:
+    """Random access to a .spec (unit 7) or .cont (unit 17) file without
+    reading all of it.
+
+    The file is memory-mapped and, as synspec writes rows of fixed width in
+    order of increasing wavelength, the rows of a wavelength range are found
+    by a binary search. Reading a window costs O(log n) plus its size. Use as
+    a context manager, or call close.
+
+    Packed files are memory-mapped as arrays. Compressed files can't be, so
+    they are decompressed in full when opened.
+    """
+
+    def __init__(self, file: Path | str):
+        self.file = unitfile(file)
+        self._array: np.ndarray | None = None
+        self._map: mmap.mmap | bytes = b""
+        self.rowlen = 0
+        if self.file.suffix == PACKED:
+            self._array = np.load(self.file, mmap_mode="r").reshape(-1, 2)
+            return
+        if self.file.suffix in COMPRESSED:
+            self._array = np.array(read7f(self.file)).T
+            return
+        with open(self.file, "rb") as f:
+            size = self.file.stat().st_size
+            self._map = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+            )
+        self.rowlen = self._map.find(b"\n") + 1
+        if size and (self.rowlen == 0 or size % self.rowlen):
+            self.close()
+            raise ValueError(f"{file} does not have rows of fixed width")
+
+    def __len__(self) -> int:
+        if self._array is not None:
+            return len(self._array)
+        return len(self._map) // self.rowlen if self.rowlen else 0
+
+    def __getitem__(self, i: int) -> float:
+        """The wavelength of row i."""
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        if self._array is not None:
+            return float(self._array[i, 0])
+        row = self._map[i * self.rowlen : (i + 1) * self.rowlen]  # noqa: E203
+        return float(row.split()[0])
+
+    def window(self, w0: float, w1: float) -> Spectrum:
+        """Returns the part of the spectrum with w0 <= wavelength <= w1 (in
+        Angstrom).
+        """
+        i0 = bisect.bisect_left(self, w0)
+        i1 = bisect.bisect_right(self, w1, lo=i0)
+        data = self.rows(i0, i1)
+        return Spectrum(data[:, 0], data[:, 1])
+
+    def rows(self, i0: int, i1: int) -> np.ndarray:
+        """Returns rows i0 to i1 (exclusive) as an array of (wavelength, flux)
+        rows.
+        """
+        if self._array is not None:
+            return np.array(self._array[i0:i1], dtype=float)
+        return np.array(
+            self._map[i0 * self.rowlen : i1 * self.rowlen].split(),  # noqa: E203
+            dtype=float,
+        ).reshape(-1, 2)
+
+    def close(self) -> None:
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._array = None
+
+    def __enter__(self) -> "SpecFile":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+
+def read7window(file: Path | str, w0: float, w1: float) -> Spectrum:
+    """Reads the part of a .spec (unit 7) or .cont (unit 17) file with
+    w0 <= wavelength <= w1 (in Angstrom), see SpecFile.
+    """
+    with SpecFile(file) as spec:
+        return spec.window(w0, w1)
+
+
+# Compressed and packed output units:
+
+# Suffixes of compressed units and the functions opening them.
+COMPRESSED: dict[str, Callable[..., IO]] = {
+    ".gz": gzip.open,
+    ".xz": lzma.open,
+    ".bz2": bz2.open,
+}
+# Suffix of packed units: numpy .npy files of (wavelength, flux) rows.
+PACKED = ".npy"
+# Output formats and the suffix they add to the name of the file.
+OUTPUT_FORMATS = {
+    "gzip": ".gz",
+    "xz": ".xz",
+    "bz2": ".bz2",
+    "float32": PACKED,
+    "float64": PACKED,
+}
+
+
+def unitfile(file: Path | str) -> Path:
+    """Returns the file if it exists, otherwise its compressed or packed
+    version (e.g. x.spec.gz for x.spec).
+    """
+    file = Path(file)
+    if file.exists():
+        return file
+    for suffix in (*COMPRESSED, PACKED):
+        if (variant := file.with_name(file.name + suffix)).exists():
+            return variant
+    raise FileNotFoundError(f"{file} not found")
+
+
+def openunit(file: Path | str, mode: str = "rt") -> IO:
+    """Opens a unit file, decompressing it on the fly if it is compressed."""
+    file = unitfile(file) if "r" in mode else Path(file)
+    return COMPRESSED.get(file.suffix, open)(file, mode)
+
+
+def storeunit(src: Path | str, dst: Path | str, format: str | None = None) -> Path:
+    """Copies a unit file to dst, in the given output format (see
+    OUTPUT_FORMATS). Packed formats apply to units 7 and 17 only, other units
+    are stored as they are. Versions of dst in other formats are removed, so
+    that readers don't pick up stale outputs. The source may itself be stored
+    in any format, see unitfile. Returns the file written.
+    """
+    src = unitfile(src)
+    dst = Path(dst)
+    suffix = OUTPUT_FORMATS[format] if format is not None else ""
+    packed = suffix == PACKED and dst.suffix in (".spec", ".cont")
+    if suffix == PACKED and not packed:
+        suffix = ""
+    file = dst.with_name(dst.name + suffix)
+    for stale in (dst, *(dst.with_name(dst.name + s) for s in (*COMPRESSED, PACKED))):
+        if stale != file:
+            stale.unlink(missing_ok=True)
+    if packed:
+        np.save(file, np.array(read7f(src), dtype=format).T)
+    elif src.suffix == PACKED:
+        with openunit(file, "wt") as fdst:
+            fdst.write(write7(read7f(src)))
+    else:
+        with openunit(src, "rb") as fsrc, openunit(file, "wb") as fdst:
+            shutil.copyfileobj(fsrc, fdst)
+    return file
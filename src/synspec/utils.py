@@ -1,3 +1,6 @@
+import hashlib
+import json
+import shutil
 import time
 import uuid
 from contextlib import contextmanager
@@ -139,6 +142,62 @@ def symlinkf(
     dst.symlink_to(src, target_is_directory=target_is_directory)
 
 
+def copyf(src: str | Path, dst: str | Path) -> None:
+    """Copy a file or directory. If dst already exists, delete it first. A
+    partially copied dst is removed if copying fails.
+    """
+    src, dst = Path(src), Path(dst)
+    if resolve_parent(dst) == resolve_parent(src):
+        raise ValueError(f"src and dst are the same: {dst.resolve()}")
+    removef(dst)
+    try:
+        if src.is_dir():
+            shutil.copytree(src, dst)
+        else:
+            shutil.copyfile(src, dst)
+    except BaseException:
+        removef(dst)
+        raise
+
+
+def removef(path: Path) -> None:
+    """Remove a file, link or directory tree if it exists."""
+    if path.is_symlink() or path.is_file():
+        path.unlink()
+    elif path.is_dir():
+        shutil.rmtree(path)
+
+
+def du(path: str | Path) -> int:
+    """Total size in bytes of a file or of the files in a directory tree."""
+    path = Path(path)
+    if not path.is_dir():
+        return path.stat().st_size
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def statkey(path: str | Path) -> str:
+    """Key identifying a version of a file or directory tree by path, size and
+    modification time, without reading its contents.
+    """
+    path = Path(path).resolve()
+    st = path.stat()
+    parts = [f"{path}:{st.st_size}:{st.st_mtime_ns}"]
+    if path.is_dir():
+        for file in sorted(path.rglob("*")):
+            st = file.stat()
+            parts.append(f"{file.relative_to(path)}:{st.st_size}:{st.st_mtime_ns}")
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def jsonable(data: Any) -> Any:
+    """Round trips data through json, so that it compares equal to what is
+    read back from a json file (tuples turn into lists, keys into strings).
+    Values json can't represent are converted with str.
+    """
+    return json.loads(json.dumps(data, default=str))
+
+
 def resolve_parent(path: Path) -> Path:
     """Resolve a path to its parent directory."""
     if not path.is_symlink():
@@ -218,9 +277,9 @@ def write_to_file(file: Path | str | TextIO, content: str) -> None:
 def fortfloat(text: str) -> float:
     """Convert Fortran-style float to python float."""
     text = text.strip()
-    if text.endswith("d"):
+    if text.endswith(("d", "D")):
         text = text[:-1]
-    text.replace("d", "e")
+    text = text.replace("d", "e").replace("D", "e")
     try:
         return float(text)
     except ValueError:
@@ -0,0 +1,378 @@
+import argparse
+import dataclasses
+import json
+import socket
+import threading
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any, Callable, Mapping, Sequence
+
+import numpy as np
+
+from synspec import units, utils
+from synspec.synspec import RunPlan, Synspec, staging_dir, tempdir
+
+# Units written by a run, removed before each re-run so that a failed run
+# can't publish the spectrum of the previous one.
+OUTPUT_UNITS = ("fort.7", "fort.12", "fort.16", "fort.17")
+
+
+@dataclass(frozen=True)
+class Update:
+    """The result of a re-run.
+
+    run: number of the run, counting from 1.
+    spectrum: the synthetic spectrum, None if the run failed.
+    continuum: the continuum, None if the run failed.
+    wall: seconds from noticing the change to the spectrum being read.
+    error: message of the exception if the run failed.
+    """
+
+    run: int
+    spectrum: units.Spectrum | None
+    continuum: units.Spectrum | None
+    wall: float
+    error: str | None = None
+
+
+def effective_inputs(plan: RunPlan) -> dict[str, Any]:
+    """The inputs of a planned run as synspec sees them: the parsed input
+    file, fort.55 and fort.56, and the versions (see utils.statkey) of the
+    other files. Edits that don't change these, such as reformatting the
+    input file, don't change the spectrum.
+    """
+    parsed = {f"{plan.model}.5", "fort.55", "fort.56"}
+    inputs: dict[str, Any] = {
+        "input": plan.modelinput,
+        "config": dataclasses.asdict(plan.config),
+        "files": {
+            name: utils.statkey(src) if src.exists() else None
+            for name, src in sorted(plan.links.items())
+            if name not in parsed
+        },
+    }
+    if "fort.56" in plan.links:
+        inputs["fort.56"] = units.read56f(plan.links["fort.56"])
+    return utils.jsonable(inputs)
+
+
+def _stamp(path: Path) -> tuple[int, int] | None:
+    """Size and modification time of a file, None if it doesn't exist."""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def encode(update: Update) -> bytes:
+    """Encodes an update as a json header line, followed by the (wavelength,
+    flux) rows of the spectrum and of the continuum as little-endian float64.
+    """
+    spectra = (update.spectrum, update.continuum)
+    arrays = [np.empty((0, 2)) if s is None else np.column_stack(s) for s in spectra]
+    header = {
+        "run": update.run,
+        "wall": update.wall,
+        "error": update.error,
+        "rows": [None if s is None else len(a) for s, a in zip(spectra, arrays)],
+    }
+    return (json.dumps(header) + "\n").encode() + b"".join(
+        a.astype("<f8").tobytes() for a in arrays
+    )
+
+
+def receive(f: IO[bytes]) -> Update | None:
+    """Reads the next update published to a socket (see Publisher) from its
+    binary file, see socket.makefile. Returns None at the end of the stream.
+    """
+    line = f.readline()
+    if not line:
+        return None
+    header = json.loads(line)
+    spectra: list[units.Spectrum | None] = []
+    for rows in header["rows"]:
+        if rows is None:
+            spectra.append(None)
+            continue
+        data = f.read(rows * 16)
+        if len(data) < rows * 16:
+            return None
+        array = np.frombuffer(data, dtype="<f8").reshape(-1, 2)
+        spectra.append(units.Spectrum(array[:, 0], array[:, 1]))
+    return Update(
+        header["run"], spectra[0], spectra[1], header["wall"], header["error"]
+    )
+
+
+class Publisher:
+    """Publishes updates to the clients of a local (Unix domain) socket, in a
+    background thread, as a context manager. Clients connect at any time and
+    receive the updates published after they connected, see receive. Clients
+    that can't be written to are dropped.
+
+    address: path of the socket. An existing socket file is replaced.
+    """
+
+    def __init__(self, address: str | Path):
+        self.address = Path(address)
+        utils.removef(self.address)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(str(self.address))
+        self._server.listen()
+        self._clients: list[socket.socket] = []
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return  # Closed.
+            with self._lock:
+                self._clients.append(client)
+
+    @property
+    def clients(self) -> int:
+        with self._lock:
+            return len(self._clients)
+
+    def publish(self, update: Update) -> None:
+        message = encode(update)
+        with self._lock:
+            for client in list(self._clients):
+                try:
+                    client.sendall(message)
+                except OSError:
+                    client.close()
+                    self._clients.remove(client)
+
+    def __enter__(self) -> "Publisher":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        # shutdown wakes up the accepting thread.
+        try:
+            self._server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._server.close()
+        self._thread.join()
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients.clear()
+        self.address.unlink(missing_ok=True)
+
+
+class Watcher:
+    """Re-runs a model whenever its inputs change, in a warm run directory, as
+    a context manager.
+
+    The run directory is set up once and kept. On each poll the files linked
+    into it are checked for changes by size and modification time; when one
+    changed, the run is planned again and re-run only if its effective inputs
+    (see effective_inputs) changed, so that saving an input file without
+    changing what it says costs no run. Only the inputs that changed are
+    staged again. Each run is published as an Update to the callback and to
+    the clients of the socket at address, if given. Runs that fail, including
+    those of inputs that can't be parsed, are published with their error; the
+    watcher carries on with the next change.
+
+    Files are polled rather than watched through inotify, which isn't in the
+    standard library; polling a handful of files every interval costs little.
+    Changes inside linked directories (the atomic data) are not noticed.
+
+    synspec: Synspec object to run with.
+    model, basedir, links: see Synspec.plan.
+    stage: stage the run directory in memory, see Synspec.run.
+    interval: seconds between polls, see serve.
+    callback: called with each Update.
+    address: path of a socket to publish updates to, see Publisher.
+    outdir: directory to also write the output files of each run to, relative
+            to basedir.
+    outfile: name (without extension) of the output files.
+    """
+
+    def __init__(
+        self,
+        synspec: Synspec,
+        model: str,
+        basedir: str | Path | None = None,
+        links: Mapping[str, str | Path] | None = None,
+        stage: bool | str | Path = False,
+        interval: float = 0.25,
+        callback: Callable[[Update], None] | None = None,
+        address: str | Path | None = None,
+        outdir: str | Path | None = None,
+        outfile: str | None = None,
+    ):
+        self.synspec = synspec
+        self.model = model
+        self.basedir = (
+            Path.cwd().resolve() if basedir is None else Path(basedir).resolve()
+        )
+        self.links = links
+        self.stage = stage
+        self.interval = interval
+        self.callback = callback
+        self.address = address
+        self.outdir = outdir
+        self.outfile = outfile
+        self.runs = 0
+        self.rundir: Path | None = None
+        self._copy = False
+        self._stack = ExitStack()
+        self._publisher: Publisher | None = None
+        self._watched: dict[Path, tuple[int, int] | None] | None = None
+        self._inputs: dict[str, Any] | None = None
+        self._staged: dict[str, tuple[Path, tuple[int, int] | None]] = {}
+
+    def __enter__(self) -> "Watcher":
+        staging = staging_dir(self.stage)
+        self._copy = staging is not None
+        self.rundir = self._stack.enter_context(tempdir(dir=staging))
+        if self.address is not None:
+            self._publisher = self._stack.enter_context(Publisher(self.address))
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self._stack.close()
+        self.rundir = None
+
+    def _changed(self) -> bool:
+        """Whether any watched file changed since the last poll."""
+        if self._watched is None:
+            return True
+        return any(_stamp(path) != stamp for path, stamp in self._watched.items())
+
+    def _watch(self, paths: Sequence[Path]) -> None:
+        self._watched = {path: _stamp(path) for path in paths}
+
+    def poll(self) -> Update | None:
+        """Re-runs the model if its effective inputs changed since the last
+        run, and returns the Update published, or None if nothing changed.
+        The first poll always runs.
+        """
+        if self.rundir is None:
+            raise RuntimeError("Watcher used outside of its context")
+        if not self._changed():
+            return None
+        start = time.perf_counter()
+        try:
+            plan = self.synspec.plan(self.model, self.basedir, self.links)
+        except Exception as e:
+            # Probably saved halfway; the next change triggers a run.
+            default = [self.basedir / f"{self.model}.5", self.basedir / "fort.55"]
+            self._watch([*(self._watched or {}), *default])
+            self._inputs = None
+            return self._publish(None, start, e)
+        self._watch([src for src in plan.links.values() if not src.is_dir()])
+        inputs = effective_inputs(plan)
+        if inputs == self._inputs:
+            return None
+        self._inputs = inputs
+        try:
+            self._restage(plan)
+            for unit in OUTPUT_UNITS:
+                (self.rundir / unit).unlink(missing_ok=True)
+            outdir = None if self.outdir is None else plan.basedir / self.outdir
+            self.synspec.run_staged(plan, self.rundir, outdir, self.outfile)
+            spectrum = units.read7f(self.rundir / "fort.7")
+            continuum = units.read7f(self.rundir / "fort.17")
+        except Exception as e:
+            self._inputs = None
+            return self._publish(None, start, e)
+        return self._publish((spectrum, continuum), start, None)
+
+    def _restage(self, plan: RunPlan) -> None:
+        """Stages the inputs of plan that changed since they were staged, and
+        removes those that are no longer used.
+        """
+        assert self.rundir is not None
+        staged = {name: (src, _stamp(src)) for name, src in plan.links.items()}
+        for name in set(self._staged) - set(staged):
+            utils.removef(self.rundir / name)
+        changed = {
+            name: src
+            for name, src in plan.links.items()
+            if self._staged.get(name) != staged[name]
+        }
+        # Forget what was staged until it is, in case staging fails.
+        self._staged = {}
+        self.synspec.stage_inputs(
+            dataclasses.replace(plan, links=changed), self.rundir, copy=self._copy
+        )
+        self._staged = staged
+
+    def _publish(
+        self,
+        spectra: tuple[units.Spectrum, units.Spectrum] | None,
+        start: float,
+        error: Exception | None,
+    ) -> Update:
+        self.runs += 1
+        spectrum, continuum = spectra if spectra is not None else (None, None)
+        update = Update(
+            self.runs,
+            spectrum,
+            continuum,
+            time.perf_counter() - start,
+            None if error is None else f"{type(error).__name__}: {error}",
+        )
+        if self.callback is not None:
+            self.callback(update)
+        if self._publisher is not None:
+            self._publisher.publish(update)
+        return update
+
+    def serve(self, stop: threading.Event | None = None) -> None:
+        """Polls every interval until stop is set (forever by default)."""
+        stop = stop or threading.Event()
+        while not stop.is_set():
+            self.poll()
+            stop.wait(self.interval)
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m synspec.watch",
+        description="Re-run synspec whenever the inputs of a model change.",
+    )
+    parser.add_argument("model", help="model name, relative to basedir")
+    parser.add_argument("--basedir", default=None)
+    parser.add_argument("--synspec", default="synspec", help="synspec executable")
+    parser.add_argument("--socket", default=None, help="socket to publish updates to")
+    parser.add_argument("--outdir", default=None, help="also write output files here")
+    parser.add_argument("--interval", type=float, default=0.25)
+    parser.add_argument("--stage", action="store_true", help="stage in memory")
+    args = parser.parse_args(argv)
+
+    def report(update: Update) -> None:
+        points = 0 if update.spectrum is None else update.spectrum.wavelength.size
+        status = update.error or f"{points} points"
+        print(f"run {update.run}: {status} ({update.wall:.2f} s)", flush=True)
+
+    watcher = Watcher(
+        Synspec(args.synspec),
+        args.model,
+        basedir=args.basedir,
+        stage=args.stage,
+        interval=args.interval,
+        callback=report,
+        address=args.socket,
+        outdir=args.outdir,
+    )
+    with watcher:
+        try:
+            watcher.serve()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
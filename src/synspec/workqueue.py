@@ -0,0 +1,280 @@
+import argparse
+import dataclasses
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, Sequence
+
+from synspec.batch import Job, JobResult, record, run_job
+from synspec.metrics import Metrics, MetricsServer
+
+STATES = ("pending", "leased", "done", "failed")
+
+
+@dataclass(frozen=True)
+class Lease:
+    name: str
+    path: Path
+    job: Job
+    worker: str
+    attempts: int = 0
+
+
+class WorkQueue:
+    """A queue of jobs kept as files in a (shared) directory.
+
+    Each job is a json file that moves between the subdirectories pending/,
+    leased/, done/ and failed/. Jobs are claimed by renaming them into
+    leased/, which is atomic on POSIX filesystems including NFS, so any number
+    of workers on any number of nodes can share one queue. A worker keeps its
+    lease alive by touching the leased file; leases that have not been touched
+    for `lease` seconds are returned to pending/ by `reclaim`, so the jobs of
+    crashed workers are picked up again.
+
+    Results are written to results/ and, unless a job sets its own outdir, the
+    output files to output/. Jobs that exceeded their resource limits are
+    returned to pending/ to be retried, possibly on another node, until they
+    have been attempted `max_attempts` times.
+
+    As lease expiry compares file modification times, `lease` should be large
+    compared to the clock skew between the nodes.
+    """
+
+    def __init__(self, path: str | Path, lease: float = 600.0, max_attempts: int = 3):
+        self.path = Path(path).resolve()
+        self.lease = lease
+        self.max_attempts = max_attempts
+        for state in STATES + ("results", "output", "tmp"):
+            (self.path / state).mkdir(parents=True, exist_ok=True)
+
+    def submit(self, jobs: Iterable[Job]) -> list[str]:
+        """Adds jobs to the queue and returns their names."""
+        names = []
+        for job in jobs:
+            name = job.name
+            if "/" in name or "@" in name:
+                raise ValueError(f"job name may not contain '/' or '@': {name}")
+            if self.state(name) is not None:
+                raise ValueError(f"job {name} already in queue")
+            if job.outdir is None:
+                job = dataclasses.replace(job, outdir=str(self.path / "output"))
+            self._write(
+                self.path / "pending" / f"{name}.json",
+                {"job": job.to_dict(), "attempts": 0},
+            )
+            names.append(name)
+        return names
+
+    def claim(self, worker: str) -> Lease | None:
+        """Claims a pending job for the worker. Returns None if there is none."""
+        for file in sorted((self.path / "pending").iterdir()):
+            name = file.stem
+            leased = self.path / "leased" / f"{name}@{worker}.json"
+            try:
+                os.rename(file, leased)
+                # The rename keeps the submission time, start the lease now.
+                # If the lease was reclaimed in between, the file is gone.
+                os.utime(leased)
+                data = json.loads(leased.read_text())
+            except FileNotFoundError:
+                continue
+            job = Job.from_dict(data["job"])
+            return Lease(name, leased, job, worker, data["attempts"])
+        return None
+
+    def heartbeat(self, lease: Lease) -> bool:
+        """Renews the lease. Returns False if the lease has been lost."""
+        try:
+            os.utime(lease.path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def complete(self, lease: Lease, result: JobResult) -> bool:
+        """Records the result of a leased job. Returns False if the lease had
+        been lost, in which case the result is discarded.
+        """
+        if not lease.path.exists():
+            return False
+        self._write(self.path / "results" / f"{lease.name}.json", result.to_dict())
+        if result.status == "resource" and lease.attempts + 1 < self.max_attempts:
+            # Reschedule, with the attempt counted.
+            self._write(
+                self.path / "leased" / lease.path.name,
+                {"job": lease.job.to_dict(), "attempts": lease.attempts + 1},
+            )
+            state = "pending"
+        else:
+            state = "done" if result.status == "done" else "failed"
+        try:
+            os.rename(lease.path, self.path / state / f"{lease.name}.json")
+        except FileNotFoundError:
+            return False
+        return True
+
+    def reclaim(self) -> list[str]:
+        """Returns expired leases to pending and returns their names."""
+        now = time.time()
+        reclaimed = []
+        for file in (self.path / "leased").iterdir():
+            name = file.stem.rpartition("@")[0]
+            try:
+                if now - file.stat().st_mtime <= self.lease:
+                    continue
+                os.rename(file, self.path / "pending" / f"{name}.json")
+            except FileNotFoundError:
+                continue
+            reclaimed.append(name)
+        return reclaimed
+
+    def state(self, name: str) -> str | None:
+        """Returns the state of the named job, or None if it is not queued."""
+        for state in STATES:
+            if state == "leased":
+                if any((self.path / state).glob(f"{name}@*.json")):
+                    return state
+            elif (self.path / state / f"{name}.json").exists():
+                return state
+        return None
+
+    def counts(self) -> dict[str, int]:
+        """Returns the number of jobs in each state."""
+        return {
+            state: sum(1 for _ in (self.path / state).glob("*.json"))
+            for state in STATES
+        }
+
+    def results(self) -> Iterator[JobResult]:
+        for file in sorted((self.path / "results").glob("*.json")):
+            yield JobResult.from_dict(json.loads(file.read_text()))
+
+    def _write(self, file: Path, data: dict) -> None:
+        # Write to a temporary file first, so readers never see partial files.
+        tmp = self.path / "tmp" / f"{uuid.uuid4()}.json"
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, file)
+
+
+class _Heartbeat:
+    """Context manager renewing a lease in a background thread."""
+
+    def __init__(self, queue: WorkQueue, lease: Lease):
+        self.queue = queue
+        self.lease = lease
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, daemon=True)
+
+    def _beat(self) -> None:
+        while not self._stop.wait(self.queue.lease / 3):
+            if not self.queue.heartbeat(self.lease):
+                return
+
+    def __enter__(self) -> "_Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def default_worker_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def work(
+    path: str | Path,
+    lease: float = 600.0,
+    poll: float = 5.0,
+    worker: str | None = None,
+    wait: bool = False,
+    max_attempts: int = 3,
+    metrics: Metrics | None = None,
+) -> int:
+    """Runs jobs from the queue until it is finished. Returns the number of
+    jobs this worker ran.
+
+    poll: seconds to sleep when no job is available.
+    worker: name of the worker. Defaults to hostname and pid.
+    wait: keep waiting for new jobs when the queue is finished.
+    max_attempts: times a job exceeding its resource limits is attempted.
+    metrics: metrics to record the jobs of this worker and the state of the
+             queue in. They are published after every job and poll.
+    """
+    queue = WorkQueue(path, lease, max_attempts)
+    if worker is None:
+        worker = default_worker_name()
+    njobs = 0
+    while True:
+        reclaimed = queue.reclaim()
+        claimed = queue.claim(worker)
+        if metrics is not None:
+            _record_queue(metrics, queue, len(reclaimed))
+        if claimed is None:
+            counts = queue.counts()
+            if not wait and counts["pending"] == 0 and counts["leased"] == 0:
+                return njobs
+            time.sleep(poll)
+            continue
+        with _Heartbeat(queue, claimed):
+            result = run_job(claimed.job)
+        queue.complete(claimed, result)
+        njobs += 1
+        if metrics is not None:
+            record(metrics, result)
+            metrics.publish()
+
+
+def _record_queue(metrics: Metrics, queue: WorkQueue, reclaimed: int) -> None:
+    jobs = metrics.gauge("synspec_queue_jobs", "Jobs in the queue by state.")
+    for state, count in queue.counts().items():
+        jobs.set(count, state=state)
+    metrics.counter(
+        "synspec_queue_reclaimed", "Expired leases returned to pending."
+    ).inc(reclaimed)
+    metrics.publish()
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m synspec.workqueue",
+        description="Run a worker on a shared synspec work queue.",
+    )
+    parser.add_argument("queue", help="queue directory")
+    parser.add_argument("--lease", type=float, default=600.0)
+    parser.add_argument("--poll", type=float, default=5.0)
+    parser.add_argument("--worker", default=None)
+    parser.add_argument("--wait", action="store_true")
+    parser.add_argument("--max-attempts", type=int, default=3)
+    parser.add_argument(
+        "--metrics-file", default=None, help="file to write OpenMetrics text to"
+    )
+    parser.add_argument(
+        "--metrics-port", type=int, default=None, help="local port to serve metrics on"
+    )
+    args = parser.parse_args(argv)
+    metrics = None
+    with ExitStack() as stack:
+        if args.metrics_file is not None or args.metrics_port is not None:
+            metrics = Metrics(args.metrics_file)
+            if args.metrics_port is not None:
+                stack.enter_context(MetricsServer(metrics, args.metrics_port))
+        work(
+            args.queue,
+            args.lease,
+            args.poll,
+            args.worker,
+            args.wait,
+            args.max_attempts,
+            metrics,
+        )
+
+
+if __name__ == "__main__":
+    main()
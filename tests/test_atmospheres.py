@@ -0,0 +1,115 @@
+import dataclasses
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from synspec import atmospheres, units
+from synspec.synspec import Synspec
+from tests.test_synspec import MODELS_ROOT, copy_model
+
+MODEL = f"{MODELS_ROOT}/hhe35lt/input/hhe35lt"
+
+
+def hotter(atmosphere: units.Atmosphere, factor: float) -> units.Atmosphere:
+    structure = atmosphere.structure.copy()
+    structure[:, 0] *= factor
+    return dataclasses.replace(atmosphere, structure=structure)
+
+
+def test_depthscale() -> None:
+    atmosphere = units.read8f(f"{MODEL}.7")
+    tau = 10 ** atmospheres.depthscale(atmosphere, "tau")
+    assert np.all(np.diff(tau) > 0)
+    # Electron scattering of a hot atmosphere: about 0.2-0.4 cm^2/g.
+    assert 0.1 < tau[-1] / atmosphere.dm[-1] < 0.5
+    np.testing.assert_allclose(
+        10 ** atmospheres.depthscale(atmosphere, "mass"), atmosphere.dm
+    )
+    with pytest.raises(ValueError):
+        atmospheres.depthscale(atmosphere, "height")
+
+
+def test_weights() -> None:
+    points = [(30000.0, 4.0), (35000.0, 4.0), (30000.0, 4.5), (35000.0, 4.5)]
+    w = atmospheres.weights(points, 31000.0, 4.25)
+    assert w == pytest.approx(
+        {
+            (30000.0, 4.0): 0.4,
+            (35000.0, 4.0): 0.1,
+            (30000.0, 4.5): 0.4,
+            (35000.0, 4.5): 0.1,
+        }
+    )
+    assert atmospheres.weights(points, 35000.0, 4.5) == {(35000.0, 4.5): 1.0}
+    with pytest.raises(ValueError):
+        atmospheres.weights(points, 36000.0, 4.0)
+    with pytest.raises(ValueError):
+        atmospheres.weights(points[:3], 31000.0, 4.25)
+
+
+@pytest.mark.parametrize("scale", atmospheres.SCALES)
+def test_interpolate_grid_point(scale: str) -> None:
+    atmosphere = units.read8f(f"{MODEL}.7")
+    grid = {(35000.0, 4.0): atmosphere, (40000.0, 4.0): hotter(atmosphere, 1.2)}
+    result = atmospheres.interpolate(grid, 35000.0, 4.0, scale)
+    np.testing.assert_allclose(result.dm, atmosphere.dm, rtol=1e-12)
+    np.testing.assert_allclose(result.structure, atmosphere.structure, rtol=1e-12)
+
+
+def test_interpolate() -> None:
+    atmosphere = units.read8f(f"{MODEL}.7")
+    grid = {(35000.0, 4.0): atmosphere, (40000.0, 4.0): hotter(atmosphere, 1.21)}
+    result = atmospheres.interpolate(grid, 37500.0, 4.0, "mass")
+    np.testing.assert_allclose(result.temperature, atmosphere.temperature * 1.1)
+    np.testing.assert_allclose(result.density, atmosphere.density)
+    assert result.numpar == atmosphere.numpar
+
+
+def test_interpolate_mismatch() -> None:
+    atmosphere = units.read8f(f"{MODEL}.7")
+    other = units.read8f(f"{MODELS_ROOT}/EHeT30g4/input/EHeT30g4.7")
+    with pytest.raises(ValueError):
+        atmospheres.interpolate(
+            {(35000.0, 4.0): atmosphere, (30000.0, 4.0): other}, 32000.0, 4.0
+        )
+
+
+def test_interpolate_model(tmp_path: Path) -> None:
+    for name, teff, factor in (("cool", 35000.0, 1.0), ("hot", 40000.0, 1.2)):
+        text = Path(f"{MODEL}.5").read_text()
+        Path(tmp_path, f"{name}.5").write_text(units.write5header(text, teff, 4.0))
+        units.write8f(
+            tmp_path / f"{name}.7", hotter(units.read8f(f"{MODEL}.7"), factor)
+        )
+
+    atmospheres.interpolate_model(
+        [tmp_path / "cool", tmp_path / "hot"], 38000.0, 4.0, tmp_path / "new"
+    )
+
+    modelinput = units.readinput((tmp_path / "new.5").read_text())
+    assert (modelinput["teff"], modelinput["grav"]) == (38000.0, 4.0)
+    # The rest of the input is that of the nearest model.
+    assert (tmp_path / "new.5").read_text().splitlines()[1:] == Path(
+        f"{tmp_path}/hot.5"
+    ).read_text().splitlines()[1:]
+    assert units.read8f(tmp_path / "new.7").nd == 70
+
+
+def test_interpolated_model_runs(tmp_path: Path) -> None:
+    """Synspec.run takes the interpolated pair directly."""
+    model = "hhe35lt"
+    copy_model(model, ["fort.19", "fort.55", "{model}.5", "{model}.7"], str(tmp_path))
+    shutil.copy(f"{MODEL}.7", tmp_path / "hot.7")
+    Path(tmp_path, "hot.5").write_text(
+        units.write5header(Path(f"{MODEL}.5").read_text(), 40000.0, 4.0)
+    )
+    atmospheres.interpolate_model(
+        [tmp_path / model, tmp_path / "hot"], 37000.0, 4.0, tmp_path / "new"
+    )
+
+    synspec = Synspec("synspec", 51)
+    synspec.add_link("data")
+    synspec.run("new", rundir=None, basedir=tmp_path)
+    assert (tmp_path / "new.spec").exists()
@@ -0,0 +1,137 @@
+import glob
+import os
+import shutil
+from dataclasses import fields
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from synspec import atoms, units
+from synspec.synspec import Synspec
+from tests.test_synspec import MODELS_ROOT, PROJECT_ROOT, fake_synspec
+
+DATA = Path(f"{MODELS_ROOT}/EHeT30g4/data")
+
+
+def assert_atoms_equal(atom1: atoms.ModelAtom, atom2: atoms.ModelAtom) -> None:
+    for name in ("levels", "continua", "lines"):
+        part1, part2 = getattr(atom1, name), getattr(atom2, name)
+        for field in fields(part1):
+            np.testing.assert_array_equal(
+                getattr(part1, field.name), getattr(part2, field.name)
+            )
+
+
+def test_readatom() -> None:
+    atom = atoms.readatomf(DATA / "he1_14lev.dat")
+    assert len(atom.levels) == 14
+    assert atom.levels.enion[0] == 5.94503520e15
+    assert atom.levels.g[3] == 9.0
+    assert atom.levels.nquant[-1] == 8
+    assert atom.levels.typlev[0] == "1 sing S"
+    assert atom.levels.imodl[-1] == -108
+
+    assert len(atom.continua) == 14
+    assert (atom.continua.lower[0], atom.continua.upper[0]) == (1, 15)
+    assert atom.continua.osc[0] == 1.64
+
+    assert (atom.lines.lower[3], atom.lines.upper[3]) == (1, 5)
+    assert atom.lines.mode[3] == -1
+    assert atom.lines.osc[3] == 0.2762
+    assert atom.lines.extra[3].split() == ["F", "1", "7", "0.", "0."]
+    assert atom.lines.extra[0] == ""
+
+
+def test_readatom_tabulated() -> None:
+    """Cross-sections tabulated on continuation lines."""
+    atom = atoms.readatomf(DATA / "o1_14+8lev.dat")
+    assert len(atom.levels) == 22
+    assert atom.levels.typlev[13] == "O I +3__ 1"
+    assert atom.continua.ifancy[0] == 117
+    assert atom.continua.osc[0] == 3.855e-19
+    assert len(atom.continua.extra[0].splitlines()) == 4
+
+
+@pytest.mark.parametrize(
+    "file", sorted(glob.glob(f"{MODELS_ROOT}/*/data/*.dat")), ids=os.path.basename
+)
+def test_readatom_bundled(file: str) -> None:
+    if file.endswith("prf.dat"):
+        pytest.skip("not an ion data file")
+    atom = atoms.readatomf(file)
+    assert len(atom.continua) == len(atom.levels)
+    assert atom.lines.upper.max() <= len(atom.levels)
+
+
+def test_readatom_invalid() -> None:
+    with pytest.raises(ValueError):
+        atoms.readatom("****** Levels\n 5.9D+15 1. 1\n")
+    with pytest.raises(ValueError):
+        atoms.readatom("* no sections\n")
+
+
+def test_save_load(tmp_path: Path) -> None:
+    atom = atoms.readatomf(DATA / "he1_14lev.dat")
+    atoms.save(atom, tmp_path / "he1.npz")
+    assert_atoms_equal(atoms.load(tmp_path / "he1.npz"), atom)
+
+
+def test_cached(tmp_path: Path) -> None:
+    file = tmp_path / "he2.dat"
+    file.write_text((DATA / "he2_14lev.dat").read_text())
+    atom = atoms.cached(file, tmp_path / "cache")
+    assert atoms.cached(file, tmp_path / "cache") is atom
+    (cachefile,) = (tmp_path / "cache").iterdir()
+    assert_atoms_equal(atoms.load(cachefile), atom)
+
+
+@pytest.mark.parametrize("model", ["EHeT30g4", "hhe35lt"])
+def test_validate(model: str) -> None:
+    modelinput = units.readinput(
+        Path(f"{MODELS_ROOT}/{model}/input/{model}.5").read_text()
+    )
+    atoms.validate(modelinput, f"{MODELS_ROOT}/{model}")
+
+
+def test_validate_nlevs() -> None:
+    modelinput = units.readinput(
+        Path(f"{MODELS_ROOT}/EHeT30g4/input/EHeT30g4.5").read_text()
+    )
+    modelinput["ions"][1]["nlevs"] = 15
+    with pytest.raises(ValueError, match="he1_14lev.dat has 14 levels"):
+        atoms.validate(modelinput, f"{MODELS_ROOT}/EHeT30g4")
+
+
+def test_synspec_validate_atoms(tmp_path: Path) -> None:
+    """A mismatched ion fails before synspec is started."""
+    model = "hhe35lt"
+    synspec = Synspec(fake_synspec(tmp_path, "touch started", None), 51)
+    deck = tmp_path / f"{model}.5"
+    deck.write_text(deck.read_text().replace("2     0    14", "2     0    25"))
+    synspec.add_link("data")
+    os.chdir(tmp_path)
+    try:
+        with pytest.raises(ValueError, match="he1.dat has 24 levels"):
+            synspec.run(model, rundir="run")
+    finally:
+        os.chdir(PROJECT_ROOT)
+    assert not (tmp_path / "run" / "started").exists()
+
+
+def test_validate_headerless(tmp_path: Path) -> None:
+    """Ion files without section comments, which synspec accepts, only warn."""
+    model = "hhe35lt"
+    synspec = Synspec(fake_synspec(tmp_path, "touch started", None), 51)
+    # The data directory is linked; edit a copy.
+    (tmp_path / "data").unlink()
+    shutil.copytree(Path(MODELS_ROOT, model, "data"), tmp_path / "data")
+    he1 = tmp_path / "data" / "he1.dat"
+    he1.write_text(
+        "".join(line for line in he1.read_text().splitlines(True) if line[0] != "*")
+    )
+    synspec.add_link("data")
+    with pytest.warns(RuntimeWarning, match="he1.dat not validated"):
+        with pytest.raises(FileNotFoundError):  # no output units
+            synspec.run(model, rundir="run", basedir=tmp_path)
+    assert (tmp_path / "run" / "started").exists()
@@ -0,0 +1,66 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from synspec import benchmark, units
+from tests.test_synspec import MODELS_ROOT, fake_synspec
+
+
+@pytest.mark.parametrize("model", ["hhe35lt", "EHeT30g4"])
+def test_run_model(tmp_path: Path, model: str) -> None:
+    synspec = fake_synspec(tmp_path, outputs="reference", model=model)
+    measurements = benchmark.run_model(
+        f"{MODELS_ROOT}/{model}", synspec, tmp_path / "out", repeats=2
+    )
+    assert len(measurements) == 2
+    assert all(m.wall > 0 and m.rss > 0 for m in measurements)
+    output = f"{MODELS_ROOT}/{model}/output"
+    assert benchmark.compare_outputs(output, tmp_path / "out", model) == []
+
+
+def test_compare_outputs(tmp_path: Path) -> None:
+    model = "hhe35lt"
+    output = f"{MODELS_ROOT}/{model}/output"
+    spectrum = units.read7f(f"{output}/{model}.spec")
+    flux = spectrum.flux.copy()
+    flux[10] *= 1.01
+    units.write7f(tmp_path / f"{model}.spec", units.Spectrum(spectrum.wavelength, flux))
+    # A truncated file.
+    lines = Path(f"{output}/{model}.cont").read_text().splitlines(keepends=True)
+    (tmp_path / f"{model}.cont").write_text("".join(lines[:-1]))
+
+    problems = benchmark.compare_outputs(output, tmp_path, model)
+    assert len(problems) == 2
+    assert "flux differs in 1 rows, first at row 11" in problems[0]
+    assert f"{len(lines) - 1} rows, {len(lines)} expected" in problems[1]
+    assert benchmark.compare_outputs(output, tmp_path, model, rtol=0.02) == [
+        problems[1]
+    ]
+
+
+def test_compare_baseline() -> None:
+    baseline = {"wall": [1.0, 1.1, 0.9], "cpu": [0.8, 0.8, 0.8], "rss": [1e6]}
+    current = {"wall": [1.5, 1.4, 1.6], "cpu": [0.85, 0.8, 0.8], "rss": [1e6]}
+    (regression,) = benchmark.compare_baseline(current, baseline)
+    assert regression.startswith("wall: median 1.5 vs baseline 1")
+    assert benchmark.compare_baseline(current, baseline, tolerance=1.0) == []
+    assert benchmark.compare_baseline(current, {}) == []
+
+
+def test_main(tmp_path: Path, capsys: pytest.CaptureFixture) -> None:
+    model = "hhe35lt"
+    synspec = fake_synspec(tmp_path, outputs="reference", model=model)
+    baseline = tmp_path / "baseline.json"
+    args = [f"{MODELS_ROOT}/{model}", "--synspec", synspec, "--repeats", "2"]
+
+    assert benchmark.main(args + ["--baseline", str(baseline), "--update"]) == 0
+    stored = json.loads(baseline.read_text())
+    assert len(stored[model]["wall"]) == 2
+    assert benchmark.main(args + ["--baseline", str(baseline), "--tolerance", "5"]) == 0
+
+    # A baseline far faster than any run flags a slowdown.
+    stored[model]["wall"] = [1e-9]
+    baseline.write_text(json.dumps(stored))
+    assert benchmark.main(args + ["--baseline", str(baseline)]) == 1
+    assert "wall: median" in capsys.readouterr().out
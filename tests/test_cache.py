@@ -0,0 +1,76 @@
+import multiprocessing
+import os
+from pathlib import Path
+
+from synspec.cache import DataCache
+from synspec.synspec import Synspec
+from tests.test_synspec import MODELS_ROOT, copy_model
+
+
+def fetch(root: str, src: str) -> tuple[str, int]:
+    cache = DataCache(root)
+    return str(cache.get(src)), cache.misses
+
+
+def test_cache_file(tmp_path: Path) -> None:
+    src = tmp_path / "nst_l"
+    src.write_text("IATREF=2\n")
+    cache = DataCache(tmp_path / "cache")
+
+    cached = cache.get(src)
+    assert cached.read_text() == "IATREF=2\n"
+    assert cached.parent == cache.root / "objects"
+    assert cache.get(src) == cached
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_modified(tmp_path: Path) -> None:
+    src = tmp_path / "nst_l"
+    src.write_text("IATREF=2\n")
+    cache = DataCache(tmp_path / "cache")
+    first = cache.get(src)
+
+    src.write_text("IATREF=1\n")
+    os.utime(src, ns=(0, src.stat().st_mtime_ns + 10**9))
+    second = cache.get(src)
+    assert second != first
+    assert second.read_text() == "IATREF=1\n"
+    assert first.read_text() == "IATREF=2\n"
+
+
+def test_cache_tree(tmp_path: Path) -> None:
+    src = f"{MODELS_ROOT}/EHeT30g4/data"
+    cache = DataCache(tmp_path / "cache")
+
+    tree = cache.get(src)
+    assert sorted(f.name for f in tree.iterdir()) == sorted(os.listdir(src))
+    assert (tree / "hydprf.dat").read_text() == Path(f"{src}/hydprf.dat").read_text()
+    assert cache.get(src) == tree
+
+
+def test_cache_fetch_once(tmp_path: Path) -> None:
+    """Concurrent processes fetch a source only once."""
+    src = f"{MODELS_ROOT}/EHeT30g4/data/he2prf.dat"
+    root = str(tmp_path / "cache")
+    with multiprocessing.Pool(4) as pool:
+        results = pool.starmap(fetch, [(root, src)] * 8)
+    assert len({cached for cached, _ in results}) == 1
+    assert sum(misses for _, misses in results) == 1
+
+
+def test_synspec_datacache(tmp_path: Path) -> None:
+    """Atomic data referenced by the input file is linked from the cache."""
+    model = "EHeT30g4"
+    files = ["fort.19", "fort.55", "fort.56", "nst_l", "{model}.5", "{model}.7"]
+    copy_model(model, files, str(tmp_path))
+    rundir = tmp_path / "run"
+    rundir.mkdir()
+
+    synspec = Synspec("synspec", 51, datacache=tmp_path / "cache")
+    synspec._copy_to_rundir(synspec.plan(model, tmp_path), rundir)
+
+    cache = synspec.datacache
+    assert cache is not None
+    assert (rundir / "data").resolve().parent == cache.root / "trees"
+    assert (rundir / "nst_l").resolve().parent == cache.root / "objects"
+    assert (rundir / "fort.19").resolve() == tmp_path / "fort.19"
@@ -0,0 +1,130 @@
+import dataclasses
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from synspec import costmodel, units
+from synspec.batch import Job, job_features, run_batch, split_job
+from synspec.costmodel import CostModel, Features
+from tests.test_synspec import copy_model, fake_synspec
+
+FEATURES = Features(4000.0, 5000.0, 0.01, 50, 5, 39, 1000)
+
+
+def test_features(tmp_path: Path) -> None:
+    synspec = fake_synspec(tmp_path, f"sed -n 6p fort.55 >> {tmp_path}/runs.log")
+    job = Job("hhe35lt", workdir=str(tmp_path), synspec=synspec)
+    lines = units.read19f(tmp_path / "fort.19")
+    features = job_features(job)
+    assert features == Features(
+        4465.0,
+        4475.0,
+        0.01,
+        50,
+        3,
+        37,
+        sum(4465.0 <= line.wavelength < 4475.0 for line in lines),
+    )
+    assert features.points == pytest.approx(1000)
+    assert job_features(dataclasses.replace(job, model="missing")) is None
+
+    # Without space, synspec picks the step; the default is assumed.
+    config = units.read55f(tmp_path / "fort.55")
+    units.write55f(tmp_path / "fort.55", dataclasses.replace(config, space=0.0))
+    features = job_features(job)
+    assert features is not None and features.step == costmodel.DEFAULT_STEP
+
+
+def test_linewavelengths_memo(tmp_path: Path) -> None:
+    copy_model("hhe35lt", ["fort.19"], str(tmp_path))
+    memo: dict[str, np.ndarray] = {}
+    wavelengths = costmodel.linewavelengths(tmp_path / "fort.19", memo)
+    assert np.all(np.diff(wavelengths) >= 0)
+    assert costmodel.linewavelengths(tmp_path / "fort.19", memo) is wavelengths
+
+
+def test_cost_model_learns() -> None:
+    model = CostModel()
+    prior = model.predict(FEATURES)
+    for span in (10.0, 30.0, 100.0, 300.0, 1000.0):
+        for lines in (10, 1000):
+            features = dataclasses.replace(FEATURES, alam1=4000.0 + span, lines=lines)
+            model.observe(features, 2e-3 * features.points)
+    assert model.predict(FEATURES) != pytest.approx(prior)
+    assert model.predict(FEATURES) == pytest.approx(2e-3 * FEATURES.points, rel=0.05)
+
+
+def test_cost_model_path(tmp_path: Path) -> None:
+    path = tmp_path / "runs.jsonl"
+    model = CostModel(path)
+    model.observe(FEATURES, 12.0)
+    model.observe(FEATURES, 0.0)  # not recorded
+    with open(path, "a") as f:
+        f.write('{"features": {"alam0": 4')
+    loaded = CostModel(path)
+    assert loaded.records == [(FEATURES, 12.0)]
+    assert loaded.predict(FEATURES) == pytest.approx(model.predict(FEATURES))
+
+
+@pytest.mark.parametrize("seconds", [0.5, 2.0, 7.0])
+def test_chunks(seconds: float) -> None:
+    model = CostModel()
+    for span in (10.0, 100.0, 1000.0):
+        features = dataclasses.replace(FEATURES, alam1=4000.0 + span)
+        model.observe(features, 0.1 + 1e-3 * features.points)
+    # Lines crowded at the blue end.
+    wavelengths = np.sort(np.concatenate([np.linspace(4000, 4100, 900), [4500.0]]))
+    chunks = model.chunks(FEATURES, wavelengths, seconds)
+    assert chunks[0][0] == FEATURES.alam0 and chunks[-1][1] == FEATURES.alam1
+    assert all(a[1] == b[0] for a, b in zip(chunks[:-1], chunks[1:]))
+    times = [model.predict(FEATURES.window(*c, wavelengths)) for c in chunks]
+    assert max(times) <= seconds * (1 + 1e-6)
+    # No fewer chunks would do, and they are balanced.
+    assert model.chunks(FEATURES, wavelengths, seconds * len(chunks)) != chunks
+    if len(chunks) > 1:
+        assert min(times) > 0.5 * max(times)
+
+
+def test_run_batch_longest_first(tmp_path: Path) -> None:
+    synspec = fake_synspec(tmp_path, f"sed -n 6p fort.55 >> {tmp_path}/runs.log")
+    config = units.read55f(tmp_path / "fort.55")
+    jobs = []
+    for span in (1.0, 10.0, 3.0):
+        units.write55f(
+            tmp_path / f"{span}.55", dataclasses.replace(config, alam1=4465.0 + span)
+        )
+        links = {"data": "data", "fort.55": f"{span}.55"}
+        jobs.append(
+            Job(
+                "hhe35lt",
+                outfile=f"job{span}",
+                links=links,
+                workdir=str(tmp_path),
+                synspec=synspec,
+            )
+        )
+    model = CostModel(tmp_path / "runs.jsonl")
+    results = run_batch(jobs, workers=1, cost=model)
+    assert [r.name for r in results] == ["job1.0", "job10.0", "job3.0"]
+    ranges = (tmp_path / "runs.log").read_text().split("\n")[:-1]
+    assert [float(r.split()[1]) for r in ranges] == [4475.0, 4468.0, 4466.0]
+    assert len(CostModel(tmp_path / "runs.jsonl").records) == 3
+
+
+def test_split_job(tmp_path: Path) -> None:
+    synspec = fake_synspec(tmp_path, f"sed -n 6p fort.55 >> {tmp_path}/runs.log")
+    job = Job("hhe35lt", links={"data": "data"}, workdir=str(tmp_path), synspec=synspec)
+    model = CostModel()
+    features = job_features(job)
+    assert features is not None
+    whole = model.predict(features)
+    assert split_job(job, model, 2 * whole, "chunks") == [job]
+
+    chunks = split_job(job, model, whole / 3, "chunks")
+    assert len(chunks) >= 3
+    configs = [units.read55f(Path(c.workdir, c.links["fort.55"])) for c in chunks]
+    assert configs[0].alam0 == 4465.0 and configs[-1].alam1 == 4475.0
+    assert [c.name for c in chunks] == [f"hhe35lt_{i}" for i in range(len(chunks))]
+    results = run_batch(chunks, workers=2)
+    assert all(r.status == "done" for r in results)
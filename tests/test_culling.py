@@ -0,0 +1,113 @@
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from synspec import culling, units
+from synspec.culling import CulledSynthesis, Drift
+from synspec.synspec import Synspec
+from tests.test_synspec import MODELS_ROOT, copy_model, fake_synspec
+
+IDEN = Path(MODELS_ROOT, "hhe35lt", "output", "hhe35lt.iden").resolve()
+
+
+def runs(tmp_path: Path) -> list[int]:
+    return [int(n) for n in (tmp_path / "runs.log").read_text().split()]
+
+
+def test_cull(tmp_path: Path) -> None:
+    copy_model("hhe35lt", ["fort.19"], str(tmp_path))
+    lines = units.read19f(tmp_path / "fort.19")
+    iden = units.read12f(IDEN)
+
+    n = culling.cull(tmp_path / "fort.19", tmp_path / "culled.19", iden, 35000.0, 0.0)
+    culled = units.read19f(tmp_path / "culled.19")
+    assert len(culled) == n < len(lines)
+    assert set(culled) <= set(lines)
+    # Every identified line is kept.
+    for found in iden:
+        assert any(
+            abs(line.wavelength - found.wavelength) < 0.0015 and line.anum == found.anum
+            for line in culled
+        )
+    # Wider margins keep more lines, down to all of the species identified.
+    wider = culling.cull(tmp_path / "fort.19", tmp_path / "w.19", iden, 35000.0, 1.0)
+    assert n < wider
+    assert culling.cull(tmp_path / "fort.19", tmp_path / "w.19", iden, 35000.0, 99) == (
+        sum(line.anum == 2.0 for line in lines)
+    )
+
+
+def test_drifted() -> None:
+    reference = {
+        "teff": 35000.0,
+        "grav": 4.0,
+        "vtb": 2.0,
+        "abundances": {"6": 1e-4, "8": 0.0},
+        "range": [4465.0, 4475.0],
+        "fort.19": "key",
+    }
+    drift = Drift()
+    assert not culling.drifted(reference, reference, drift)
+    cases: list[tuple[dict[str, Any], bool]] = [
+        ({"teff": 35900.0}, False),
+        ({"teff": 36100.0}, True),
+        ({"grav": 4.2}, False),
+        ({"grav": 4.4}, True),
+        ({"vtb": 5.0}, True),
+        ({"abundances": {"6": 1.5e-4, "8": 0.0}}, False),
+        ({"abundances": {"6": 3e-4, "8": 0.0}}, True),
+        ({"abundances": {"6": 1e-4, "8": 1e-5}}, True),
+        ({"range": [4466.0, 4470.0]}, False),
+        ({"range": [4460.0, 4470.0]}, True),
+        ({"fort.19": "other"}, True),
+    ]
+    for change, drifts in cases:
+        assert culling.drifted(reference, {**reference, **change}, drift) == drifts
+
+
+def test_culled_synthesis(tmp_path: Path) -> None:
+    script = f"grep -c . fort.19 >> {tmp_path}/runs.log"
+    synspec = Synspec(fake_synspec(tmp_path, script, "reference"))
+    sweep = CulledSynthesis(synspec, tmp_path / "cull", drift=Drift(teff=500.0))
+    model = tmp_path / "hhe35lt"
+    assert sweep.reference() is None
+
+    assert sweep.run("hhe35lt", basedir=tmp_path, outdir=tmp_path / "out", outfile="a")
+    assert (tmp_path / "out" / "a.iden").exists()
+    assert not sweep.run(
+        "hhe35lt", basedir=tmp_path, outdir=tmp_path / "out", outfile="b"
+    )
+    full, culled = runs(tmp_path)
+    assert full == 50 and culled == len(units.read19f(sweep.culled)) < full
+
+    text = Path(f"{model}.5").read_text()
+    Path(f"{model}.5").write_text(units.write5header(text, 35400.0, 4.0))
+    assert not sweep.run("hhe35lt", basedir=tmp_path, outdir=tmp_path / "out")
+    Path(f"{model}.5").write_text(units.write5header(text, 36000.0, 4.0))
+    assert sweep.run("hhe35lt", basedir=tmp_path, outdir=tmp_path / "out")
+    assert sweep.rebuilds == 2
+    reference = sweep.reference()
+    assert reference is not None and reference["teff"] == 36000.0
+
+    # The reference is kept across sessions, unless the margin changes.
+    assert not CulledSynthesis(synspec, tmp_path / "cull").run(
+        "hhe35lt", basedir=tmp_path
+    )
+    assert CulledSynthesis(synspec, tmp_path / "cull", margin=0.5).run(
+        "hhe35lt", basedir=tmp_path
+    )
+    assert runs(tmp_path)[2:] == [culled, 50, culled, 50]
+
+
+@pytest.mark.parametrize("teff", [10000.0, 35000.0])
+def test_strength(teff: float) -> None:
+    # Lines from excited levels are weaker, the less so the hotter.
+    assert culling.strength(-1.0, 0.0, teff) == -1.0
+    assert culling.strength(-1.0, 8065.54394, teff) == pytest.approx(-1 - 5040 / teff)
+
+
+def test_line_order_teff() -> None:
+    assert culling.line_order_teff({"teff": "35000."}) == 35000.0
+    # Disk models have no Teff.
+    assert culling.line_order_teff({}) > 0
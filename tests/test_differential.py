@@ -0,0 +1,124 @@
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from synspec import units
+from synspec.differential import (
+    DifferentialSynthesis,
+    affected_windows,
+    changed_elements,
+    splice,
+)
+from synspec.synspec import Synspec
+from tests.test_synspec import MODELS_ROOT, PROJECT_ROOT, copy_model, fake_synspec
+
+
+@pytest.fixture
+def linelist() -> list[units.Line]:
+    return units.read19f(Path(f"{MODELS_ROOT}/EHeT30g4/input/fort.19"))
+
+
+def test_affected_windows(linelist: list[units.Line]) -> None:
+    # The second O line is beyond alam1.
+    np.testing.assert_allclose(
+        affected_windows(linelist, {8}, 3500.0, 5500.0, 5.0), [(3949.362, 3959.362)]
+    )
+    # The N III lines near 4870 are merged into one window.
+    np.testing.assert_allclose(
+        affected_windows(linelist, {7}, 3500.0, 5500.0, 5.0),
+        [(4030.081, 4040.081), (4171.159, 4181.159), (4862.12, 4889.14)],
+    )
+    assert affected_windows(linelist, {26}, 3500.0, 5500.0, 5.0) == []
+
+
+def test_changed_elements() -> None:
+    old = {
+        "input": {"teff": 30000.0},
+        "config": {},
+        "files": {},
+        "abundances": {"6": [1.12e-3, None], "8": [1.99e-3, 3.8e-3]},
+    }
+    new = {**old, "abundances": {"6": [1.12e-3, None], "8": [1.99e-3, 4.0e-3]}}
+    assert changed_elements(old, new) == {8}
+    assert changed_elements(old, old) == set()
+    assert changed_elements(old, {**new, "files": {"fort.19": "x"}}) is None
+
+
+def test_splice() -> None:
+    spectrum = units.Spectrum(np.arange(10.0), np.zeros(10))
+    patch = units.Spectrum(np.arange(2.5, 7.0, 0.5), np.ones(9))
+    spliced = splice(spectrum, patch, 3.0, 5.0)
+    np.testing.assert_array_equal(
+        spliced.wavelength, [0, 1, 2, 3, 3.5, 4, 4.5, 5, 6, 7, 8, 9]
+    )
+    np.testing.assert_array_equal(spliced.flux, [0, 0, 0, 1, 1, 1, 1, 1, 0, 0, 0, 0])
+
+
+def test_differential_synthesis(tmp_path: Path) -> None:
+    model = "EHeT30g4"
+    files = ["fort.19", "fort.55", "fort.56", "nst_l", "{model}.5", "{model}.7"]
+    modeldir = copy_model(model, files, str(tmp_path))
+    reference = units.read7f(f"{modeldir}/output/{model}.spec")
+
+    os.chdir(tmp_path)
+    try:
+        synth = DifferentialSynthesis(Synspec("synspec", 51), model, "cache")
+        spectrum = synth.run()
+        assert synth.windows is None
+        np.testing.assert_allclose(spectrum.flux, reference.flux)
+
+        # Only the windows around the O lines are re-synthesised.
+        units.write56f(Path("fort.56"), [(8, 4.0e-03)])
+        synth.run(outdir="out")
+        assert synth.windows is not None
+        np.testing.assert_allclose(synth.windows, [(3949.362, 3959.362)])
+        assert Path("out/EHeT30g4.spec").is_file()
+
+        # Nothing changed.
+        synth.run()
+        assert synth.windows == []
+
+        # Any other change requires a full run.
+        shutil.copy(f"{modeldir}/input/{model}.7", f"{model}.7")
+        os.utime(f"{model}.7", ns=(0, 0))
+        synth.run()
+        assert synth.windows is None
+    finally:
+        os.chdir(PROJECT_ROOT)
+
+
+def test_differential_synthesis_compressed(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    model = "EHeT30g4"
+    synspec = Synspec(
+        fake_synspec(tmp_path, outputs="reference", model=model), output_format="gzip"
+    )
+    reference = units.read7f(f"{MODELS_ROOT}/{model}/output/{model}.spec")
+    # Relative paths are resolved against basedir, not the current directory.
+    monkeypatch.chdir(PROJECT_ROOT)
+    synth = DifferentialSynthesis(synspec, model, "cache", basedir=tmp_path)
+    synth.run(outdir="out")
+    units.write56f(tmp_path / "fort.56", [(8, 4.0e-03)])
+    spectrum = synth.run(outdir="out")
+    assert synth.windows
+    np.testing.assert_array_equal(spectrum.flux, reference.flux)
+    # The cache and the outputs are stored compressed, without stale copies.
+    assert sorted(f.name for f in (tmp_path / "cache").glob("reference.*")) == [
+        "reference.cont.gz",
+        "reference.eqws.gz",
+        "reference.iden.gz",
+        "reference.json",
+        "reference.log",
+        "reference.spec.gz",
+    ]
+    assert sorted(f.name for f in (tmp_path / "out").iterdir()) == [
+        f"{model}.cont.gz",
+        f"{model}.spec.gz",
+    ]
+    np.testing.assert_array_equal(
+        units.read7f(tmp_path / "out" / f"{model}.spec").flux, reference.flux
+    )
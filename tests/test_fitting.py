@@ -0,0 +1,154 @@
+import dataclasses
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from synspec import units
+from synspec.fitting import VTB, SpectrumFit, abundance
+from synspec.synspec import Synspec
+from tests.test_synspec import MODELS_ROOT, copy_model
+
+# Stands in for synspec: a continuum of 1e8 with a line of element 6 at
+# 4470 A, as deep as 1000 times its abundance (from fort.56 if it lists it)
+# and as wide as vtb allows.
+FAKE_SYNSPEC = """#!{python}
+import sys
+sys.path.insert(0, {src!r})
+from pathlib import Path
+import numpy as np
+from synspec import units
+
+modelinput = units.readinput(sys.stdin.read())
+config = units.read55f(Path("fort.55"))
+abd = float(modelinput["atoms"][5]["abd"])
+if config.ichemc != 0:
+    abd = dict(units.read56f(Path("fort.56"))).get(6, abd)
+depth = 1000 * abd
+width = 0.2 + 0.1 * config.vtb
+w = np.arange(config.alam0, config.alam1 + 1e-6, 0.01)
+flux = 1e8 * (1 - depth * np.exp(-(((w - 4470.0) / width) ** 2)))
+units.write7f("fort.7", units.Spectrum(w, flux))
+units.write7f("fort.17", units.Spectrum(w[::10], np.full(w[::10].size, 1e8)))
+open("fort.12", "w").close()
+open("fort.16", "w").close()
+with open({log!r}, "a") as log:
+    log.write(f"{{config.alam0}} {{config.alam1}}\\n")
+"""
+
+LINE = (
+    "  447.0000  6.00 -1.000   10000.000 1.0   32000.000 2.0    0.00   0.00   0.00 0\n"
+)
+
+
+def setup(tmp_path: Path) -> Synspec:
+    model = "hhe35lt"
+    copy_model(model, ["fort.55", "{model}.5", "{model}.7"], str(tmp_path))
+    # Lines of helium and of the fitted element.
+    helium = Path(f"{MODELS_ROOT}/{model}/input/fort.19").read_text()
+    (tmp_path / "fort.19").write_text(helium + LINE)
+    executable = tmp_path / "synspec"
+    executable.write_text(
+        FAKE_SYNSPEC.format(
+            python=sys.executable,
+            src=str(Path(units.__file__).parents[1]),
+            log=str(tmp_path / "runs.log"),
+        )
+    )
+    executable.chmod(0o755)
+    runner = Synspec(str(executable))
+    runner.add_link("data")
+    return runner
+
+
+def observed(depth: float, vtb: float) -> units.Spectrum:
+    w = np.arange(4466.0, 4474.0, 0.05)
+    width = 0.2 + 0.1 * vtb
+    return units.Spectrum(w, 1 - depth * np.exp(-(((w - 4470.0) / width) ** 2)))
+
+
+def runs(tmp_path: Path) -> list[tuple[float, float]]:
+    text = (tmp_path / "runs.log").read_text()
+    return [(float(a), float(b)) for a, b in map(str.split, text.splitlines())]
+
+
+def test_fit(tmp_path: Path) -> None:
+    runner = setup(tmp_path)
+    fit = SpectrumFit(
+        runner,
+        "hhe35lt",
+        observed(0.3, 4.0),
+        {abundance(6): 1e-5, VTB: 0.1},
+        tmp_path / "fit",
+        sigma=0.01,
+        basedir=tmp_path,
+        padding=1.0,
+    )
+    result = fit.fit({abundance(6): 2e-4, VTB: 3.0}, tol=0.1)
+
+    assert result.converged
+    assert result.parameters[abundance(6)] == pytest.approx(3e-4, rel=1e-3)
+    assert result.parameters[VTB] == pytest.approx(4.0, rel=1e-3)
+    assert result.chi2 < 1e-3
+    assert result.covariance.shape == (2, 2)
+    assert 0 < result.errors[VTB] < 0.1
+    assert result.runs == len(runs(tmp_path))
+    # The runs perturbing the abundance only cover the window around its line.
+    assert set(runs(tmp_path)) == {(4465.0, 4475.0), (4468.0, 4472.0)}
+
+
+def test_fit_fort56(tmp_path: Path) -> None:
+    """The abundance of an element fort.56 lists is fitted in fort.56."""
+    runner = setup(tmp_path)
+    config = units.read55f(tmp_path / "fort.55")
+    units.write55f(tmp_path / "fort.55", dataclasses.replace(config, ichemc=1))
+    units.write56f(tmp_path / "fort.56", [(2, 0.1), (6, 2e-4)])
+    fit = SpectrumFit(
+        runner,
+        "hhe35lt",
+        observed(0.3, 2.0),
+        {abundance(6): 1e-5},
+        tmp_path / "fit",
+        sigma=0.01,
+        basedir=tmp_path,
+    )
+    assert fit.initial() == {abundance(6): 2e-4}
+    result = fit.fit(tol=0.1)
+    assert result.parameters[abundance(6)] == pytest.approx(3e-4, rel=1e-3)
+    fort56 = units.read56f(next((tmp_path / "fit").glob("*/fort.56")))
+    assert fort56[0] == (2, 0.1)
+
+
+def test_fit_cached(tmp_path: Path) -> None:
+    """A fit repeated with the same workdir doesn't run synspec again."""
+    runner = setup(tmp_path)
+    args = (runner, "hhe35lt", observed(0.3, 2.0), {abundance(6): 1e-5})
+    first = SpectrumFit(*args, tmp_path / "fit", sigma=0.01, basedir=tmp_path)
+    result = first.fit({abundance(6): 1e-4})
+    second = SpectrumFit(*args, tmp_path / "fit", sigma=0.01, basedir=tmp_path)
+    again = second.fit({abundance(6): 1e-4})
+    assert second.runs == 0
+    np.testing.assert_array_equal(again.values, result.values)
+
+
+def test_fit_parameters(tmp_path: Path) -> None:
+    runner = setup(tmp_path)
+    with pytest.raises(ValueError):
+        SpectrumFit(
+            runner,
+            "hhe35lt",
+            observed(0.3, 2.0),
+            {"logg": 0.1},
+            tmp_path,
+            basedir=tmp_path,
+        )
+    with pytest.raises(ValueError):
+        SpectrumFit(
+            runner,
+            "hhe35lt",
+            observed(0.3, 2.0),
+            {"teff": 100.0},
+            tmp_path,
+            basedir=tmp_path,
+        )
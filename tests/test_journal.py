@@ -0,0 +1,118 @@
+import dataclasses
+import os
+from pathlib import Path
+
+import pytest
+
+from synspec.batch import Job, run_batch
+from synspec.journal import Journal
+from synspec.shared import SharedResults
+from tests.test_synspec import fake_synspec
+
+
+def runs(tmp_path: Path) -> int:
+    log = tmp_path / "runs.log"
+    return len(log.read_text().splitlines()) if log.exists() else 0
+
+
+def jobs(tmp_path: Path, synspec: str, n: int = 3) -> list[Job]:
+    return [
+        Job(
+            "hhe35lt",
+            outfile=f"job{i}",
+            links={"data": "data"},
+            workdir=str(tmp_path),
+            synspec=synspec,
+        )
+        for i in range(n)
+    ]
+
+
+def test_journal(tmp_path: Path) -> None:
+    with Journal(tmp_path / "journal") as journal:
+        journal.started("a", "1")
+        journal.started("b", "2")
+        journal.finished("a", "1", {"status": "done"})
+    with Journal(tmp_path / "journal") as journal:
+        record = journal.last("a")
+        assert record is not None
+        assert (record["event"], record["status"]) == ("end", "done")
+        assert journal.last("b") == {
+            "event": "start",
+            "name": "b",
+            "hash": "2",
+            "time": journal.records["b"]["time"],
+        }
+        assert journal.last("c") is None
+
+
+def test_journal_torn_record(tmp_path: Path) -> None:
+    """A record cut short by a crash is dropped."""
+    with Journal(tmp_path / "journal") as journal:
+        journal.started("a", "1")
+    with open(tmp_path / "journal", "a") as f:
+        f.write('{"event": "end", "name": "a", "ha')
+    with Journal(tmp_path / "journal") as journal:
+        assert journal.records["a"]["event"] == "start"
+        journal.finished("a", "1", {"status": "done"})
+    with Journal(tmp_path / "journal") as journal:
+        assert journal.records["a"]["event"] == "end"
+    assert len((tmp_path / "journal").read_text().splitlines()) == 2
+
+
+def test_run_batch_resume(tmp_path: Path) -> None:
+    synspec = fake_synspec(tmp_path, f"echo run >> {tmp_path}/runs.log")
+    journal = tmp_path / "batch.journal"
+    batch = jobs(tmp_path, synspec)
+    failing = Job(
+        "hhe35lt", outfile="bad", workdir=str(tmp_path), synspec="missing-synspec"
+    )
+
+    results = run_batch(batch + [failing], workers=2, journal=journal)
+    assert [r.status for r in results] == ["done", "done", "done", "failed"]
+    assert runs(tmp_path) == 3
+
+    # Only the failed job is run again, and results keep the order of the jobs.
+    results = run_batch(batch + [failing], workers=2, journal=journal)
+    assert [r.name for r in results] == ["job0", "job1", "job2", "bad"]
+    assert [r.status for r in results] == ["done", "done", "done", "failed"]
+    assert runs(tmp_path) == 3
+
+    # Interrupted jobs and jobs whose outputs are gone are run again.
+    with Journal(journal) as log:
+        log.started("job0", log.records["job0"]["hash"])
+    os.remove(tmp_path / "job1.spec")
+    run_batch(batch, workers=2, journal=journal)
+    assert runs(tmp_path) == 5
+
+
+def test_run_batch_resume_relative_outdir(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Outputs are looked up in outdir relative to the workdir of the job."""
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    synspec = fake_synspec(workdir, f"echo run >> {workdir}/runs.log")
+    journal = tmp_path / "batch.journal"
+    batch = [dataclasses.replace(job, outdir="out") for job in jobs(workdir, synspec)]
+    monkeypatch.chdir(tmp_path)
+    run_batch(batch, workers=2, journal=journal)
+    assert (workdir / "out" / "job0.spec").exists()
+    with SharedResults() as shared:
+        results = run_batch(batch, workers=2, journal=journal, shared=shared)
+        assert all(result.spectrum is not None for result in results)
+    assert runs(workdir) == 3
+
+
+def test_run_batch_changed_inputs(tmp_path: Path) -> None:
+    """Jobs are run again when their inputs change."""
+    synspec = fake_synspec(tmp_path, f"echo run >> {tmp_path}/runs.log")
+    journal = tmp_path / "batch.journal"
+    batch = jobs(tmp_path, synspec, 2)
+    run_batch(batch, workers=2, journal=journal)
+    assert runs(tmp_path) == 2
+
+    st = (tmp_path / "fort.19").stat()
+    os.utime(tmp_path / "fort.19", ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    run_batch(batch, workers=2, journal=journal)
+    assert runs(tmp_path) == 4
@@ -0,0 +1,138 @@
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from synspec import limits
+from synspec.limits import ResourceLimits
+from synspec.synspec import (
+    CPULimitExceeded,
+    FileSizeLimitExceeded,
+    MemoryLimitExceeded,
+    ResourceLimitExceeded,
+    Synspec,
+    SynspecError,
+)
+from tests.test_synspec import fake_synspec
+
+# Allocates memory a little at a time until it runs out.
+GROW = "b = []\nwhile True: b.append(bytearray(8 * 1024**2))"
+MEMORY = 512 * 1024**2
+# Fortran programs using 1.2 GB of memory, in static and allocated arrays.
+STATIC = """program static
+  real(8) :: a(150000000)
+  common /big/ a
+  a(150000000) = 1.0
+  print *, a(150000000)
+end program
+"""
+ALLOCATED = """program allocated
+  real(8), allocatable :: a(:)
+  allocate(a(150000000))
+  a = 1.0
+  print *, sum(a)
+end program
+"""
+
+
+def run_script(tmp_path: Path, script: str, limits: ResourceLimits) -> None:
+    """Runs the model hhe35lt with a stand-in synspec executing the script."""
+    tmp_path.mkdir(exist_ok=True)
+    synspec = Synspec(fake_synspec(tmp_path, script, None), 51, limits=limits)
+    synspec.add_link("data")
+    synspec.run("hhe35lt", rundir="run", basedir=tmp_path)
+
+
+def test_cpu_limit(tmp_path: Path) -> None:
+    with pytest.raises(CPULimitExceeded):
+        run_script(tmp_path, "while :; do :; done", ResourceLimits(cpu=1))
+
+
+def test_fsize_limit(tmp_path: Path) -> None:
+    with pytest.raises(FileSizeLimitExceeded):
+        run_script(
+            tmp_path,
+            "exec head -c 1000000 /dev/zero > fort.7",
+            ResourceLimits(fsize=1000),
+        )
+
+
+@pytest.mark.parametrize(
+    "script",
+    [
+        f"exec {sys.executable} -c '{GROW}'",
+        # Fails at once, far from the limit.
+        f"exec {sys.executable} -c 'bytearray(2 * 1024**3)'",
+    ],
+)
+def test_memory_limit(tmp_path: Path, script: str) -> None:
+    with pytest.raises(MemoryLimitExceeded):
+        run_script(tmp_path, script, ResourceLimits(memory=MEMORY))
+
+
+@pytest.mark.skipif(shutil.which("gfortran") is None, reason="needs gfortran")
+@pytest.mark.parametrize("source", [STATIC, ALLOCATED])
+def test_memory_limit_fortran(tmp_path: Path, source: str) -> None:
+    (tmp_path / "big.f90").write_text(source)
+    executable = tmp_path / "big"
+    subprocess.run(["gfortran", "-o", executable, tmp_path / "big.f90"], check=True)
+    fake_synspec(tmp_path, outputs=None)
+    synspec = Synspec(str(executable), 51, limits=ResourceLimits(memory=MEMORY))
+    synspec.add_link("data")
+    with pytest.raises(MemoryLimitExceeded):
+        synspec.run("hhe35lt", rundir="run", basedir=tmp_path)
+    if source == STATIC:
+        # Too large to load: not started at all.
+        size = limits.image_size(str(executable))
+        assert size is not None and size > MEMORY
+        assert (tmp_path / "run" / "fort.log").read_text() == ""
+
+
+@pytest.mark.parametrize(
+    "script, limits",
+    [
+        # Killed by something else than the CPU limit.
+        ("kill -9 $$", ResourceLimits(cpu=60)),
+        # Crashes, and memory errors without a memory limit.
+        ("kill -11 $$", ResourceLimits(memory=MEMORY)),
+        (f"exec {sys.executable} -c 'raise MemoryError'", ResourceLimits(cpu=60)),
+    ],
+)
+def test_other_failures(tmp_path: Path, script: str, limits: ResourceLimits) -> None:
+    with pytest.raises(SynspecError) as info:
+        run_script(tmp_path, script, limits)
+    assert not isinstance(info.value, ResourceLimitExceeded)
+
+
+def test_limits_from_threads(tmp_path: Path) -> None:
+    # Limits are applied by a wrapper, not a preexec_fn, so threads may run.
+    with ThreadPoolExecutor(2) as pool:
+        futures = [
+            pool.submit(
+                run_script,
+                tmp_path / str(i),
+                "exec head -c 1000000 /dev/zero > fort.7",
+                ResourceLimits(fsize=1000),
+            )
+            for i in range(2)
+        ]
+        for future in futures:
+            with pytest.raises(FileSizeLimitExceeded):
+                future.result()
+
+
+def test_nice_affinity(tmp_path: Path) -> None:
+    script = (
+        f"{sys.executable} -c 'import os; "
+        "print(os.getpriority(os.PRIO_PROCESS, 0), min(os.sched_getaffinity(0)))'"
+        " > ../priority"
+    )
+    cpu = min(os.sched_getaffinity(0))
+    with pytest.raises(FileNotFoundError):  # no output units
+        run_script(tmp_path, script, ResourceLimits(nice=5, cpus=(cpu,)))
+    niceness = os.getpriority(os.PRIO_PROCESS, 0)
+    assert (tmp_path / "priority").read_text().split() == [str(niceness + 5), str(cpu)]
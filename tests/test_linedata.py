@@ -0,0 +1,165 @@
+import gzip
+import shutil
+from pathlib import Path
+
+import pytest
+
+from synspec import linedata, units
+from synspec.linedata import EV, LineCache
+
+VALD = """\
+ 4470.0000, 4472.0000,     3,     3, 2.0, 'Wavelength region, lines selected, lines processed, Vmicro'
+                                                                    Lande factors      Damping parameters
+Elm Ion       WL_air(A)  log gf* E_low(eV) J lo  E_up(eV) J up  lower  upper   mean   Rad.  Stark  Waals
+'Fe 1',       4470.4710,  -3.123,  3.1234,  2.0,  5.8965,  3.0, 1.500, 1.200, 1.350, 7.860,-5.640,-7.540,'  K07   K07 Fe'
+'O 2',        4471.0000,  -1.000, 22.7720,  2.5, 20.0000,  1.5, 1.000, 1.000, 1.000, 8.000,-5.000,278.264,'  ref'
+'TiO 1',      4471.5000,  -1.000,  0.5000,  1.0,  3.2000,  2.0,99.000,99.000,99.000, 0.000, 0.000, 0.000,'  ref'
+"""  # noqa: E501
+
+
+def kurucz(wl: float, gf: float, code: float, e1: float, j1: float, e2: float) -> str:
+    """A line in the fixed columns of gfall."""
+    return (
+        f"{wl:11.4f}{gf:7.3f}{code:6.2f}{e1:12.3f}{j1:5.1f} {'lower':10s}"
+        f"{e2:12.3f}{2.0:5.1f} {'upper':10s}{8.09:6.2f}{-5.43:6.2f}{-7.54:6.2f}"
+        "K88  0 0  0 0.000  0 0.000    0    0           0 0   0    0    0\n"
+    )
+
+
+KURUCZ = (
+    kurucz(446.5123, -2.5, 2.00, 169086.859, 1.0, 191444.481)
+    + kurucz(447.0000, -1.0, 106.00, 100.0, 1.0, 22000.0)
+    + kurucz(447.1480, -0.278, 2.01, -195868.344, 1.0, 173485.0)
+)
+
+
+def test_species() -> None:
+    assert linedata.species("Fe 1") == 26.0
+    assert linedata.species("O 2") == 8.01
+    assert linedata.species("TiO 1") is None
+
+
+def test_vacuum_to_air() -> None:
+    assert linedata.vacuum_to_air(5000.0) == pytest.approx(4998.605, abs=1e-3)
+    assert linedata.vacuum_to_air(1500.0) == 1500.0
+
+
+def test_read_vald(tmp_path: Path) -> None:
+    (tmp_path / "lines.vald").write_text(VALD)
+    with open(tmp_path / "lines.vald") as f:
+        fe, o = linedata.read_vald(f)
+    assert fe == pytest.approx(
+        units.Line(
+            447.0471,
+            26.0,
+            -3.123,
+            3.1234 * EV,
+            2.0,
+            5.8965 * EV,
+            3.0,
+            7.86,
+            -5.64,
+            -7.54,
+        )
+    )
+    # Levels in order of energy, and ABO van der Waals constants dropped.
+    assert o == pytest.approx(
+        units.Line(447.1, 8.01, -1.0, 20.0 * EV, 1.5, 22.772 * EV, 2.5, 8.0, -5.0, 0.0)
+    )
+
+
+def test_read_vald_units(tmp_path: Path) -> None:
+    text = VALD.replace("WL_air(A)", "WL_vac(nm)").replace("E_low(eV)", "E_low(cm^-1)")
+    text = text.replace("4470.4710", " 500.0000")
+    (tmp_path / "lines.vald").write_text(text)
+    with open(tmp_path / "lines.vald") as f:
+        fe, _ = linedata.read_vald(f)
+    assert fe.wavelength == pytest.approx(4998.605, abs=1e-3)
+    assert fe.excl == 3.1234
+
+
+def test_read_vald_stellar(tmp_path: Path) -> None:
+    header = (
+        "Elm Ion       WL_air(A)  Excit(eV) Vmic log gf* Rad.  Stark  Waals  factor\n"
+    )
+    (tmp_path / "lines.vald").write_text(header)
+    with open(tmp_path / "lines.vald") as f, pytest.raises(ValueError):
+        list(linedata.read_vald(f))
+
+
+def test_read_kurucz(tmp_path: Path) -> None:
+    (tmp_path / "gfall.dat").write_text(KURUCZ)
+    with open(tmp_path / "gfall.dat") as f:
+        he1, he2 = linedata.read_kurucz(f)
+    assert he1 == pytest.approx(
+        units.Line(
+            446.5123, 2.0, -2.5, 169086.859, 1.0, 191444.481, 2.0, 8.09, -5.43, -7.54
+        )
+    )
+    assert (he2.anum, he2.excl, he2.ql, he2.excu, he2.qu) == (
+        2.01,
+        173485.0,
+        2.0,
+        195868.344,
+        1.0,
+    )
+
+
+@pytest.mark.parametrize("name, text", [("lines.vald", VALD), ("gfall.dat", KURUCZ)])
+def test_convert(tmp_path: Path, name: str, text: str) -> None:
+    with gzip.open(tmp_path / f"{name}.gz", "wt") as f:
+        f.write(text)
+    assert linedata.convert(tmp_path / f"{name}.gz", tmp_path / "fort.19") == 2
+    lines = units.read19f(tmp_path / "fort.19")
+    assert len(lines) == 2
+    window = (4465.0, 4470.9)
+    assert (
+        linedata.convert(tmp_path / f"{name}.gz", tmp_path / "w.19", None, window) == 1
+    )
+    assert units.read19f(tmp_path / "w.19") == [lines[0]]
+
+
+def test_convert_unknown_format(tmp_path: Path) -> None:
+    (tmp_path / "lines.vald").write_text(VALD)
+    with pytest.raises(ValueError):
+        linedata.convert(tmp_path / "lines.vald", tmp_path / "fort.19", "nist")
+
+
+def test_line_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    (tmp_path / "lines.vald").write_text(VALD)
+    cache = LineCache(tmp_path / "cache")
+    full = cache.get(tmp_path / "lines.vald")
+    assert len(units.read19f(full)) == 2
+    assert cache.get(tmp_path / "lines.vald") == full
+    # Copies share the conversion.
+    shutil.copy(tmp_path / "lines.vald", tmp_path / "copy.vald")
+    assert cache.get(tmp_path / "copy.vald") == full
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # Windows are cut from the full conversion.
+    def fail(*args: object) -> None:
+        raise AssertionError("source converted again")
+
+    monkeypatch.setattr(linedata, "convert", fail)
+    window = cache.get(tmp_path / "lines.vald", window=(4471.0, 4472.0))
+    assert window != full
+    assert [line.anum for line in units.read19f(window)] == [8.01]
+
+    monkeypatch.undo()
+    (tmp_path / "lines.vald").write_text(VALD.replace("-3.123", "-3.000"))
+    changed = cache.get(tmp_path / "lines.vald")
+    assert changed != full
+    assert units.read19f(changed)[0].gf == -3.0
+
+
+def test_main(tmp_path: Path) -> None:
+    (tmp_path / "gfall.dat").write_text(KURUCZ)
+    output = tmp_path / "fort.19"
+    linedata.main(
+        [str(output), str(tmp_path / "gfall.dat"), "--cache", str(tmp_path / "c")]
+    )
+    assert len(units.read19f(output)) == 2
+    linedata.main(
+        [str(output), str(tmp_path / "gfall.dat"), "--window", "4470", "4480"]
+    )
+    assert len(units.read19f(output)) == 1
@@ -0,0 +1,86 @@
+import gzip
+import random
+from pathlib import Path
+
+import pytest
+
+from synspec import linelist, units
+from tests.test_synspec import MODELS_ROOT
+
+FORT19 = Path(f"{MODELS_ROOT}/hhe35lt/input/fort.19")
+
+
+def key(line: units.Line) -> tuple[float, ...]:
+    return (line.alam, line.anum, line.excl, line.ql, line.excu, line.qu)
+
+
+def split(lines: list[str], tmp_path: Path, n: int) -> list[Path]:
+    """Writes the lines shuffled into n sources."""
+    lines = lines[:]
+    random.Random(0).shuffle(lines)
+    sources = []
+    for i in range(n):
+        source = tmp_path / f"source{i}.19"
+        source.write_text("".join(lines[i::n]))
+        sources.append(source)
+    return sources
+
+
+@pytest.mark.parametrize("chunk_lines, fan_in", [(1000, 64), (4, 2), (7, 3)])
+def test_sortlines(tmp_path: Path, chunk_lines: int, fan_in: int) -> None:
+    lines = FORT19.read_text().splitlines(keepends=True)
+    # Duplicates, in other sources and with other formatting.
+    extra = [lines[3], lines[10].replace(" 0\n", "  0\n")]
+    sources = split(lines + extra, tmp_path, 3)
+
+    linelist.sortlines(
+        sources, tmp_path / "fort.19", chunk_lines=chunk_lines, fan_in=fan_in
+    )
+
+    output = units.read19f(tmp_path / "fort.19")
+    assert output == sorted(units.read19f(FORT19), key=key)
+    assert sorted(f.name for f in tmp_path.iterdir()) == [
+        "fort.19",
+        "source0.19",
+        "source1.19",
+        "source2.19",
+    ]
+
+
+def test_sortlines_keep_duplicates(tmp_path: Path) -> None:
+    lines = FORT19.read_text().splitlines(keepends=True)
+    sources = split(lines + lines[:5], tmp_path, 2)
+    linelist.sortlines(sources, tmp_path / "fort.19", dedup=False, chunk_lines=8)
+    assert len(units.read19f(tmp_path / "fort.19")) == len(lines) + 5
+
+
+def test_sortlines_compressed_in_place(tmp_path: Path) -> None:
+    lines = FORT19.read_text().splitlines(keepends=True)
+    with gzip.open(tmp_path / "vald.19.gz", "wt") as f:
+        f.writelines(reversed(lines[:20]))
+    (tmp_path / "fort.19").write_text("".join(lines[20:]))
+
+    linelist.sortlines(
+        [tmp_path / "vald.19.gz", tmp_path / "fort.19"], tmp_path / "fort.19"
+    )
+    assert units.read19f(tmp_path / "fort.19") == sorted(units.read19f(FORT19), key=key)
+
+
+def test_sortlines_continuation(tmp_path: Path) -> None:
+    """Lines with nonzero inext keep their continuation line."""
+    (tmp_path / "source.19").write_text(
+        "  500.0000  2.00 -1.000  100.000 1.0  20100.000 2.0    0.00   0.00   0.00 1\n"
+        "  1 2 3 4\n"
+        "  400.0000  2.00 -1.000  100.000 1.0  25100.000 2.0    0.00   0.00   0.00 0\n"
+    )
+    linelist.sortlines([tmp_path / "source.19"], tmp_path / "fort.19")
+    assert (tmp_path / "fort.19").read_text().splitlines()[1:] == [
+        "  500.0000  2.00 -1.000  100.000 1.0  20100.000 2.0    0.00   0.00   0.00 1",
+        "  1 2 3 4",
+    ]
+
+
+def test_main(tmp_path: Path) -> None:
+    sources = split(FORT19.read_text().splitlines(keepends=True), tmp_path, 2)
+    linelist.main([str(tmp_path / "fort.19"), *map(str, sources), "--chunk-lines=5"])
+    assert len(units.read19f(tmp_path / "fort.19")) == 50
@@ -0,0 +1,143 @@
+import urllib.request
+from pathlib import Path
+
+import pytest
+
+from synspec.batch import Job, JobResult, record, run_batch
+from synspec.metrics import CONTENT_TYPE, Metrics, MetricsServer
+from synspec.workqueue import WorkQueue, work
+from tests.test_synspec import fake_synspec
+
+
+def parse(text: str) -> dict[str, float]:
+    """Minimal OpenMetrics parser standing in for a scraper."""
+    lines = text.splitlines()
+    assert lines[-1] == "# EOF"
+    samples = {}
+    for line in lines:
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def scrape(port: int) -> dict[str, float]:
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        assert response.headers["Content-Type"] == CONTENT_TYPE
+        return parse(response.read().decode())
+
+
+def test_render() -> None:
+    metrics = Metrics()
+    metrics.counter("jobs", "Finished jobs.").inc(status="done")
+    metrics.counter("jobs").inc(2, status="failed")
+    metrics.gauge("remaining").set(3)
+    hist = metrics.histogram("wall_seconds", buckets=(1.0, 10.0))
+    hist.observe(0.5)
+    hist.observe(5.0)
+    assert metrics.render() == (
+        "# TYPE jobs counter\n"
+        "# HELP jobs Finished jobs.\n"
+        'jobs_total{status="done"} 1\n'
+        'jobs_total{status="failed"} 2\n'
+        "# TYPE remaining gauge\n"
+        "remaining 3\n"
+        "# TYPE wall_seconds histogram\n"
+        'wall_seconds_bucket{le="1"} 1\n'
+        'wall_seconds_bucket{le="10"} 2\n'
+        'wall_seconds_bucket{le="+Inf"} 2\n'
+        "wall_seconds_count 2\n"
+        "wall_seconds_sum 5.5\n"
+        "# EOF\n"
+    )
+
+
+def test_family_type() -> None:
+    metrics = Metrics()
+    metrics.counter("jobs")
+    with pytest.raises(TypeError):
+        metrics.gauge("jobs")
+    with pytest.raises(ValueError):
+        metrics.counter("jobs").inc(-1)
+
+
+def test_label_escaping() -> None:
+    metrics = Metrics()
+    metrics.gauge("g").set(1, error='bad "quote"')
+    assert 'g{error="bad \\"quote\\""} 1' in metrics.render()
+
+
+def test_publish(tmp_path: Path) -> None:
+    metrics = Metrics(tmp_path / "metrics" / "synspec.prom")
+    metrics.gauge("remaining").set(3)
+    metrics.publish()
+    assert parse((tmp_path / "metrics" / "synspec.prom").read_text()) == {
+        "remaining": 3
+    }
+    assert [f.name for f in (tmp_path / "metrics").iterdir()] == ["synspec.prom"]
+
+
+def test_server() -> None:
+    metrics = Metrics()
+    with MetricsServer(metrics) as server:
+        assert scrape(server.port) == {}
+        metrics.counter("jobs").inc()
+        assert scrape(server.port) == {"jobs_total": 1}
+
+
+def test_record() -> None:
+    metrics = Metrics()
+    record(metrics, JobResult("a", "done", ".", 2.0, cpu=1.5, cache_misses=4))
+    record(metrics, JobResult("b", "failed", ".", 0.2, "error", cache_hits=12))
+    samples = parse(metrics.render())
+    assert samples['synspec_jobs_total{status="done"}'] == 1
+    assert samples['synspec_jobs_total{status="failed"}'] == 1
+    assert samples["synspec_job_wall_seconds_count"] == 2
+    assert samples["synspec_job_wall_seconds_sum"] == pytest.approx(2.2)
+    assert samples['synspec_job_cpu_seconds_bucket{le="1"}'] == 1
+    assert samples["synspec_datacache_hit_ratio"] == 0.75
+
+
+def test_run_batch_metrics(tmp_path: Path) -> None:
+    synspec = fake_synspec(tmp_path)
+    jobs = [
+        Job(
+            "hhe35lt",
+            outfile=f"job{i}",
+            links={"data": "data"},
+            workdir=str(tmp_path),
+            synspec=synspec if i else "missing-synspec",
+            datacache=str(tmp_path / "cache"),
+        )
+        for i in range(4)
+    ]
+    metrics = Metrics(tmp_path / "batch.prom")
+    results = run_batch(jobs, workers=2, metrics=metrics)
+    assert [r.name for r in results] == [f"job{i}" for i in range(4)]
+    samples = parse((tmp_path / "batch.prom").read_text())
+    assert samples['synspec_jobs_total{status="done"}'] == 3
+    assert samples['synspec_jobs_total{status="failed"}'] == 1
+    assert samples["synspec_batch_jobs_remaining"] == 0
+    assert samples["synspec_datacache_misses_total"] >= 1
+
+
+def test_work_metrics(tmp_path: Path) -> None:
+    synspec = fake_synspec(tmp_path)
+    queue = WorkQueue(tmp_path / "queue")
+    queue.submit(
+        Job(
+            "hhe35lt",
+            outfile=f"job{i}",
+            links={"data": "data"},
+            workdir=str(tmp_path),
+            synspec=synspec,
+        )
+        for i in range(3)
+    )
+    metrics = Metrics()
+    with MetricsServer(metrics) as server:
+        assert work(queue.path, poll=0.1, metrics=metrics) == 3
+        samples = scrape(server.port)
+    assert samples['synspec_queue_jobs{state="done"}'] == 3
+    assert samples['synspec_queue_jobs{state="pending"}'] == 0
+    assert samples['synspec_jobs_total{status="done"}'] == 3
@@ -0,0 +1,54 @@
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from synspec.monitor import FATAL_PATTERNS, LogMatch, LogWatcher
+from synspec.synspec import Synspec, SynspecAborted
+from tests.test_synspec import PROJECT_ROOT, fake_synspec
+
+
+def test_logwatcher(tmp_path: Path) -> None:
+    watcher = LogWatcher(tmp_path, FATAL_PATTERNS)
+    assert watcher.poll() == []
+
+    log = tmp_path / "fort.log"
+    with open(log, "w") as f:
+        f.write(" reading model atmosphere\n ERROR: negative")
+        f.flush()
+        assert watcher.poll() == []
+        f.write(" opacity\n done\n")
+    assert watcher.poll() == [LogMatch("fort.log", 2, " ERROR: negative opacity")]
+    assert watcher.poll() == []
+
+
+def test_logwatcher_final(tmp_path: Path) -> None:
+    watcher = LogWatcher(tmp_path, [r"not converged"])
+    (tmp_path / "fort.log").write_text("iteration 20\nnot converged")
+    assert watcher.poll() == []
+    assert watcher.poll(final=True) == [LogMatch("fort.log", 2, "not converged")]
+
+
+def test_synspec_abort(tmp_path: Path) -> None:
+    """A run printing a fatal message is killed without waiting for it."""
+    model = "hhe35lt"
+    script = "echo ' ERROR: negative opacity'\nexec sleep 60"
+    synspec = Synspec(
+        fake_synspec(tmp_path, script, None),
+        51,
+        abort_patterns=FATAL_PATTERNS,
+        watch_interval=0.05,
+    )
+    synspec.add_link("data")
+    os.chdir(tmp_path)
+    start = time.perf_counter()
+    try:
+        with pytest.raises(SynspecAborted) as excinfo:
+            synspec.run(model, rundir=None)
+    finally:
+        os.chdir(PROJECT_ROOT)
+    assert time.perf_counter() - start < 30
+    assert excinfo.value.matches == [
+        LogMatch("fort.log", 1, " ERROR: negative opacity")
+    ]
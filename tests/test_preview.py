@@ -0,0 +1,104 @@
+import dataclasses
+from pathlib import Path
+
+import numpy as np
+
+from synspec import costmodel, culling, preview, units
+from synspec.preview import Coarsening, Previewer
+from synspec.synspec import Synspec
+from tests.test_synspec import MODELS_ROOT, copy_model, fake_synspec
+
+SPEC = Path(MODELS_ROOT, "hhe35lt", "output", "hhe35lt.spec").resolve()
+CONT = Path(MODELS_ROOT, "hhe35lt", "output", "hhe35lt.cont").resolve()
+
+
+def test_coarsen() -> None:
+    config = units.read55f(Path(MODELS_ROOT, "hhe35lt", "input", "fort.55"))
+    coarse = preview.coarsen(config, Coarsening(space=5.0, relop=10.0))
+    assert coarse.space == config.space * 5.0
+    assert coarse.relop == config.relop * 10.0
+    assert (coarse.alam0, coarse.alam1) == (config.alam0, config.alam1)
+    # Without space synspec picks the step; the preview coarsens the default.
+    unset = preview.coarsen(dataclasses.replace(config, space=0.0), Coarsening())
+    assert unset.space == costmodel.DEFAULT_STEP * Coarsening().space
+
+
+def test_thin(tmp_path: Path) -> None:
+    copy_model("hhe35lt", ["fort.19"], str(tmp_path))
+    lines = units.read19f(tmp_path / "fort.19")
+    n = preview.thin(tmp_path / "fort.19", tmp_path / "thin.19", 35000.0, 0.2)
+    thinned = units.read19f(tmp_path / "thin.19")
+    assert len(thinned) == n == 10
+    # The strongest lines are kept, in their order.
+    assert thinned == [line for line in lines if line in thinned]
+    weakest = min(culling.strength(line.gf, line.excl, 35000.0) for line in thinned)
+    assert sum(
+        culling.strength(line.gf, line.excl, 35000.0) > weakest for line in lines
+    ) == (n - 1)
+    assert preview.thin(tmp_path / "fort.19", tmp_path / "thin.19", 35000.0, 0) == 0
+    assert preview.thin(tmp_path / "fort.19", tmp_path / "thin.19", 35000.0, 1) == 50
+
+
+def test_previewer(tmp_path: Path) -> None:
+    script = f"(grep -c . fort.19; cat fort.55) >> {tmp_path}/runs.log"
+    synspec = Synspec(fake_synspec(tmp_path, script, "reference"))
+    with Previewer(synspec, Coarsening(keep=0.1), workers=1) as previewer:
+        result = previewer.submit("hhe35lt", outdir="out", basedir=tmp_path)
+        coarse = result.coarse.result()
+        fine = result.fine.result()
+        # A second preview of the model reuses the thinned line list.
+        again = previewer.submit("hhe35lt", outdir="out", basedir=tmp_path)
+        cancelled = again.fine.cancel()
+        again.coarse.result()
+        assert len(list(previewer._lines.iterdir())) == 1
+    expected = units.read7f(SPEC)
+    np.testing.assert_array_equal(coarse.flux, expected.flux)
+    np.testing.assert_array_equal(fine.flux, expected.flux)
+    assert (tmp_path / "out" / "hhe35lt.preview.spec").exists()
+    assert (tmp_path / "out" / "hhe35lt.spec").exists()
+
+    log = (tmp_path / "runs.log").read_text().splitlines()
+    # Each run logs the lines of fort.19 and the 8 lines of fort.55; the
+    # preview runs first, with 5 lines and coarser settings.
+    runs = [log[i : i + 9] for i in range(0, len(log), 9)]  # noqa: E203
+    assert [run[0] for run in runs] == ["5", "50", "5"] + ([] if cancelled else ["50"])
+    config = units.read55f(tmp_path / "fort.55")
+    coarsened = units.read55("\n".join(runs[0][1:]))
+    assert coarsened == preview.coarsen(config, Coarsening())
+    assert units.read55("\n".join(runs[1][1:])) == config
+
+
+def test_previewer_previews_first(tmp_path: Path) -> None:
+    """A preview doesn't wait for the refinements submitted before it."""
+    # Refinements, which see all 50 lines, wait for the file go.
+    script = (
+        f"[ $(grep -c . fort.19) = 50 ] && "
+        f"while [ ! -e {tmp_path}/go ]; do sleep 0.01; done"
+    )
+    synspec = Synspec(fake_synspec(tmp_path, script, "reference"))
+    with Previewer(synspec, Coarsening(keep=0.1), workers=1) as previewer:
+        first = previewer.submit("hhe35lt", outdir="out", basedir=tmp_path)
+        try:
+            first.coarse.result()
+            second = previewer.submit("hhe35lt", "out", "second", basedir=tmp_path)
+            second.coarse.result(timeout=10)
+            assert not first.fine.done()
+        finally:
+            (tmp_path / "go").touch()
+        first.fine.result()
+        second.fine.result()
+
+
+def test_previewer_close(tmp_path: Path) -> None:
+    """Closing waits for the runs submitted before removing the line lists."""
+    synspec = Synspec(fake_synspec(tmp_path, "sleep 0.1", "reference"))
+    previewer = Previewer(synspec, Coarsening(keep=0.1), workers=1)
+    previews = [
+        previewer.submit("hhe35lt", "out", name, basedir=tmp_path)
+        for name in ("a", "b")
+    ]
+    previewer.close()
+    for result in previews:
+        assert result.coarse.result().flux.size > 0
+        assert result.fine.result().flux.size > 0
+    assert not previewer._lines.exists()
@@ -0,0 +1,118 @@
+import dataclasses
+import os
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pytest
+
+from synspec import profiles, units
+from synspec.synspec import Synspec
+from tests.test_synspec import MODELS_ROOT, PROJECT_ROOT, fake_synspec
+
+DATA = Path(f"{MODELS_ROOT}/EHeT30g4/data")
+
+
+@pytest.mark.parametrize(
+    "file, reader",
+    [
+        ("hydprf.dat", profiles.readstark),
+        ("he1prf.dat", profiles.readhe1),
+        ("he2prf.dat", profiles.readstark),
+    ],
+)
+def test_roundtrip(file: str, reader: Callable[[str], profiles.ProfileFile]) -> None:
+    text = (DATA / file).read_text()
+    assert profiles.writeprofiles(reader(text)) == text
+
+
+def test_readstark_hydrogen() -> None:
+    tables = profiles.readstark((DATA / "hydprf.dat").read_text()).tables
+    assert [(t.lower, t.upper) for t in tables[4:6]] == [(2, 3), (2, 4)]
+    halpha = tables[4]
+    assert halpha.species == "HI"
+    assert halpha.wavelength == pytest.approx(6564.6, abs=0.5)
+    assert halpha.profile.shape == (halpha.e.size, halpha.t.size, halpha.w.size)
+    assert halpha.w[0] == 0.0
+
+
+def test_readstark_helium() -> None:
+    tables = profiles.readstark((DATA / "he2prf.dat").read_text()).tables
+    assert all(t.species == "HEII" for t in tables)
+    he4686 = next(t for t in tables if (t.lower, t.upper) == (3, 4))
+    assert he4686.wavelength == pytest.approx(4687.0, abs=0.5)
+    assert (tables[-1].lower, tables[-1].upper) == (4, 7)
+
+
+def test_readhe1() -> None:
+    tables = profiles.readhe1((DATA / "he1prf.dat").read_text()).tables
+    first = tables[0]
+    assert (first.wavelength, first.table, first.ne) == (4471.5, 1, 1.0e13)
+    assert first.profile.shape == (47, 4)
+    np.testing.assert_allclose(first.dlam[:3], [-5.0, -4.5, -4.0])
+    np.testing.assert_allclose(
+        first.profile[0], [3.48e-05, 3.33e-05, 3.15e-05, 2.97e-05]
+    )
+
+
+def test_readstark_truncated() -> None:
+    text = (DATA / "hydprf.dat").read_text()
+    with pytest.raises(ValueError):
+        profiles.readstark(text[: len(text) // 2])
+
+
+def test_window() -> None:
+    he2 = profiles.readstark((DATA / "he2prf.dat").read_text())
+    reduced = profiles.window(he2, 4600.0, 4700.0, margin=20.0)
+    assert [(t.lower, t.upper) for t in reduced.tables] == [(3, 4)]
+    assert profiles.window(he2, 4700.0, 4800.0, margin=0.0).tables == []
+    # Tables are kept in their original order.
+    wide = profiles.window(he2, 3000.0, 7000.0)
+    wavelengths = [t.wavelength for t in he2.tables]
+    assert [t.wavelength for t in wide.tables] == [
+        w for w in wavelengths if 2800.0 <= w <= 7200.0
+    ]
+
+
+def test_load_once(tmp_path: Path) -> None:
+    file = tmp_path / "he2prf.dat"
+    file.write_text((DATA / "he2prf.dat").read_text())
+    first = profiles.load(file, profiles.readstark)
+    assert profiles.load(file, profiles.readstark) is first
+
+
+def test_reduce_profiles(tmp_path: Path) -> None:
+    datadir = tmp_path / "data"
+    datadir.symlink_to(DATA, target_is_directory=True)
+    config = units.read55f(Path(f"{MODELS_ROOT}/EHeT30g4/input/fort.55"))
+    config = dataclasses.replace(config, alam0=4400.0, alam1=4500.0)
+    profiles.reduce_profiles(datadir, config, margin=50.0)
+
+    assert not datadir.is_symlink()
+    assert sorted(f.name for f in datadir.iterdir()) == sorted(os.listdir(DATA))
+    # hydprf.dat is not used by the model.
+    assert (datadir / "hydprf.dat").is_symlink()
+    he2 = profiles.readstark((datadir / "he2prf.dat").read_text())
+    assert [(t.lower, t.upper) for t in he2.tables] == [(4, 9)]
+    he1 = profiles.readhe1((datadir / "he1prf.dat").read_text())
+    assert {t.wavelength for t in he1.tables} == {4387.93, 4471.5}
+    # The original tables are untouched.
+    assert len(profiles.readstark((DATA / "he2prf.dat").read_text()).tables) == 19
+
+
+def test_synspec_profile_margin(tmp_path: Path) -> None:
+    """Runs in temporary directories see the reduced tables."""
+    model = "EHeT30g4"
+    script = "cp data/he2prf.dat fort.7\ntouch fort.12 fort.16 fort.17"
+    executable = fake_synspec(tmp_path, script, None, model)
+    synspec = Synspec(executable, 51, profile_margin=20.0)
+    synspec.add_link("data")
+    os.chdir(tmp_path)
+    try:
+        synspec.run(model, rundir=None, outdir="out")
+    finally:
+        os.chdir(PROJECT_ROOT)
+    tables = profiles.readstark((tmp_path / "out" / f"{model}.spec").read_text())
+    assert tables.tables
+    assert all(3480.0 <= t.wavelength <= 5520.0 for t in tables.tables)
+    assert (tmp_path / "data").is_symlink()
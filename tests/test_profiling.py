@@ -0,0 +1,102 @@
+import pstats
+import threading
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+import pytest
+
+from synspec import profiling, units
+from synspec.batch import Job, run_job
+from tests.test_synspec import MODELS_ROOT, fake_synspec
+
+
+def parse_input() -> None:
+    units.readinput(Path(f"{MODELS_ROOT}/hhe35lt/input/hhe35lt.5").read_text())
+
+
+def profiled_functions(file: Path) -> set[str]:
+    stats = pstats.Stats(str(file)).get_stats_profile()
+    return set(stats.func_profiles)
+
+
+def test_profiled(tmp_path: Path) -> None:
+    with profiling.profiled("run", tmp_path):
+        parse_input()
+    assert "readinput" in profiled_functions(tmp_path / "run.prof")
+    snapshot = tracemalloc.Snapshot.load(str(tmp_path / "run.tracemalloc"))
+    assert isinstance(snapshot, tracemalloc.Snapshot)
+    assert not tracemalloc.is_tracing()
+
+
+def test_profiled_off(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv(profiling.PROFILE_ENV, raising=False)
+    monkeypatch.chdir(tmp_path)
+    with profiling.profiled("run"):
+        parse_input()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_profiled_env(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv(profiling.PROFILE_ENV, str(tmp_path / "profiles"))
+    with profiling.profiled("run"):
+        parse_input()
+    assert (tmp_path / "profiles" / "run.prof").exists()
+
+
+def test_profiled_nested(tmp_path: Path) -> None:
+    """Only the outermost of nested calls profiles."""
+    with profiling.profiled("outer", tmp_path):
+        with profiling.profiled("inner", tmp_path):
+            parse_input()
+    assert sorted(f.name for f in tmp_path.iterdir()) == [
+        "outer.prof",
+        "outer.tracemalloc",
+    ]
+
+
+def test_profiled_threads(tmp_path: Path) -> None:
+    """Concurrent calls in other threads each profile their own thread."""
+    barrier = threading.Barrier(2)
+
+    def run(name: str, work: Callable[[], None]) -> None:
+        with profiling.profiled(name, tmp_path):
+            barrier.wait()
+            work()
+            barrier.wait()
+
+    threads = [
+        threading.Thread(target=run, args=("a", parse_input)),
+        threading.Thread(target=run, args=("b", lambda: None)),
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert "readinput" in profiled_functions(tmp_path / "a.prof")
+    assert "readinput" not in profiled_functions(tmp_path / "b.prof")
+    assert (tmp_path / "b.tracemalloc").exists()
+    assert not tracemalloc.is_tracing()
+
+
+def test_profiled_exception(tmp_path: Path) -> None:
+    with pytest.raises(RuntimeError):
+        with profiling.profiled("run", tmp_path):
+            raise RuntimeError
+    assert (tmp_path / "run.prof").exists()
+    assert not tracemalloc.is_tracing()
+
+
+def test_run_job_profile(tmp_path: Path) -> None:
+    job = Job(
+        "hhe35lt",
+        outfile="job",
+        links={"data": "data"},
+        workdir=str(tmp_path),
+        synspec=fake_synspec(tmp_path),
+        profile=str(tmp_path / "profiles"),
+    )
+    assert run_job(job).status == "done"
+    functions = profiled_functions(tmp_path / "profiles" / "job.prof")
+    assert {"readinput", "_copy_to_rundir", "_extract_outfiles"} <= functions
+    assert (tmp_path / "profiles" / "job.tracemalloc").exists()
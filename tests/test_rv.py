@@ -0,0 +1,83 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from synspec import rv, units
+from tests.test_synspec import MODELS_ROOT
+
+OUTPUT = Path(MODELS_ROOT, "hhe35lt", "output", "hhe35lt")
+
+
+def lines(grid: np.ndarray, centers: list[float], sigma: float) -> np.ndarray:
+    """Normalised flux with Gaussian absorption lines."""
+    depth = np.zeros_like(grid)
+    for center in centers:
+        depth += 0.5 * np.exp(-0.5 * ((grid - center) / sigma) ** 2)
+    return 1.0 - depth
+
+
+def shifted(spectrum: units.Spectrum, velocity: float) -> units.Spectrum:
+    return units.Spectrum(spectrum.wavelength * (1 + velocity / rv.C), spectrum.flux)
+
+
+def test_loggrid() -> None:
+    grid = rv.loggrid(4000.0, 5000.0, 2.0)
+    assert grid[0] == 4000.0 and grid[-1] <= 5000.0 < grid[-1] * (1 + 2.0 / rv.C)
+    np.testing.assert_allclose(np.diff(grid) / grid[:-1], 2.0 / rv.C)
+
+
+def test_crosscorrelate_velocities() -> None:
+    step = 1.0
+    grid = rv.loggrid(4400.0, 4600.0, step)
+    wavelength = np.linspace(4300.0, 4700.0, 40001)
+    template = units.Spectrum(wavelength, lines(wavelength, [4450.0, 4521.0], 0.3))
+    velocities = [-40.3, 0.0, 12.7, 85.0]
+    observed = rv.resample([shifted(template, v) for v in velocities], grid)
+    templates = rv.resample(
+        [template, units.Spectrum(wavelength, 0 * wavelength + 1)], grid
+    )
+
+    result = rv.crosscorrelate(observed, templates, step, max_velocity=200.0)
+    assert result.ccf.shape == (4, 2, result.velocities.size)
+    assert abs(result.velocities).max() <= 200.0
+    np.testing.assert_allclose(result.velocity[:, 0], velocities, atol=0.1)
+    np.testing.assert_allclose(result.height[:, 0], 1.0, atol=0.01)
+    # Gaussian lines correlate into a Gaussian sqrt(2) times as wide.
+    fwhm = np.sqrt(2) * 2.3548 * 0.3 / 4500.0 * rv.C
+    np.testing.assert_allclose(result.width[:, 0], fwhm, rtol=0.02)
+    # A featureless template doesn't correlate.
+    np.testing.assert_array_equal(result.height[:, 1], 0.0)
+    assert list(result.best()) == [0, 0, 0, 0]
+
+
+def test_crosscorrelate_pairwise() -> None:
+    """The batched CCFs are those of the pairs, computed directly."""
+    rng = np.random.default_rng(1)
+    observed = 1 - rng.random((3, 200))
+    templates = 1 - rng.random((2, 200))
+    result = rv.crosscorrelate(observed, templates, 1.0, max_velocity=20.0)
+    maxlag = (result.velocities.size - 1) // 2
+    for i, obs in enumerate(observed):
+        for j, template in enumerate(templates):
+            a = obs - obs.mean()
+            b = template - template.mean()
+            direct = np.correlate(a, b, mode="full") / np.linalg.norm(a)
+            direct /= np.linalg.norm(b)
+            lags = direct[199 - maxlag : 200 + maxlag]  # noqa: E203
+            np.testing.assert_allclose(result.ccf[i, j], lags, atol=1e-12)
+
+
+def test_crosscorrelate_synspec_output() -> None:
+    spectrum = rv.read_normalized(OUTPUT)
+    grid = rv.loggrid(spectrum.wavelength[0], spectrum.wavelength[-1], 0.5)
+    observed = rv.resample([shifted(spectrum, 25.0), shifted(spectrum, -7.5)], grid)
+    template = rv.resample([spectrum], grid)
+    result = rv.crosscorrelate(observed, template, 0.5, max_velocity=100.0)
+    # Less precise as the wings of He I 4471 run off the window when shifted.
+    np.testing.assert_allclose(result.velocity[:, 0], [25.0, -7.5], atol=1.0)
+
+
+def test_crosscorrelate_grids_differ() -> None:
+    with pytest.raises(ValueError):
+        rv.crosscorrelate(np.ones((1, 10)), np.ones((1, 11)), 1.0)
@@ -0,0 +1,111 @@
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from synspec import shared, units
+from synspec.batch import Job, JobResult, run_batch, run_job
+from synspec.shared import SharedArray, SharedResults
+from tests.test_synspec import MODELS_ROOT, fake_synspec
+
+SPEC = Path(MODELS_ROOT, "hhe35lt", "output", "hhe35lt.spec").resolve()
+CONT = Path(MODELS_ROOT, "hhe35lt", "output", "hhe35lt.cont").resolve()
+
+
+@pytest.mark.parametrize("format", [None, "gzip", "float64"])
+def test_load7(tmp_path: Path, format: str | None) -> None:
+    file = units.storeunit(SPEC, tmp_path / "hhe35lt.spec", format)
+    expected = units.read7f(SPEC)
+    with SharedResults() as results:
+        array = results.load7(file)
+        assert array.shape == (expected.wavelength.size, 2)
+        spectrum = results.spectrum(array)
+        np.testing.assert_array_equal(spectrum.wavelength, expected.wavelength)
+        np.testing.assert_array_equal(spectrum.flux, expected.flux)
+        del spectrum
+
+
+def test_load7_chunks(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(shared, "CHUNK_ROWS", 7)
+    expected = units.read7f(SPEC)
+    with SharedResults() as results:
+        array = results.array(results.load7(SPEC))
+        np.testing.assert_array_equal(array[:, 0], expected.wavelength)
+        np.testing.assert_array_equal(array[:, 1], expected.flux)
+        del array
+
+
+def test_load7_empty(tmp_path: Path) -> None:
+    (tmp_path / "empty.spec").touch()
+    with SharedResults() as results:
+        array = results.load7(tmp_path / "empty.spec")
+        assert array.shape == (0, 2)
+        assert results.spectrum(array).wavelength.size == 0
+
+
+def test_close_unlinks() -> None:
+    results = SharedResults()
+    array = results.load7(SPEC)
+    results.close()
+    with pytest.raises(FileNotFoundError):
+        SharedMemory(array.name)
+
+
+def test_shared_array_from_dict() -> None:
+    array = SharedArray("psm_0", (3, 2))
+    assert (
+        SharedArray.from_dict({"name": "psm_0", "shape": [3, 2], "dtype": "float64"})
+        == array
+    )
+    result = JobResult("job", "done", ".", 1.0, spectrum=array)
+    assert JobResult.from_dict(result.to_dict()) == result
+
+
+def test_run_batch_shared(tmp_path: Path) -> None:
+    synspec = fake_synspec(tmp_path, outputs="reference")
+    jobs = [
+        Job(
+            "hhe35lt",
+            outfile=f"job{i}",
+            links={"data": "data"},
+            workdir=str(tmp_path),
+            synspec=synspec,
+        )
+        for i in range(3)
+    ]
+    failing = Job(
+        "hhe35lt", outfile="bad", workdir=str(tmp_path), synspec="missing-synspec"
+    )
+    spectrum, continuum = units.read7f(SPEC), units.read7f(CONT)
+    journal = tmp_path / "batch.journal"
+    for _ in range(2):  # The second time, from the journal.
+        with SharedResults() as results:
+            batch = run_batch(
+                jobs + [failing], workers=2, journal=journal, shared=results
+            )
+            assert [r.status for r in batch] == ["done", "done", "done", "failed"]
+            assert batch[-1].spectrum is None and batch[-1].continuum is None
+            for result in batch[:-1]:
+                assert result.spectrum is not None and result.continuum is not None
+                spec = results.spectrum(result.spectrum)
+                cont = results.spectrum(result.continuum)
+                np.testing.assert_array_equal(spec.flux, spectrum.flux)
+                np.testing.assert_array_equal(cont.wavelength, continuum.wavelength)
+                del spec, cont
+        assert batch[0].spectrum is not None
+        with pytest.raises(FileNotFoundError):
+            SharedMemory(batch[0].spectrum.name)
+
+
+def test_run_job_share_fails(tmp_path: Path) -> None:
+    """A job whose outputs can't be shared is done, and leaks no blocks."""
+    script = "trap 'echo garbage > fort.17' EXIT"
+    synspec = fake_synspec(tmp_path, script, "reference")
+    job = Job("hhe35lt", links={"data": "data"}, workdir=str(tmp_path), synspec=synspec)
+    before = set(Path("/dev/shm").iterdir())
+    result = run_job(job, share=True)
+    assert result.status == "done" and result.error is None
+    assert result.share_error is not None
+    assert result.spectrum is None and result.continuum is None
+    assert set(Path("/dev/shm").iterdir()) == before
@@ -1,9 +1,14 @@
+import itertools
 import os
 import shutil
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
+import numpy as np
 import pytest
 
+from synspec import units
 from synspec.synspec import Synspec
 
 PROJECT_ROOT = os.getcwd()
@@ -13,7 +18,8 @@ MODELS_ROOT = f"{PROJECT_ROOT}/tests/models"
 def compare_files(file1: str, file2: str) -> bool:
     with open(file1, "r") as f1:
         with open(file2, "r") as f2:
-            for line1, line2 in zip(f1, f2):
+            # zip_longest, so a truncated file doesn't compare equal.
+            for line1, line2 in itertools.zip_longest(f1, f2):
                 if line1 != line2:
                     return False
     return True
@@ -28,6 +34,36 @@ def copy_model(model: str, files: list[str], dst: str) -> str:
     return modeldir
 
 
+def fake_synspec(
+    dst: str | Path,
+    script: str = "",
+    outputs: str | None = "empty",
+    model: str = "hhe35lt",
+) -> str:
+    """Copies the inputs of the model to dst (see copy_model) and writes a
+    stand-in synspec executable there. Returns the path of the executable.
+
+    script: shell commands the executable runs first, in the run directory.
+    outputs: what it then writes to the output units: "empty" files, the
+             "reference" outputs of the model, or nothing (None).
+    """
+    files = ["fort.19", "fort.55", "{model}.5", "{model}.7"]
+    if Path(MODELS_ROOT, model, "input", "fort.56").exists():
+        files.append("fort.56")
+    copy_model(model, files, str(dst))
+    lines = ["#!/bin/sh", script]
+    if outputs == "empty":
+        lines.append("touch fort.7 fort.12 fort.16 fort.17")
+    elif outputs == "reference":
+        output = f"{MODELS_ROOT}/{model}/output/{model}"
+        exts = [("7", "spec"), ("12", "iden"), ("16", "eqws"), ("17", "cont")]
+        lines += [f"cp {output}.{ext} fort.{unit}" for unit, ext in exts]
+    executable = Path(dst, "synspec")
+    executable.write_text("\n".join(lines) + "\n")
+    executable.chmod(0o755)
+    return str(executable)
+
+
 @pytest.fixture(scope="function")
 def tempdir():
     try:
@@ -372,3 +408,176 @@ def test_addlink_relpath(tempdir: str) -> None:
     synspec.run(model, rundir=rundir)
 
     compare_files(f"{modeldir}/output/{model}.spec", f"{rundir}/{model}.spec")
+
+
+@pytest.mark.parametrize("stage", [True, "{tempdir}/shm"])
+def test_synspec_staged(tempdir: str, stage: bool | str) -> None:
+    model = "hhe35lt"
+    files = ["fort.19", "fort.55", "{model}.5", "{model}.7"]
+
+    modeldir = copy_model(model, files, tempdir)
+
+    os.chdir(tempdir)
+    if isinstance(stage, str):
+        stage = stage.format(tempdir=tempdir)
+        os.mkdir(stage)
+
+    # Create a Synspec object.
+    synspec = Synspec("synspec", 51)
+    synspec.add_link("data")
+    synspec.run(model, rundir=None, stage=stage)
+
+    assert compare_files(f"{modeldir}/output/{model}.spec", f"{tempdir}/{model}.spec")
+
+
+def test_staged_inputs_copied(tempdir: str) -> None:
+    """Staged run directories get copies of the inputs instead of links."""
+    model = "hhe35lt"
+    files = ["fort.19", "fort.55", "{model}.5", "{model}.7"]
+
+    copy_model(model, files, tempdir)
+
+    os.chdir(tempdir)
+    rundir = Path(tempdir) / "shm"
+    rundir.mkdir()
+
+    synspec = Synspec("synspec", 51)
+    synspec.add_link("data")
+    synspec._copy_to_rundir(synspec.plan(model), rundir, copy=True)
+
+    for file in ["fort.19", f"{model}.7", "data", "data/he1.dat"]:
+        assert (rundir / file).exists()
+        assert not (rundir / file).is_symlink()
+
+
+def test_staged_short_of_space(tempdir: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Inputs are linked when the staging directory is short of space."""
+    model = "hhe35lt"
+    files = ["fort.19", "fort.55", "{model}.5", "{model}.7"]
+
+    copy_model(model, files, tempdir)
+
+    os.chdir(tempdir)
+    rundir = Path(tempdir) / "shm"
+    rundir.mkdir()
+    monkeypatch.setattr(
+        shutil, "disk_usage", lambda path: shutil._ntuple_diskusage(1, 1, 0)
+    )
+
+    synspec = Synspec("synspec", 51)
+    with pytest.warns(RuntimeWarning):
+        synspec._copy_to_rundir(synspec.plan(model), rundir, copy=True)
+
+    assert (rundir / "fort.19").is_symlink()
+
+
+def test_staging_dir_missing(tempdir: str) -> None:
+    model = "hhe35lt"
+    files = ["fort.19", "fort.55", "{model}.5", "{model}.7"]
+
+    modeldir = copy_model(model, files, tempdir)
+
+    os.chdir(tempdir)
+
+    synspec = Synspec("synspec", 51)
+    synspec.add_link("data")
+    with pytest.warns(RuntimeWarning):
+        synspec.run(model, rundir=None, stage=f"{tempdir}/missing")
+
+    assert compare_files(f"{modeldir}/output/{model}.spec", f"{tempdir}/{model}.spec")
+
+
+def test_stage_requires_tempdir(tempdir: str) -> None:
+    synspec = Synspec("synspec", 51)
+    with pytest.raises(ValueError):
+        synspec.run("hhe35lt", stage=True)
+
+
+def test_synspec_basedir(tempdir: str) -> None:
+    """Relative paths are resolved against basedir, not the current directory."""
+    model = "hhe35lt"
+    files = ["fort.19", "fort.55", "{model}.5", "{model}.7"]
+
+    modeldir = copy_model(model, files, tempdir)
+
+    synspec = Synspec("synspec", 51)
+    synspec.add_link("data")
+    synspec.run(model, rundir=None, outdir="out", basedir=tempdir)
+
+    assert Path.cwd() == Path(PROJECT_ROOT)
+    assert compare_files(
+        f"{modeldir}/output/{model}.spec", f"{tempdir}/out/{model}.spec"
+    )
+
+
+def test_plan_leaves_synspec_unchanged(tempdir: str) -> None:
+    """Links detected for a run are part of its plan only."""
+    model = "EHeT30g4"
+    files = ["fort.19", "fort.55", "fort.56", "nst_l", "{model}.5", "{model}.7"]
+
+    copy_model(model, files, tempdir)
+
+    synspec = Synspec("synspec", 51)
+    linkfiles = dict(synspec.linkfiles)
+    plan = synspec.plan(model, tempdir)
+
+    assert synspec.linkfiles == linkfiles
+    assert plan.links["fort.56"] == Path(tempdir).resolve() / "fort.56"
+    assert plan.links[f"{model}.5"] == Path(tempdir).resolve() / f"{model}.5"
+    assert {"data", "nst_l"} <= plan.cacheable
+
+
+def test_synspec_shared_between_threads(tempdir: str) -> None:
+    """One Synspec object can run models in several threads at once."""
+    model = "hhe35lt"
+    files = ["fort.19", "fort.55", "{model}.5", "{model}.7"]
+
+    basedirs = []
+    for i in range(4):
+        basedir = Path(tempdir) / f"model{i}"
+        basedir.mkdir()
+        modeldir = copy_model(model, files, str(basedir))
+        basedirs.append(basedir)
+
+    synspec = Synspec("synspec", 51)
+    synspec.add_link("data")
+    linkfiles = dict(synspec.linkfiles)
+    with ThreadPoolExecutor(4) as pool:
+        futures = [
+            pool.submit(
+                synspec.run, model, rundir=None, outfile=f"run{i}", basedir=basedir
+            )
+            for i, basedir in enumerate(basedirs)
+        ]
+        for future in futures:
+            future.result()
+
+    assert synspec.linkfiles == linkfiles
+    for i, basedir in enumerate(basedirs):
+        assert compare_files(
+            f"{modeldir}/output/{model}.spec", f"{basedir}/run{i}.spec"
+        )
+
+
+@pytest.mark.parametrize("output_format", ["gzip", "float64"])
+def test_synspec_output_format(tempdir: str, output_format: str) -> None:
+    model = "hhe35lt"
+    files = ["fort.19", "fort.55", "{model}.5", "{model}.7"]
+
+    modeldir = copy_model(model, files, tempdir)
+
+    synspec = Synspec("synspec", 51, output_format=output_format)
+    synspec.add_link("data")
+    synspec.run(model, rundir=None, basedir=tempdir)
+
+    suffix = units.OUTPUT_FORMATS[output_format]
+    assert Path(f"{tempdir}/{model}.spec{suffix}").exists()
+    assert not Path(f"{tempdir}/{model}.spec").exists()
+    expected = units.read7f(f"{modeldir}/output/{model}.spec")
+    stored = units.read7f(f"{tempdir}/{model}.spec")
+    assert np.array_equal(stored.flux, expected.flux)
+
+
+def test_synspec_unknown_output_format() -> None:
+    with pytest.raises(ValueError):
+        Synspec("synspec", 51, output_format="zip")
@@ -1,6 +1,7 @@
 import tempfile
 from pathlib import Path
 
+import numpy as np
 import pytest
 
 from synspec import units
@@ -232,3 +233,192 @@ def test_readinput():
             },
         ],
     }
+
+
+def test_read19() -> None:
+    lines = units.read19f(Path("tests/models/EHeT30g4/input/fort.19"))
+    assert len(lines) == 10
+    assert lines[0] == units.Line(
+        395.4362, 8.01, -0.396, 188888.543, 0.5, 214169.920, 0.5, 9.46, -5.55, 0.0, 0
+    )
+    assert lines[0].iatom == 8
+    assert lines[0].wavelength == pytest.approx(3954.362)
+
+
+def test_write19() -> None:
+    text = Path("tests/models/EHeT30g4/input/fort.19").read_text()
+    assert units.write19(units.read19(text)) == text
+
+
+def test_read7() -> None:
+    spectrum = units.read7("  3953.34285    1.12570E+08\n  3953.35156    1.12567E+08\n")
+    assert list(spectrum.wavelength) == [3953.34285, 3953.35156]
+    assert list(spectrum.flux) == [1.12570e08, 1.12567e08]
+
+
+def test_write7() -> None:
+    text = Path("tests/models/hhe35lt/output/hhe35lt.spec").read_text()
+    assert (
+        units.write7(units.read7f("tests/models/hhe35lt/output/hhe35lt.spec")) == text
+    )
+
+
+# units.SpecFile
+
+
+@pytest.mark.parametrize("w0, w1", [(4470.0, 4471.0), (0.0, 4465.01), (4474.99, 1e5)])
+def test_specfile_window(w0: float, w1: float) -> None:
+    file = "tests/models/hhe35lt/output/hhe35lt.spec"
+    full = units.read7f(file)
+    mask = (full.wavelength >= w0) & (full.wavelength <= w1)
+    window = units.read7window(file, w0, w1)
+    assert window.wavelength.size == mask.sum() > 0
+    np.testing.assert_array_equal(window.wavelength, full.wavelength[mask])
+    np.testing.assert_array_equal(window.flux, full.flux[mask])
+
+
+def test_specfile_outside() -> None:
+    with units.SpecFile("tests/models/EHeT30g4/output/EHeT30g4.spec") as spec:
+        assert spec.rowlen == 28
+        assert spec.window(1000.0, 2000.0).wavelength.size == 0
+        assert spec.window(4000.0, 3000.0).wavelength.size == 0
+
+
+def test_specfile_empty(tmp_path: Path) -> None:
+    (tmp_path / "empty.spec").touch()
+    with units.SpecFile(tmp_path / "empty.spec") as spec:
+        assert len(spec) == 0
+        assert spec.window(0.0, 1e5).wavelength.size == 0
+
+
+def test_specfile_not_fixed_width(tmp_path: Path) -> None:
+    (tmp_path / "fort.7").write_text("  4465.0 1.0E+08\n  4465.01 1.0E+08\n")
+    with pytest.raises(ValueError):
+        units.SpecFile(tmp_path / "fort.7")
+
+
+def test_specfile_large(tmp_path: Path) -> None:
+    wavelength = np.linspace(3000.0, 7000.0, 400_001)
+    spectrum = units.Spectrum(wavelength, np.full_like(wavelength, 1.5e8))
+    units.write7f(tmp_path / "large.spec", spectrum)
+    with units.SpecFile(tmp_path / "large.spec") as spec:
+        assert len(spec) == wavelength.size
+        window = spec.window(4000.0, 4020.0)
+    np.testing.assert_allclose(window.wavelength, wavelength[100_000:102_001])
+
+
+# Compressed and packed units
+
+
+@pytest.mark.parametrize("format", ["gzip", "xz", "bz2", "float64"])
+def test_storeunit(tmp_path: Path, format: str) -> None:
+    src = "tests/models/hhe35lt/output/hhe35lt.spec"
+    file = units.storeunit(src, tmp_path / "hhe35lt.spec", format)
+    assert file.name == "hhe35lt.spec" + units.OUTPUT_FORMATS[format]
+    assert file.stat().st_size < Path(src).stat().st_size
+
+    full = units.read7f(src)
+    stored = units.read7f(tmp_path / "hhe35lt.spec")
+    np.testing.assert_array_equal(stored.wavelength, full.wavelength)
+    np.testing.assert_array_equal(stored.flux, full.flux)
+
+    mask = (full.wavelength >= 4470.0) & (full.wavelength <= 4471.0)
+    with units.SpecFile(tmp_path / "hhe35lt.spec") as spec:
+        assert len(spec) == full.wavelength.size
+        window = spec.window(4470.0, 4471.0)
+    np.testing.assert_array_equal(window.wavelength, full.wavelength[mask])
+
+
+def test_storeunit_float32(tmp_path: Path) -> None:
+    src = "tests/models/hhe35lt/output/hhe35lt.spec"
+    units.storeunit(src, tmp_path / "hhe35lt.spec", "float32")
+    full = units.read7f(src)
+    stored = units.read7f(tmp_path / "hhe35lt.spec")
+    np.testing.assert_allclose(stored.wavelength, full.wavelength, rtol=1e-7)
+    np.testing.assert_allclose(stored.flux, full.flux, rtol=1e-7)
+
+
+def test_storeunit_text_units(tmp_path: Path) -> None:
+    """Packed formats store units other than 7 and 17 as they are."""
+    src = "tests/models/hhe35lt/output/hhe35lt.iden"
+    file = units.storeunit(src, tmp_path / "hhe35lt.iden", "float32")
+    assert file == tmp_path / "hhe35lt.iden"
+    file = units.storeunit(src, tmp_path / "hhe35lt.iden", "xz")
+    with units.openunit(tmp_path / "hhe35lt.iden") as f:
+        assert f.read() == Path(src).read_text()
+
+
+def test_storeunit_removes_stale(tmp_path: Path) -> None:
+    src = "tests/models/hhe35lt/output/hhe35lt.spec"
+    units.storeunit(src, tmp_path / "hhe35lt.spec")
+    units.storeunit(src, tmp_path / "hhe35lt.spec", "gzip")
+    assert [f.name for f in tmp_path.iterdir()] == ["hhe35lt.spec.gz"]
+    units.storeunit(src, tmp_path / "hhe35lt.spec")
+    assert [f.name for f in tmp_path.iterdir()] == ["hhe35lt.spec"]
+
+
+@pytest.mark.parametrize("stored", ["gzip", "float64"])
+def test_storeunit_stored_source(tmp_path: Path, stored: str) -> None:
+    src = units.storeunit(
+        "tests/models/hhe35lt/output/hhe35lt.spec", tmp_path / "src.spec", stored
+    )
+    file = units.storeunit(tmp_path / "src.spec", tmp_path / "hhe35lt.spec", "xz")
+    assert file.name == "hhe35lt.spec.xz"
+    np.testing.assert_array_equal(units.read7f(file).flux, units.read7f(src).flux)
+
+
+def test_unitfile_missing(tmp_path: Path) -> None:
+    with pytest.raises(FileNotFoundError):
+        units.unitfile(tmp_path / "missing.spec")
+
+
+# Unit 8 and the input file
+
+
+@pytest.mark.parametrize("model", ["hhe35lt", "EHeT30g4"])
+def test_read8_write8(model: str) -> None:
+    text = Path(f"tests/models/{model}/input/{model}.7").read_text()
+    atmosphere = units.read8(text)
+    assert atmosphere.structure.shape == (atmosphere.nd, atmosphere.numpar)
+    assert np.all(atmosphere.temperature > 1e4)
+    assert units.write8(atmosphere) == text
+
+
+def test_read8_truncated() -> None:
+    text = Path("tests/models/hhe35lt/input/hhe35lt.7").read_text()
+    with pytest.raises(ValueError):
+        units.read8(text[: len(text) // 2])
+
+
+def test_write5header() -> None:
+    text = Path("tests/models/hhe35lt/input/hhe35lt.5").read_text()
+    new = units.write5header(text, 37250.0, 4.25)
+    assert new.splitlines()[0] == " 37250.0 4.25      ! TEFF, GRAV"
+    assert new.splitlines()[1:] == text.splitlines()[1:]
+    modelinput = units.readinput(new)
+    assert (modelinput["teff"], modelinput["grav"]) == (37250.0, 4.25)
+
+
+def test_write5abundances() -> None:
+    text = Path("tests/models/hhe35lt/input/hhe35lt.5").read_text()
+    new = units.write5abundances(text, {6: 3e-4, 8: 1.5})
+    assert [atom["abd"] for atom in units.readinput(new)["atoms"]] == [
+        0,
+        0,
+        0,
+        0,
+        0,
+        3e-4,
+        0,
+        1.5,
+    ]
+    assert len(new.splitlines()) == len(text.splitlines())
+    with pytest.raises(ValueError):
+        units.write5abundances(text, {9: 1.0})
+
+
+def test_read12() -> None:
+    iden = units.read12f("tests/models/EHeT30g4/output/EHeT30g4.iden")
+    assert len(iden) == 7
+    assert iden[0] == units.IdenLine(3954.362, 8.01, -0.40, 188888.540, 22.7, 502.3)
+    assert [line.anum for line in iden] == [8.01, 7.01, 6.02, 6.02, 7.01, 7.02, 7.02]
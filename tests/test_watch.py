@@ -0,0 +1,132 @@
+import os
+import socket
+import threading
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from synspec import units, watch
+from synspec.synspec import RunPlan, Synspec
+from synspec.watch import Publisher, Update, Watcher
+from tests.test_synspec import MODELS_ROOT, fake_synspec
+
+SPEC = Path(MODELS_ROOT, "hhe35lt", "output", "hhe35lt.spec").resolve()
+CONT = Path(MODELS_ROOT, "hhe35lt", "output", "hhe35lt.cont").resolve()
+
+
+def runs(tmp_path: Path) -> int:
+    return len((tmp_path / "runs.log").read_text().split())
+
+
+def edit(path: Path, old: str, new: str) -> None:
+    """Replaces text in a file and moves its modification time on, so that
+    the edit is noticed however coarse the clock.
+    """
+    st = path.stat()
+    path.write_text(path.read_text().replace(old, new, 1))
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_watcher(tmp_path: Path) -> None:
+    script = f"echo run >> {tmp_path}/runs.log"
+    synspec = Synspec(fake_synspec(tmp_path, script, "reference"))
+    updates: list[Update] = []
+    model = tmp_path / "hhe35lt.5"
+    with Watcher(synspec, "hhe35lt", basedir=tmp_path, callback=updates.append) as w:
+        first = w.poll()
+        assert first is not None and first.error is None and first.run == 1
+        assert first.spectrum is not None and first.continuum is not None
+        expected = units.read7f(SPEC)
+        np.testing.assert_array_equal(first.spectrum.flux, expected.flux)
+        assert w.poll() is None
+
+        # Reformatting the input file doesn't change it.
+        edit(model, " 35000. 4.0", "  35000.0   4.00 ")
+        assert w.poll() is None
+        assert runs(tmp_path) == 1
+
+        edit(model, "35000.0", "35100.0")
+        second = w.poll()
+        assert second is not None and second.run == 2 and second.error is None
+        assert runs(tmp_path) == 2
+
+        # Broken inputs are reported, and picked up again once fixed.
+        text = model.read_text()
+        edit(model, text, "35000.\n")
+        broken = w.poll()
+        assert broken is not None and broken.spectrum is None and broken.error
+        assert w.poll() is None
+        edit(model, "35000.\n", text)
+        assert w.poll() is not None
+        assert runs(tmp_path) == 3
+    assert updates == [first, second, broken, updates[3]]
+
+
+def test_watcher_restages(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    script = f"echo run >> {tmp_path}/runs.log"
+    synspec = Synspec(fake_synspec(tmp_path, script, "reference"))
+    staged: list[set[str]] = []
+    original = synspec.stage_inputs
+
+    def record(plan: RunPlan, rundir: str | Path, copy: bool = False) -> None:
+        staged.append(set(plan.links))
+        original(plan, rundir, copy)
+
+    monkeypatch.setattr(synspec, "stage_inputs", record)
+    with Watcher(synspec, "hhe35lt", basedir=tmp_path, stage=tmp_path) as w:
+        assert w.poll() is not None
+        assert staged[0] == {"fort.19", "fort.55", "hhe35lt.5", "hhe35lt.7", "data"}
+        edit(tmp_path / "fort.19", " ", "  ")
+        assert w.poll() is not None
+        assert staged[1] == {"fort.19"}
+        # Staged as copies, which don't see later edits.
+        assert w.rundir is not None and not (w.rundir / "fort.19").is_symlink()
+
+
+def test_publisher(tmp_path: Path) -> None:
+    spectrum = units.read7f(SPEC)
+    with Publisher(tmp_path / "watch.sock") as publisher:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(str(tmp_path / "watch.sock"))
+        dropped = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        dropped.connect(str(tmp_path / "watch.sock"))
+        dropped.close()
+        while publisher.clients < 2:
+            threading.Event().wait(0.01)
+        with client, client.makefile("rb") as f:
+            publisher.publish(Update(1, spectrum, spectrum, 0.5))
+            publisher.publish(Update(2, None, None, 0.1, "ValueError: bad"))
+            first = watch.receive(f)
+            assert first is not None and first.spectrum is not None
+            np.testing.assert_array_equal(
+                first.spectrum.wavelength, spectrum.wavelength
+            )
+            assert (first.run, first.wall, first.error) == (1, 0.5, None)
+            assert watch.receive(f) == Update(2, None, None, 0.1, "ValueError: bad")
+        # Writing to the closed clients fails; they are dropped.
+        for _ in range(3):
+            publisher.publish(Update(3, spectrum, spectrum, 0.5))
+        assert publisher.clients == 0
+    assert not (tmp_path / "watch.sock").exists()
+
+
+def test_watcher_publishes(tmp_path: Path) -> None:
+    script = f"echo run >> {tmp_path}/runs.log"
+    synspec = Synspec(fake_synspec(tmp_path, script, "reference"))
+    address = tmp_path / "watch.sock"
+    stop = threading.Event()
+    with Watcher(synspec, "hhe35lt", basedir=tmp_path, address=address) as w:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(str(address))
+        while w._publisher is None or w._publisher.clients < 1:
+            threading.Event().wait(0.01)
+        thread = threading.Thread(target=w.serve, args=(stop,))
+        thread.start()
+        try:
+            with client, client.makefile("rb") as f:
+                update = watch.receive(f)
+        finally:
+            stop.set()
+            thread.join()
+    assert update is not None and update.run == 1 and update.spectrum is not None
@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from synspec.batch import Job, JobResult
+from synspec.workqueue import WorkQueue, work
+from tests.test_synspec import compare_files, copy_model
+
+QUEUE_JOBS = 8
+
+
+def claim_all(path: str, worker: str) -> list[str]:
+    queue = WorkQueue(path)
+    names = []
+    while (lease := queue.claim(worker)) is not None:
+        names.append(lease.name)
+    return names
+
+
+def test_submit_and_claim(tmp_path: Path) -> None:
+    queue = WorkQueue(tmp_path)
+    names = queue.submit(Job(f"model{i}", workdir=str(tmp_path)) for i in range(3))
+    assert names == ["model0", "model1", "model2"]
+    assert queue.counts() == {"pending": 3, "leased": 0, "done": 0, "failed": 0}
+
+    lease = queue.claim("w1")
+    assert lease is not None
+    assert lease.job.model == "model0"
+    assert lease.job.outdir == f"{queue.path}/output"
+    assert queue.state("model0") == "leased"
+
+    assert queue.complete(lease, JobResult("model0", "done", str(tmp_path), 1.0))
+    assert queue.state("model0") == "done"
+    assert [r.name for r in queue.results()] == ["model0"]
+
+
+def test_submit_duplicate(tmp_path: Path) -> None:
+    queue = WorkQueue(tmp_path)
+    queue.submit([Job("model", workdir=str(tmp_path))])
+    with pytest.raises(ValueError):
+        queue.submit([Job("model", workdir=str(tmp_path))])
+
+
+def test_claim_exclusive(tmp_path: Path) -> None:
+    """Workers in several processes never claim the same job twice."""
+    queue = WorkQueue(tmp_path)
+    queue.submit(Job(f"model{i}", workdir=str(tmp_path)) for i in range(100))
+    with multiprocessing.Pool(4) as pool:
+        claimed = pool.starmap(claim_all, [(str(tmp_path), f"w{i}") for i in range(4)])
+    names = [name for names in claimed for name in names]
+    assert sorted(names) == sorted(f"model{i}" for i in range(100))
+
+
+def test_reclaim_expired(tmp_path: Path) -> None:
+    queue = WorkQueue(tmp_path, lease=10.0)
+    queue.submit([Job("model", workdir=str(tmp_path))])
+    lease = queue.claim("crashed")
+    assert lease is not None
+    assert queue.reclaim() == []
+
+    past = time.time() - 20
+    os.utime(lease.path, (past, past))
+    assert queue.reclaim() == ["model"]
+    assert queue.state("model") == "pending"
+    assert not queue.heartbeat(lease)
+    assert not queue.complete(lease, JobResult("model", "done", str(tmp_path), 1.0))
+
+    lease = queue.claim("w2")
+    assert lease is not None and lease.worker == "w2"
+
+
+def test_workers(tmp_path: Path) -> None:
+    """Several worker processes run a grid from one queue."""
+    model = "hhe35lt"
+    files = ["fort.19", "fort.55", "{model}.5", "{model}.7"]
+    modeldir = copy_model(model, files, str(tmp_path))
+
+    queue = WorkQueue(tmp_path / "queue")
+    queue.submit(
+        Job(model, outfile=f"{model}_{i}", workdir=str(tmp_path))
+        for i in range(QUEUE_JOBS)
+    )
+    workers = [
+        multiprocessing.Process(target=work, args=(queue.path,), kwargs={"poll": 0.1})
+        for _ in range(3)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert queue.counts()["done"] == QUEUE_JOBS
+    for i in range(QUEUE_JOBS):
+        assert compare_files(
+            f"{modeldir}/output/{model}.spec", f"{queue.path}/output/{model}_{i}.spec"
+        )
+
+
+def test_reschedule_resource(tmp_path: Path) -> None:
+    """Jobs exceeding their resource limits are retried up to max_attempts."""
+    queue = WorkQueue(tmp_path, max_attempts=2)
+    queue.submit([Job("model", workdir=str(tmp_path))])
+    result = JobResult("model", "resource", str(tmp_path), 1.0, "CPULimitExceeded")
+
+    lease = queue.claim("w1")
+    assert lease is not None and lease.attempts == 0
+    assert queue.complete(lease, result)
+    assert queue.state("model") == "pending"
+
+    lease = queue.claim("w2")
+    assert lease is not None and lease.attempts == 1
+    assert queue.complete(lease, result)
+    assert queue.state("model") == "failed"